@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.schemas.company import RetrievalProfile
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres, по которому процессы сообщают об изменении компании (payload — platform_company_id)
+NOTIFY_CHANNEL = "company_cache"
+
+_NOTIFY = text("SELECT pg_notify(:channel, :payload)")
+
+
+@dataclass(frozen=True)
+class CachedCompany:
+    """Снимок записи companies. В кэше хранится не ORM-объект: он привязан
+    к сессии, в которой был загружен, а снимок можно отдавать любому запросу."""
+    id: int
+    platform_company_id: int
+    openai_vector_store_id: Optional[str]
+    profile: RetrievalProfile = field(default_factory=RetrievalProfile)
+
+    @classmethod
+    def from_model(cls, company: Any) -> "CachedCompany":
+        return cls(
+            id=company.id,
+            platform_company_id=company.platform_company_id,
+            openai_vector_store_id=company.openai_vector_store_id,
+            profile=RetrievalProfile.model_construct(**{name: getattr(company, name) for name in RetrievalProfile.model_fields})
+        )
+
+
+class CompanyCache:
+    """LRU-кэш компаний процесса с временем жизни записи COMPANY_CACHE_TTL.
+    Отсутствующие компании не кэшируются: первая загрузка файла создает компанию,
+    и она сразу должна быть видна запросам."""
+
+    def __init__(self):
+        self._entries: "OrderedDict[int, Tuple[float, CachedCompany]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.COMPANY_CACHE_TTL > 0 and settings.COMPANY_CACHE_MAX_ENTRIES > 0
+
+    def get(self, platform_company_id: int) -> Optional[CachedCompany]:
+        entry = self._entries.get(platform_company_id)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[platform_company_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(platform_company_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, company: CachedCompany) -> None:
+        if not self.enabled:
+            return
+        self._entries[company.platform_company_id] = (time.monotonic() + settings.COMPANY_CACHE_TTL, company)
+        self._entries.move_to_end(company.platform_company_id)
+        while len(self._entries) > settings.COMPANY_CACHE_MAX_ENTRIES:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, platform_company_id: int) -> None:
+        self._entries.pop(platform_company_id, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "notify_listener": _listener_task is not None,
+        }
+
+
+cache = CompanyCache()
+
+_listener_task: Optional[asyncio.Task] = None
+# True, пока соединение с LISTEN открыто и уведомления доходят до процесса
+_listening = False
+# Обработчики уведомлений других кэшей, связанных с компанией (None — сбросить все)
+_callbacks: List[Callable[[Optional[int]], None]] = []
+
+
+def on_invalidate(callback: Callable[[Optional[int]], None]) -> None:
+    """Подписывает callback на уведомления канала company_cache: вызывается
+    с platform_company_id или с None, если уведомления могли быть потеряны."""
+    _callbacks.append(callback)
+
+
+def listening() -> bool:
+    """True, если процесс сейчас получает уведомления об изменениях компаний."""
+    return _listening
+
+
+def _invalidate(platform_company_id: Optional[int]) -> None:
+    if platform_company_id is None:
+        cache.clear()
+    else:
+        cache.invalidate(platform_company_id)
+    for callback in _callbacks:
+        callback(platform_company_id)
+
+
+def notify(db: Session, *, platform_company_id: int) -> None:
+    """Ставит NOTIFY для остальных процессов (при COMPANY_CACHE_NOTIFY). Вызывается
+    до commit: уведомление уходит вместе с транзакцией. Запись этого процесса
+    сбрасывается после commit (cache.invalidate), иначе параллельный запрос
+    может успеть закэшировать старую версию."""
+    if settings.COMPANY_CACHE_NOTIFY:
+        db.execute(_NOTIFY, {"channel": NOTIFY_CHANNEL, "payload": str(platform_company_id)})
+
+
+async def notify_async(db: AsyncSession, *, platform_company_id: int) -> None:
+    """Асинхронный вариант notify."""
+    if settings.COMPANY_CACHE_NOTIFY:
+        await db.execute(_NOTIFY, {"channel": NOTIFY_CHANNEL, "payload": str(platform_company_id)})
+
+
+def _on_notification(connection, pid, channel, payload) -> None:
+    try:
+        _invalidate(int(payload))
+    except ValueError:
+        logger.warning(f"Некорректное уведомление {channel}: {payload!r}")
+
+
+async def _listen_loop() -> None:
+    """Держит отдельное соединение с LISTEN company_cache. После переподключения
+    кэш очищается: уведомления, пришедшие без соединения, потеряны."""
+    global _listening
+    while True:
+        try:
+            async with async_engine.connect() as connection:
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.add_listener(NOTIFY_CHANNEL, _on_notification)
+                _invalidate(None)
+                _listening = True
+                logger.info(f"Кэш компаний подписан на канал {NOTIFY_CHANNEL}.")
+                try:
+                    while not raw.driver_connection.is_closed():
+                        await asyncio.sleep(5)
+                finally:
+                    _listening = False
+                    if not raw.driver_connection.is_closed():
+                        await raw.driver_connection.remove_listener(NOTIFY_CHANNEL, _on_notification)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка подписки кэша компаний на {NOTIFY_CHANNEL}: {e}")
+        _invalidate(None)
+        await asyncio.sleep(5)
+
+
+def start_listener() -> None:
+    """Запускает подписку на изменения компаний в других процессах (COMPANY_CACHE_NOTIFY)."""
+    global _listener_task
+    if _listener_task is None and settings.COMPANY_CACHE_NOTIFY and cache.enabled:
+        _listener_task = asyncio.create_task(_listen_loop())
+
+
+async def stop_listener() -> None:
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        await asyncio.gather(_listener_task, return_exceptions=True)
+        _listener_task = None
@@ -29,9 +29,126 @@ class Settings(BaseSettings):
     DB_PORT: int = int(os.getenv("DB_PORT", "5432"))
     DB_NAME: str = os.getenv("DB_NAME", "")
 
+    # Пул соединений асинхронного движка (asyncpg)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+
+    # Массовая вставка чанков: начиная с этого числа строк используется бинарный COPY
+    CHUNK_COPY_THRESHOLD: int = int(os.getenv("CHUNK_COPY_THRESHOLD", "200"))
+
+    # Секционирование chunks по компаниям
+    CHUNKS_PARTITIONING_AUTO_MIGRATE: bool = os.getenv("CHUNKS_PARTITIONING_AUTO_MIGRATE", "true").lower() in ("1", "true", "yes")
+    CHUNKS_PARTITION_STRATEGY: str = os.getenv("CHUNKS_PARTITION_STRATEGY", "list") # list (секция на компанию) | hash
+    CHUNKS_HASH_PARTITIONS: int = int(os.getenv("CHUNKS_HASH_PARTITIONS", "16"))
+    CHUNKS_PARTITION_LOCK_TIMEOUT: float = float(os.getenv("CHUNKS_PARTITION_LOCK_TIMEOUT", "2")) # Секунды ожидания блокировок при создании секции
+
+    # ANN индекс по chunks.embedding (pgvector)
+    VECTOR_INDEX_TYPE: str = os.getenv("VECTOR_INDEX_TYPE", "hnsw") # hnsw | ivfflat | none
+    VECTOR_INDEX_AUTO_CREATE: bool = os.getenv("VECTOR_INDEX_AUTO_CREATE", "true").lower() in ("1", "true", "yes")
+    VECTOR_INDEX_MAINTENANCE_WORK_MEM: str = os.getenv("VECTOR_INDEX_MAINTENANCE_WORK_MEM", "") # Например "2GB" для ускорения построения
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCTION: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+    HNSW_EF_SEARCH: int = int(os.getenv("HNSW_EF_SEARCH", "40")) # Больше — выше recall, медленнее поиск
+    IVFFLAT_LISTS: int = int(os.getenv("IVFFLAT_LISTS", "100"))
+    IVFFLAT_PROBES: int = int(os.getenv("IVFFLAT_PROBES", "10")) # Больше — выше recall, медленнее поиск
+    VECTOR_ITERATIVE_SCAN: str = os.getenv("VECTOR_ITERATIVE_SCAN", "relaxed_order") # off | relaxed_order | strict_order (применяется только при pgvector >= 0.8)
+
+    # Хранение эмбеддингов и двухэтапный поиск
+    EMBEDDING_DIMENSIONS: int = int(os.getenv("EMBEDDING_DIMENSIONS", "1536")) # Параметр dimensions моделей text-embedding-3
+    EMBEDDING_STORAGE: str = os.getenv("EMBEDDING_STORAGE", "vector") # vector (float4) | halfvec (float2, вдвое меньше)
+    # > 0: ANN индекс строится по первым N измерениям (halfvec), найденные кандидаты
+    # пересчитываются по полному вектору. 0 — индекс по полному вектору
+    VECTOR_SEARCH_DIMENSIONS: int = int(os.getenv("VECTOR_SEARCH_DIMENSIONS", "0"))
+    VECTOR_RESCORE_CANDIDATES: int = int(os.getenv("VECTOR_RESCORE_CANDIDATES", "100")) # Кандидатов для пересчета по полному вектору
+    # Бинарное квантование: дополнительный HNSW индекс по binary_quantize(embedding) (bit, 1 бит на измерение)
+    VECTOR_BINARY_INDEX: bool = os.getenv("VECTOR_BINARY_INDEX", "false").lower() in ("1", "true", "yes")
+    VECTOR_BINARY_OVERSAMPLE: int = int(os.getenv("VECTOR_BINARY_OVERSAMPLE", "4")) # Кандидатов на один результат для точного пересчета
+    VECTOR_SEARCH_STRATEGY: str = os.getenv("VECTOR_SEARCH_STRATEGY", "ann") # ann | binary | exact
+
+    # Индекс в памяти (mmap) для компаний с частыми запросами
+    MEMORY_INDEX_COMPANIES: str = os.getenv("MEMORY_INDEX_COMPANIES", "") # platform_company_id через запятую, пусто — выключен
+    MEMORY_INDEX_DIR: str = os.getenv("MEMORY_INDEX_DIR", "/tmp/platform-memory-index") # Общий для всех воркеров каталог файлов индекса
+    MEMORY_INDEX_REFRESH_INTERVAL: float = float(os.getenv("MEMORY_INDEX_REFRESH_INTERVAL", "60")) # Секунды между дозаписью новых чанков
+    MEMORY_INDEX_MAX_ROWS: int = int(os.getenv("MEMORY_INDEX_MAX_ROWS", "500000")) # Максимум чанков в индексе компании
+    MEMORY_INDEX_RESCAN_IDS: int = int(os.getenv("MEMORY_INDEX_RESCAN_IDS", "100000")) # ID до максимального, просматриваемых повторно (поздние commit)
+    MEMORY_INDEX_RECONCILE_INTERVAL: float = float(os.getenv("MEMORY_INDEX_RECONCILE_INTERVAL", "3600")) # Секунды между полными сверками ID
+
+    # Гибридный поиск (полнотекстовый + векторный)
+    FULLTEXT_CONFIG: str = os.getenv("FULLTEXT_CONFIG", "simple") # Конфигурация to_tsvector гибридного поиска (при смене GIN индекс перестраивается)
+    HYBRID_CANDIDATES: int = int(os.getenv("HYBRID_CANDIDATES", "40")) # Кандидатов от каждого вида поиска
+    HYBRID_RRF_K: int = int(os.getenv("HYBRID_RRF_K", "60")) # Константа reciprocal rank fusion: 1 / (k + ранг)
+
+    # Сборка контекста промпта /messagespg/query
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000")) # Максимум токенов контекста
+    CONTEXT_TOKENIZER_MODEL: str = os.getenv("CONTEXT_TOKENIZER_MODEL", "gpt-4o-mini") # Модель, токенизатором которой считаются токены
+
     # OpenAI settings
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     OPENAI_ASSISTANT_ID: str = os.getenv("OPENAI_ASSISTANT_ID", "")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "") # Пусто — api.openai.com; например http://localhost:8001/v1 для tests/openai_standin.py
+
+    # Пул HTTP-соединений клиента OpenAI (один клиент на процесс)
+    OPENAI_MAX_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    OPENAI_KEEPALIVE_EXPIRY: float = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30")) # Секунды
+    OPENAI_TIMEOUT: float = float(os.getenv("OPENAI_TIMEOUT", "60")) # Секунды
+    OPENAI_CONNECT_TIMEOUT: float = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10")) # Секунды
+    OPENAI_HTTP2: bool = os.getenv("OPENAI_HTTP2", "false").lower() in ("1", "true", "yes") # Требует пакет h2
+    OPENAI_MAX_RETRIES: int = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+    # Планировщик лимитов OpenAI (x-ratelimit-*): ожидание емкости, повторы 429/5xx, приоритет интерактивных запросов
+    OPENAI_RATE_LIMIT_ENABLED: bool = os.getenv("OPENAI_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes") # false — повторы средствами SDK (OPENAI_MAX_RETRIES)
+    OPENAI_DEFAULT_RPM: int = int(os.getenv("OPENAI_DEFAULT_RPM", "500")) # Лимиты до первого ответа с заголовками x-ratelimit-*
+    OPENAI_DEFAULT_TPM: int = int(os.getenv("OPENAI_DEFAULT_TPM", "200000"))
+    OPENAI_INTERACTIVE_RESERVE: float = float(os.getenv("OPENAI_INTERACTIVE_RESERVE", "0.2")) # Доля лимита, недоступная фоновым запросам
+    OPENAI_BACKGROUND_CONCURRENCY: int = int(os.getenv("OPENAI_BACKGROUND_CONCURRENCY", "16")) # Максимум одновременных фоновых запросов
+    OPENAI_COMPLETION_TOKENS_ESTIMATE: int = int(os.getenv("OPENAI_COMPLETION_TOKENS_ESTIMATE", "500")) # Ожидаемый размер ответа модели
+    OPENAI_RETRY_ATTEMPTS: int = int(os.getenv("OPENAI_RETRY_ATTEMPTS", "6"))
+    OPENAI_RETRY_BASE_DELAY: float = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5")) # Секунды
+    OPENAI_RETRY_MAX_DELAY: float = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30")) # Секунды
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes") # Одинаковые одновременные запросы (эмбеддинг, ответ, создание компании) — один вызов OpenAI
+
+    # Массовая загрузка файлов (POST /files/bulk/)
+    FILES_BULK_MAX_ITEMS: int = int(os.getenv("FILES_BULK_MAX_ITEMS", "10000")) # Документов в одном запросе
+    FILES_BULK_UPLOAD_CONCURRENCY: int = int(os.getenv("FILES_BULK_UPLOAD_CONCURRENCY", "16")) # Одновременных загрузок в OpenAI
+    VECTOR_STORE_FILE_BATCH_SIZE: int = int(os.getenv("VECTOR_STORE_FILE_BATCH_SIZE", "500")) # Файлов в одном vector_stores.file_batches
+
+    # Переиндексирование эмбеддингов через Batch API (python -m app.services.embedding_backfill)
+    EMBEDDING_BATCH_MAX_CHUNKS: int = int(os.getenv("EMBEDDING_BATCH_MAX_CHUNKS", "20000")) # Чанков в одном пакете (лимит Batch API — 50000 запросов)
+    EMBEDDING_BATCH_MAX_ACTIVE: int = int(os.getenv("EMBEDDING_BATCH_MAX_ACTIVE", "4")) # Одновременно обрабатываемых пакетов
+    EMBEDDING_BATCH_MAX_ATTEMPTS: int = int(os.getenv("EMBEDDING_BATCH_MAX_ATTEMPTS", "3")) # Повторных отправок пакета после failed/expired
+    EMBEDDING_BATCH_POLL_INTERVAL: float = float(os.getenv("EMBEDDING_BATCH_POLL_INTERVAL", "60")) # Секунды
+
+    # Пакетная генерация эмбеддингов
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "100")) # Текстов в одном запросе embeddings.create
+    EMBEDDING_MAX_CONCURRENCY: int = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4")) # Пакетов, отправляемых параллельно
+
+    # Фоновые задачи загрузки документов (очередь ingest_jobs)
+    INGEST_WORKERS_ENABLED: bool = os.getenv("INGEST_WORKERS_ENABLED", "true").lower() in ("1", "true", "yes")
+    INGEST_WORKER_CONCURRENCY: int = int(os.getenv("INGEST_WORKER_CONCURRENCY", "4")) # Задач, выполняемых одновременно в процессе
+    INGEST_POLL_INTERVAL: float = float(os.getenv("INGEST_POLL_INTERVAL", "2")) # Секунды между опросами очереди
+    INGEST_JOB_MAX_ATTEMPTS: int = int(os.getenv("INGEST_JOB_MAX_ATTEMPTS", "3"))
+    INGEST_JOB_RETRY_BASE_DELAY: float = float(os.getenv("INGEST_JOB_RETRY_BASE_DELAY", "5")) # Секунды, удваивается с каждой попыткой
+    INGEST_JOB_STALE_AFTER: float = float(os.getenv("INGEST_JOB_STALE_AFTER", "900")) # Секунды в running, после которых задача без heartbeat считается зависшей
+    INGEST_JOB_HEARTBEAT_INTERVAL: float = float(os.getenv("INGEST_JOB_HEARTBEAT_INTERVAL", "60")) # Секунды между продлениями locked_at выполняемой задачи
+
+    # Кэш ответов GET /messages/ (точное совпадение нормализованного запроса, версия файлов компании)
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "86400")) # Секунды
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000")) # Записей в памяти процесса (LRU)
+    ANSWER_CACHE_SHARED: bool = os.getenv("ANSWER_CACHE_SHARED", "false").lower() in ("1", "true", "yes") # Общий уровень в таблице answer_cache
+    ANSWER_CACHE_SHARED_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_SHARED_MAX_ENTRIES", "1000")) # Записей на компанию в таблице (LRU)
+
+    # Кэш компаний процесса (platform_company_id -> openai_vector_store_id)
+    COMPANY_CACHE_TTL: float = float(os.getenv("COMPANY_CACHE_TTL", "300")) # Секунды; 0 — кэш выключен
+    COMPANY_CACHE_MAX_ENTRIES: int = int(os.getenv("COMPANY_CACHE_MAX_ENTRIES", "10000")) # Компаний в кэше (LRU)
+    COMPANY_CACHE_NOTIFY: bool = os.getenv("COMPANY_CACHE_NOTIFY", "false").lower() in ("1", "true", "yes") # LISTEN/NOTIFY между процессами; занимает одно соединение пула
+
+    # Семантический кэш ответов /messagespg/query
+    SEMANTIC_CACHE_ENABLED: bool = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    SEMANTIC_CACHE_MAX_DISTANCE: float = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.05")) # Косинусное расстояние до сохраненного запроса
+    SEMANTIC_CACHE_TTL: float = float(os.getenv("SEMANTIC_CACHE_TTL", "86400")) # Секунды
+    SEMANTIC_CACHE_MAX_ENTRIES: int = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000")) # Записей на компанию (LRU)
 
     class Config:
         case_sensitive = True
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import text
+
+from app import models
+from app.core.config import settings
+from app.core.database import async_engine, Base
+from app.core.partitions import ensure_chunks_partitioned, split_default_partition
+from app.core.vector_index import detect_pgvector_version, ensure_chunks_embedding_index, ensure_embedding_storage
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, которых не было в исходной схеме БД: создаются при старте, если их нет
+_NEW_TABLES = [
+    models.Embedding.__table__,
+    models.IngestJob.__table__,
+    models.CorpusVersion.__table__,
+    models.SemanticCacheEntry.__table__,
+    models.AnswerCacheEntry.__table__,
+    models.EmbeddingBatch.__table__,
+]
+
+# Столбцы, добавленные к существующим таблицам (выполняются после секционирования chunks)
+_SCHEMA_CHANGES = [
+    "ALTER TABLE chunks ADD COLUMN IF NOT EXISTS embedding_id bigint REFERENCES embeddings (id)",
+    # Полнотекстовый поиск использует GIN индекс по выражению (vector_index.FULLTEXT_INDEX,
+    # строится в фоне); прежний хранимый столбец удаляется вместе со своим индексом без перезаписи таблицы
+    "ALTER TABLE chunks DROP COLUMN IF EXISTS text_tsv",
+    # Хэш содержимого: повторная загрузка неизмененного документа ничего не делает
+    "ALTER TABLE files ADD COLUMN IF NOT EXISTS content_hash varchar(64)",
+    # Профиль поиска file_search и нарезки файлов компании
+    "ALTER TABLE companies ADD COLUMN IF NOT EXISTS retrieval_model text",
+    "ALTER TABLE companies ADD COLUMN IF NOT EXISTS max_num_results integer",
+    "ALTER TABLE companies ADD COLUMN IF NOT EXISTS score_threshold double precision",
+    "ALTER TABLE companies ADD COLUMN IF NOT EXISTS chunk_max_tokens integer",
+    "ALTER TABLE companies ADD COLUMN IF NOT EXISTS chunk_overlap_tokens integer",
+    "ALTER TABLE files2 ADD COLUMN IF NOT EXISTS document_id text",
+    "ALTER TABLE files2 ADD COLUMN IF NOT EXISTS content_hash varchar(64)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_files2_company_document ON files2 (platform_company_id, document_id) "
+    "WHERE document_id IS NOT NULL",
+]
+
+# Фоновая задача построения ANN индекса (может занять долгое время на больших таблицах)
+_index_task: Optional[asyncio.Task] = None
+# Фоновый перенос чанков из chunks_default в секции компаний
+_split_task: Optional[asyncio.Task] = None
+
+
+async def _split_default_partition() -> None:
+    try:
+        await split_default_partition(async_engine)
+    except Exception as e:
+        logger.exception(f"Ошибка переноса чанков из chunks_default: {e}")
+
+
+async def _build_indexes() -> None:
+    try:
+        await ensure_chunks_embedding_index(async_engine)
+    except Exception as e:
+        logger.exception(f"Ошибка построения индексов chunks: {e}")
+
+
+async def _create_new_tables() -> None:
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=_NEW_TABLES)
+
+
+async def _apply_schema_changes() -> None:
+    async with async_engine.begin() as conn:
+        for statement in _SCHEMA_CHANGES:
+            await conn.execute(text(statement))
+
+
+async def init_db() -> None:
+    """Подготовка БД при старте приложения.
+
+    Новые таблицы, миграция chunks в секционированную по компаниям таблицу и
+    новые столбцы применяются до приема запросов. Построение индексов chunks
+    (ANN и полнотекстового) запускается в фоне, чтобы не задерживать старт:
+    до его завершения поиск работает, но перебором. Там же чанки, оставшиеся в chunks_default
+    от прежней миграции, переносятся в секции своих компаний.
+    """
+    global _index_task, _split_task
+    await detect_pgvector_version(async_engine)
+    await _create_new_tables()
+    if settings.CHUNKS_PARTITIONING_AUTO_MIGRATE:
+        await ensure_chunks_partitioned(async_engine)
+        _split_task = asyncio.create_task(_split_default_partition())
+    await _apply_schema_changes()
+    await ensure_embedding_storage(async_engine)
+    if settings.VECTOR_INDEX_AUTO_CREATE:
+        _index_task = asyncio.create_task(_build_indexes())
+
+
+async def shutdown_db() -> None:
+    for task in (_index_task, _split_task):
+        if task is not None and not task.done():
+            task.cancel()
+    await async_engine.dispose()
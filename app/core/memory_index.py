@@ -0,0 +1,355 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Строк, читаемых из chunks за один запрос при построении индекса
+_FETCH_BATCH = 10000
+
+# Доля удаленных строк, после которой индекс компании перестраивается
+_REBUILD_DELETED_FRACTION = 0.2
+
+# Индексы компаний, открытые в этом процессе
+_indexes: Dict[int, "CompanyIndex"] = {}
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def hot_companies() -> Set[int]:
+    """Компании, для которых ведется индекс в памяти (MEMORY_INDEX_COMPANIES)."""
+    return {int(value) for value in settings.MEMORY_INDEX_COMPANIES.split(",") if value.strip()}
+
+
+class CompanyIndex:
+    """Индекс эмбеддингов одной компании в файлах MEMORY_INDEX_DIR:
+
+    c{id}.{gen}.f32 — нормализованные векторы float32 (строки матрицы), только дозапись;
+    c{id}.{gen}.ids — ID чанков (int64) в том же порядке;
+    c{id}.{gen}.del — ID удаленных из БД чанков (int64), только дозапись;
+    c{id}.json      — поколение gen, число записанных строк и удаленных ID,
+                      размерность, максимальный ID чанка и время полной сверки ID.
+
+    Файлы отображаются в память (mmap) только для чтения, поэтому страницы
+    матрицы общие для всех воркеров uvicorn на хосте. Читатели используют
+    первые rows строк из .json, который заменяется атомарно после дозаписи.
+    Перестроение пишет файлы нового поколения и публикует их заменой .json:
+    файлы, уже отображенные другими процессами, не обрезаются.
+    """
+
+    def __init__(self, platform_company_id: int):
+        self.platform_company_id = platform_company_id
+        self.prefix = os.path.join(settings.MEMORY_INDEX_DIR, f"c{platform_company_id}")
+        self.meta_path = f"{self.prefix}.json"
+        self.lock_path = f"{self.prefix}.lock"
+        self._meta_mtime: Optional[int] = None
+        self._vectors: Optional[np.ndarray] = None
+        self._ids: Optional[np.ndarray] = None
+        # Номера строк удаленных чанков (исключаются из поиска)
+        self._dead: np.ndarray = np.empty(0, dtype=np.int64)
+
+    def path(self, meta: dict, suffix: str) -> str:
+        return f"{self.prefix}.{meta['generation']}.{suffix}"
+
+    def read_meta(self) -> Optional[dict]:
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        # Файлы без поколения (прежний формат) строятся заново
+        return meta if "generation" in meta else None
+
+    def write_meta(self, meta: dict) -> None:
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            self._vectors = self._ids = None
+            return
+        if mtime == self._meta_mtime:
+            return
+        meta = self.read_meta()
+        self._meta_mtime = mtime
+        if not meta or meta["rows"] == 0 or meta["dim"] != settings.EMBEDDING_DIMENSIONS:
+            self._vectors = self._ids = None
+            return
+        self._vectors = np.memmap(self.path(meta, "f32"), dtype=np.float32, mode="r", shape=(meta["rows"], meta["dim"]))
+        self._ids = np.memmap(self.path(meta, "ids"), dtype=np.int64, mode="r", shape=(meta["rows"],))
+        self._dead = np.empty(0, dtype=np.int64)
+        if meta["deleted"]:
+            deleted = np.fromfile(self.path(meta, "del"), dtype=np.int64, count=meta["deleted"])
+            self._dead = np.flatnonzero(np.isin(self._ids, deleted))
+
+    @property
+    def warm(self) -> bool:
+        self._reload_if_changed()
+        return self._vectors is not None
+
+    def search(self, query_embedding: List[float], k: int) -> List[int]:
+        """ID k ближайших по косинусному сходству живых чанков (argpartition + сортировка top-k)."""
+        self._reload_if_changed()
+        if self._vectors is None:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self._vectors @ query
+        scores[self._dead] = -np.inf
+        k = min(k, len(scores) - len(self._dead))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return self._ids[top].tolist()
+
+    def new_meta(self) -> dict:
+        """Пустой индекс нового поколения (еще не опубликован)."""
+        return {"generation": time.time_ns(), "rows": 0, "deleted": 0, "dim": settings.EMBEDDING_DIMENSIONS, "max_chunk_id": 0}
+
+    def remove_stale_files(self, meta: Optional[dict]) -> None:
+        """Удаляет файлы прочих поколений. Процессы, отобразившие их в память,
+        продолжают читать их до перезагрузки: удаление, в отличие от усечения, безопасно."""
+        keep = {self.path(meta, suffix) for suffix in ("f32", "ids", "del")} if meta else set()
+        for path in glob.glob(f"{glob.escape(self.prefix)}.*"):
+            if path.endswith((".f32", ".ids", ".del")) and path not in keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def append(self, ids: np.ndarray, vectors: np.ndarray, meta: dict) -> dict:
+        """Дописывает строки и возвращает новые метаданные; публикует их вызывающий
+        (write_meta). Вызывается под блокировкой."""
+        rows = meta["rows"]
+        dim = meta["dim"]
+        # Хвост незавершенной прошлой дозаписи не учтен в .json — отрезаем его
+        _append_array(self.path(meta, "f32"), rows * dim * 4, vectors.astype(np.float32, copy=False))
+        _append_array(self.path(meta, "ids"), rows * 8, ids.astype(np.int64, copy=False))
+        return {**meta, "rows": rows + len(ids), "max_chunk_id": max(meta["max_chunk_id"], int(ids.max()))}
+
+    def indexed_ids(self, meta: dict) -> np.ndarray:
+        """ID всех строк индекса (в порядке дозаписи, не обязательно возрастающем)."""
+        return np.fromfile(self.path(meta, "ids"), dtype=np.int64, count=meta["rows"])
+
+    def tombstone(self, chunk_ids: np.ndarray, meta: dict) -> dict:
+        """Дописывает ID удаленных чанков и публикует их число (вызывается под блокировкой)."""
+        deleted = meta["deleted"]
+        _append_array(self.path(meta, "del"), deleted * 8, chunk_ids.astype(np.int64, copy=False))
+        meta = {**meta, "deleted": deleted + len(chunk_ids)}
+        self.write_meta(meta)
+        return meta
+
+
+def _append_array(path: str, size: int, array: np.ndarray) -> None:
+    with open(path, "ab") as f:
+        f.truncate(size)
+        array.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def get_index(platform_company_id: int) -> Optional[CompanyIndex]:
+    """Индекс компании, если она входит в MEMORY_INDEX_COMPANIES."""
+    if platform_company_id not in hot_companies():
+        return None
+    if platform_company_id not in _indexes:
+        _indexes[platform_company_id] = CompanyIndex(platform_company_id)
+    return _indexes[platform_company_id]
+
+
+async def search(platform_company_id: int, query_embedding: List[float], k: int) -> Optional[List[int]]:
+    """ID ближайших чанков из индекса в памяти или None, если индекс компании не прогрет."""
+    index = get_index(platform_company_id)
+    if index is None or not index.warm:
+        return None
+    # Умножение матрицы выполняется в потоке: BLAS отпускает GIL, цикл событий не блокируется
+    return await asyncio.to_thread(index.search, query_embedding, k)
+
+
+async def _fetch_chunk_ids(platform_company_id: int, after_id: int) -> np.ndarray:
+    """ID чанков компании с эмбеддингом после after_id (только ID, без векторов)."""
+    async with AsyncSessionLocal() as db:
+        ids = (await db.execute(
+            text("""
+                SELECT id FROM chunks
+                WHERE platform_company_id = :platform_company_id AND id > :after_id AND embedding IS NOT NULL
+                ORDER BY id
+            """),
+            {"platform_company_id": platform_company_id, "after_id": after_id}
+        )).scalars().all()
+    return np.asarray(ids, dtype=np.int64)
+
+
+async def _fetch_rows(platform_company_id: int, chunk_ids: np.ndarray):
+    """Нормализованные векторы чанков chunk_ids (удаленные к этому моменту пропускаются)."""
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            text("""
+                SELECT id, embedding::vector::real[] AS embedding
+                FROM chunks
+                WHERE platform_company_id = :platform_company_id AND id = ANY(:chunk_ids) AND embedding IS NOT NULL
+                ORDER BY id
+            """),
+            {"platform_company_id": platform_company_id, "chunk_ids": chunk_ids.tolist()}
+        )).all()
+    if not rows:
+        return None, None
+    ids = np.fromiter((row.id for row in rows), dtype=np.int64, count=len(rows))
+    vectors = np.asarray([row.embedding for row in rows], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1.0, norms)
+    return ids, vectors
+
+
+async def refresh_company(platform_company_id: int) -> int:
+    """Дописывает в индекс компании чанки, которых в нем еще нет.
+
+    ID чанков выделяются до commit, поэтому пакеты параллельных загрузок становятся
+    видимыми не по порядку ID: чанк с меньшим ID может появиться после уже
+    проиндексированного большего. Поэтому каждое обновление заново просматривает
+    последние MEMORY_INDEX_RESCAN_IDS ID до максимального проиндексированного,
+    а раз в MEMORY_INDEX_RECONCILE_INTERVAL — все ID компании, и дописывает
+    отсутствующие в индексе (сравнение по массиву ID индекса).
+    Индекс без файлов, с другой размерностью или с большой долей удаленных строк
+    строится заново в файлах нового поколения.
+    Одновременно индекс обновляет только один процесс (flock); остальные пропускают.
+    Возвращает число добавленных строк."""
+    index = get_index(platform_company_id)
+    if index is None:
+        return 0
+    os.makedirs(settings.MEMORY_INDEX_DIR, exist_ok=True)
+    lock_file = open(index.lock_path, "w")
+    try:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+
+        meta = index.read_meta()
+        rebuild = (
+            not meta or meta["dim"] != settings.EMBEDDING_DIMENSIONS
+            or meta["deleted"] > meta["rows"] * _REBUILD_DELETED_FRACTION
+        )
+        # Прежнее поколение остается опубликованным, пока новое не будет построено полностью
+        published = meta if rebuild and meta and meta["dim"] == settings.EMBEDDING_DIMENSIONS else None
+        if rebuild:
+            if published:
+                logger.info(f"Индекс в памяти компании {platform_company_id}: перестроение ({published['deleted']} удаленных из {published['rows']} строк).")
+            index.remove_stale_files(published)
+            meta = index.new_meta()
+
+        reconcile = rebuild or time.time() - meta.get("reconciled_at", 0) >= settings.MEMORY_INDEX_RECONCILE_INTERVAL
+        after_id = 0 if reconcile else max(0, meta["max_chunk_id"] - settings.MEMORY_INDEX_RESCAN_IDS)
+        candidates = await _fetch_chunk_ids(platform_company_id, after_id)
+        if meta["rows"] and len(candidates):
+            indexed = await asyncio.to_thread(index.indexed_ids, meta)
+            candidates = candidates[~np.isin(candidates, indexed)]
+        candidates = candidates[:max(0, settings.MEMORY_INDEX_MAX_ROWS - meta["rows"])]
+
+        added = 0
+        for start in range(0, len(candidates), _FETCH_BATCH):
+            ids, vectors = await _fetch_rows(platform_company_id, candidates[start:start + _FETCH_BATCH])
+            if ids is None:
+                continue
+            meta = await asyncio.to_thread(index.append, ids, vectors, meta)
+            added += len(ids)
+            if not published:
+                index.write_meta(meta)
+        if reconcile:
+            meta = {**meta, "reconciled_at": time.time()}
+            index.write_meta(meta)
+        if rebuild:
+            index.remove_stale_files(meta)
+        if meta["rows"] >= settings.MEMORY_INDEX_MAX_ROWS:
+            logger.warning(f"Индекс в памяти компании {platform_company_id} достиг MEMORY_INDEX_MAX_ROWS={settings.MEMORY_INDEX_MAX_ROWS}.")
+        if added:
+            logger.info(f"Индекс в памяти компании {platform_company_id}: добавлено {added} строк, всего {meta['rows']}.")
+        return added
+    finally:
+        lock_file.close()
+
+
+def reset_company(platform_company_id: int) -> bool:
+    """Сбрасывает индекс компании, чтобы следующий refresh_company построил его заново
+    (после изменения эмбеддингов уже проиндексированных чанков). Пока индекс
+    не построен, поиск идет через БД. False — индекс сейчас обновляется другим процессом."""
+    index = get_index(platform_company_id)
+    if index is None:
+        return True
+    os.makedirs(settings.MEMORY_INDEX_DIR, exist_ok=True)
+    with open(index.lock_path, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        try:
+            os.remove(index.meta_path)
+        except FileNotFoundError:
+            pass
+    return True
+
+
+def _remove_chunks(index: CompanyIndex, chunk_ids: List[int]) -> None:
+    os.makedirs(settings.MEMORY_INDEX_DIR, exist_ok=True)
+    with open(index.lock_path, "w") as lock_file:
+        # Ждем дозаписи другого процесса: она могла прочитать эти чанки до удаления
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        meta = index.read_meta()
+        if not meta:
+            return
+        # Чанк, еще не попавший в индекс, в него уже не попадет: его нет в БД
+        ids = np.asarray([chunk_id for chunk_id in chunk_ids if chunk_id <= meta["max_chunk_id"]], dtype=np.int64)
+        if len(ids):
+            index.tombstone(ids, meta)
+
+
+async def remove_chunks(platform_company_id: int, chunk_ids: List[int]) -> None:
+    """Исключает удаленные из БД чанки из индекса компании (вызывается после commit)."""
+    index = get_index(platform_company_id)
+    if index is None or not chunk_ids:
+        return
+    try:
+        await asyncio.to_thread(_remove_chunks, index, chunk_ids)
+    except Exception as e:
+        # Удаленные чанки все равно не попадут в ответ: поиск читает найденные ID из БД
+        logger.warning(f"Не удалось исключить удаленные чанки из индекса в памяти компании {platform_company_id}: {e}")
+
+
+async def _refresh_loop() -> None:
+    while True:
+        for platform_company_id in sorted(hot_companies()):
+            try:
+                await refresh_company(platform_company_id)
+            except Exception as e:
+                logger.error(f"Ошибка обновления индекса в памяти компании {platform_company_id}: {e}")
+        await asyncio.sleep(settings.MEMORY_INDEX_REFRESH_INTERVAL)
+
+
+def start_refresh() -> None:
+    """Запускает прогрев и периодическое обновление индексов компаний из MEMORY_INDEX_COMPANIES."""
+    global _refresh_task
+    if _refresh_task is None and hot_companies():
+        _refresh_task = asyncio.create_task(_refresh_loop())
+
+
+async def stop_refresh() -> None:
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
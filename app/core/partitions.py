@@ -0,0 +1,200 @@
+import logging
+from typing import Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from app.core.config import settings
+from app.core.database import async_engine
+from app.core.vector_index import embedding_sql_type
+
+logger = logging.getLogger(__name__)
+
+# Компания для чанков, загруженных до появления platform_company_id
+LEGACY_COMPANY_ID = 0
+
+# Ключ advisory lock для миграции chunks в секционированную таблицу
+_MIGRATION_LOCK_KEY = 7210410002
+# Класс двухключевого advisory lock (int4) для создания секции компании
+_PARTITION_LOCK_CLASS = 72104
+
+# Секции, существование которых уже проверено в этом процессе
+_known_partitions: Set[str] = set()
+
+
+def _strategy() -> str:
+    strategy = settings.CHUNKS_PARTITION_STRATEGY.lower()
+    if strategy not in ("list", "hash"):
+        raise ValueError(f"Неизвестная стратегия секционирования chunks: {settings.CHUNKS_PARTITION_STRATEGY!r}")
+    return strategy
+
+
+def company_partition_name(platform_company_id: int) -> str:
+    return f"chunks_c{int(platform_company_id)}"
+
+
+async def ensure_chunks_partitioned(engine: AsyncEngine) -> None:
+    """Приводит таблицы files2/chunks к схеме с разделением по компаниям.
+
+    Добавляет platform_company_id в files2 и, если chunks еще обычная таблица,
+    переносит ее в таблицу, секционированную по platform_company_id
+    (LIST — секция на компанию, HASH — фиксированное число секций).
+    Существующие чанки получают компанию своего файла или LEGACY_COMPANY_ID.
+    """
+    strategy = _strategy()
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _MIGRATION_LOCK_KEY})
+
+        await conn.execute(text("ALTER TABLE files2 ADD COLUMN IF NOT EXISTS platform_company_id integer"))
+        await conn.execute(text("CREATE INDEX IF NOT EXISTS ix_files2_platform_company_id ON files2 (platform_company_id)"))
+
+        relkind = (await conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('chunks')"))).scalar()
+        if relkind == "p":
+            partition_strategy = (await conn.execute(
+                text("SELECT partstrat FROM pg_partitioned_table WHERE partrelid = to_regclass('chunks')")
+            )).scalar()
+            if {"l": "list", "h": "hash"}.get(partition_strategy) != strategy:
+                logger.warning(f"chunks уже секционирована стратегией {partition_strategy!r}, CHUNKS_PARTITION_STRATEGY={strategy!r} игнорируется.")
+            return
+
+        logger.warning(f"Перенос chunks в таблицу, секционированную по platform_company_id ({strategy}).")
+        await conn.execute(text("LOCK TABLE chunks IN ACCESS EXCLUSIVE MODE"))
+        await conn.execute(text("ALTER TABLE chunks RENAME TO chunks_unpartitioned"))
+        await conn.execute(text("CREATE SEQUENCE IF NOT EXISTS chunks_partitioned_id_seq"))
+        await conn.execute(text(
+            "SELECT setval('chunks_partitioned_id_seq', COALESCE((SELECT max(id) FROM chunks_unpartitioned), 0) + 1, false)"
+        ))
+        partition_by = "LIST (platform_company_id)" if strategy == "list" else "HASH (platform_company_id)"
+        await conn.execute(text(f"""
+            CREATE TABLE chunks (
+                id bigint NOT NULL DEFAULT nextval('chunks_partitioned_id_seq'),
+                text text NOT NULL,
+                index bigint NOT NULL,
+                file_id bigint NOT NULL REFERENCES files2 (id),
+                embedding {embedding_sql_type()},
+                platform_company_id integer NOT NULL DEFAULT {LEGACY_COMPANY_ID}
+            ) PARTITION BY {partition_by}
+        """))
+        await conn.execute(text("ALTER SEQUENCE chunks_partitioned_id_seq OWNED BY chunks.id"))
+
+        if strategy == "list":
+            # Секция по умолчанию остается пустой: присоединение новой секции проверяет ее
+            # полным просмотром, поэтому у каждой компании (и LEGACY_COMPANY_ID) своя секция
+            await conn.execute(text("CREATE TABLE chunks_default PARTITION OF chunks DEFAULT"))
+            company_ids = (await conn.execute(text(f"""
+                SELECT DISTINCT COALESCE(f.platform_company_id, {LEGACY_COMPANY_ID})
+                FROM chunks_unpartitioned c
+                LEFT JOIN files2 f ON f.id = c.file_id
+            """))).scalars().all()
+            for platform_company_id in company_ids:
+                await conn.execute(text(
+                    f"CREATE TABLE {company_partition_name(platform_company_id)} PARTITION OF chunks "
+                    f"FOR VALUES IN ({int(platform_company_id)})"
+                ))
+        else:
+            for remainder in range(settings.CHUNKS_HASH_PARTITIONS):
+                await conn.execute(text(
+                    f"CREATE TABLE chunks_h{remainder} PARTITION OF chunks "
+                    f"FOR VALUES WITH (MODULUS {settings.CHUNKS_HASH_PARTITIONS}, REMAINDER {remainder})"
+                ))
+
+        await conn.execute(text(f"""
+            INSERT INTO chunks (id, text, index, file_id, embedding, platform_company_id)
+            SELECT c.id, c.text, c.index, c.file_id, c.embedding, COALESCE(f.platform_company_id, {LEGACY_COMPANY_ID})
+            FROM chunks_unpartitioned c
+            LEFT JOIN files2 f ON f.id = c.file_id
+        """))
+        await conn.execute(text("DROP TABLE chunks_unpartitioned"))
+        # Первичный ключ секционированной таблицы обязан включать ключ секционирования
+        await conn.execute(text("ALTER TABLE chunks ADD PRIMARY KEY (id, platform_company_id)"))
+        await conn.execute(text("CREATE INDEX ix_chunks_file_id ON chunks (file_id)"))
+        logger.warning("Таблица chunks секционирована по platform_company_id.")
+
+
+async def _lock_partition_ddl(conn: AsyncConnection, platform_company_id: int) -> None:
+    """Ограничивает ожидание блокировок DDL секции и не дает создавать ее дважды."""
+    await conn.execute(text(f"SET LOCAL lock_timeout = '{int(settings.CHUNKS_PARTITION_LOCK_TIMEOUT * 1000)}ms'"))
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:key, :company_id)"), {"key": _PARTITION_LOCK_CLASS, "company_id": platform_company_id})
+
+
+async def _attach_company_partition(conn: AsyncConnection, platform_company_id: int) -> None:
+    """Создает таблицу секции отдельно и присоединяет ее (ATTACH PARTITION).
+
+    В отличие от CREATE TABLE ... PARTITION OF, присоединение берет у chunks
+    SHARE UPDATE EXCLUSIVE и не блокирует чтение и запись остальных компаний.
+    Индексы chunks создаются в новой (пустой) секции при присоединении."""
+    name = company_partition_name(platform_company_id)
+    await conn.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE chunks INCLUDING DEFAULTS)"))
+    await conn.execute(text(f"ALTER TABLE chunks ATTACH PARTITION {name} FOR VALUES IN ({int(platform_company_id)})"))
+
+
+async def ensure_company_partition(platform_company_id: int) -> None:
+    """Создает LIST-секцию chunks для компании, если ее еще нет.
+
+    Выполняется в собственном соединении и транзакции, не затрагивая сессию
+    вызывающего. Ожидание блокировок ограничено CHUNKS_PARTITION_LOCK_TIMEOUT:
+    при длинной транзакции на chunks DDL завершается ошибкой (задача загрузки
+    будет повторена), а не выстраивает за собой очередь запросов всех компаний.
+    Для HASH секции созданы заранее, ничего не делаем. Секция LEGACY_COMPANY_ID
+    создается при миграции (или split_default_partition).
+    """
+    if _strategy() != "list" or platform_company_id == LEGACY_COMPANY_ID:
+        return
+    name = company_partition_name(platform_company_id)
+    if name in _known_partitions:
+        return
+
+    async with async_engine.begin() as conn:
+        exists = (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar()
+        if not exists:
+            await _lock_partition_ddl(conn, platform_company_id)
+            # Секцию мог создать другой процесс, пока мы ждали блокировку
+            exists = (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar()
+        if not exists:
+            await _attach_company_partition(conn, platform_company_id)
+            logger.info(f"Создана секция {name} для компании {platform_company_id}.")
+    _known_partitions.add(name)
+
+
+async def split_default_partition(engine: AsyncEngine) -> None:
+    """Переносит чанки из chunks_default в секции их компаний (одноразовый шаг).
+
+    В базах, секционированных до появления секции на каждую компанию, в
+    chunks_default лежат все перенесенные при миграции чанки. Каждая компания
+    переносится отдельной короткой транзакцией; компания, для которой не
+    удалось получить блокировки, будет перенесена при следующем запуске.
+    """
+    if _strategy() != "list":
+        return
+    async with engine.connect() as conn:
+        if not (await conn.execute(text("SELECT to_regclass('chunks_default') IS NOT NULL"))).scalar():
+            return
+        company_ids = (await conn.execute(text("SELECT DISTINCT platform_company_id FROM chunks_default"))).scalars().all()
+        # Вычисляемые столбцы заполняются при вставке, их не переносим
+        columns = (await conn.execute(text("""
+            SELECT string_agg(quote_ident(attname), ', ' ORDER BY attnum) FROM pg_attribute
+            WHERE attrelid = 'chunks'::regclass AND attnum > 0 AND NOT attisdropped AND attgenerated = ''
+        """))).scalar()
+
+    for platform_company_id in company_ids:
+        name = company_partition_name(platform_company_id)
+        try:
+            async with engine.begin() as conn:
+                await _lock_partition_ddl(conn, platform_company_id)
+                if (await conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})).scalar():
+                    logger.warning(f"Секция {name} уже существует, а чанки компании {platform_company_id} лежат в chunks_default.")
+                    continue
+                await conn.execute(text(f"CREATE TABLE {name} (LIKE chunks INCLUDING DEFAULTS)"))
+                moved = (await conn.execute(
+                    text(f"""
+                        WITH moved AS (
+                            DELETE FROM chunks_default WHERE platform_company_id = :company_id RETURNING {columns}
+                        )
+                        INSERT INTO {name} ({columns}) SELECT {columns} FROM moved
+                    """),
+                    {"company_id": platform_company_id}
+                )).rowcount
+                await _attach_company_partition(conn, platform_company_id)
+            logger.warning(f"Чанки компании {platform_company_id} ({moved}) перенесены из chunks_default в {name}.")
+        except Exception as e:
+            logger.error(f"Не удалось перенести чанки компании {platform_company_id} из chunks_default: {e}")
@@ -0,0 +1,403 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pgvector.sqlalchemy import HALFVEC, Vector
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Имя управляемого ANN индекса по chunks.embedding
+CHUNKS_EMBEDDING_INDEX = "chunks_embedding_ann_idx"
+# Имя индекса по бинарно квантованному embedding (VECTOR_BINARY_INDEX)
+BINARY_EMBEDDING_INDEX = "chunks_embedding_bq_idx"
+# Имя полнотекстового GIN индекса по to_tsvector(FULLTEXT_CONFIG, text) (гибридный поиск)
+FULLTEXT_INDEX = "chunks_text_fts_idx"
+
+# Стратегии поиска похожих чанков (см. CRUDChunk.get_similar_chunks)
+STRATEGY_ANN = "ann" # ANN индекс по embedding (HNSW/IVFFlat, при VECTOR_SEARCH_DIMENSIONS — с пересчетом)
+STRATEGY_BINARY = "binary" # Кандидаты по индексу бинарного квантования, точный пересчет <=>
+STRATEGY_EXACT = "exact" # Точный перебор без индекса (эталон для оценки recall)
+SEARCH_STRATEGIES = (STRATEGY_ANN, STRATEGY_BINARY, STRATEGY_EXACT)
+
+# Ключ advisory lock, чтобы индекс строил только один воркер uvicorn
+_INDEX_LOCK_KEY = 7210410001
+# Ключ advisory lock для смены типа столбцов эмбеддингов
+_STORAGE_LOCK_KEY = 7210410003
+
+# Столбцы эмбеддингов, тип которых задается EMBEDDING_STORAGE / EMBEDDING_DIMENSIONS
+_EMBEDDING_COLUMNS = [("chunks", "embedding"), ("embeddings", "embedding"), ("semantic_cache", "query_embedding")]
+# Таблицы-кэши: при смене размерности их содержимое удаляется, а не переносится
+_CACHE_TABLES = {"semantic_cache"}
+
+# Версия расширения vector в БД (detect_pgvector_version); None — еще не определена
+_pgvector_version: Optional[Tuple[int, ...]] = None
+# Первая версия pgvector с параметрами hnsw/ivfflat.iterative_scan
+_ITERATIVE_SCAN_VERSION = (0, 8)
+
+
+def _storage() -> str:
+    storage = settings.EMBEDDING_STORAGE.lower()
+    if storage not in ("vector", "halfvec"):
+        raise ValueError(f"Неизвестный EMBEDDING_STORAGE: {settings.EMBEDDING_STORAGE!r}")
+    return storage
+
+
+def embedding_sql_type() -> str:
+    """SQL тип столбцов эмбеддингов, например vector(1536) или halfvec(1536)."""
+    return f"{_storage()}({settings.EMBEDDING_DIMENSIONS})"
+
+
+def embedding_column_type():
+    """Тип SQLAlchemy для столбцов эмбеддингов моделей."""
+    if _storage() == "halfvec":
+        return HALFVEC(settings.EMBEDDING_DIMENSIONS)
+    return Vector(settings.EMBEDDING_DIMENSIONS)
+
+
+def _search_dimensions() -> int:
+    """Размерность укороченного вектора ANN индекса (0 — индекс по полному вектору)."""
+    dimensions = settings.VECTOR_SEARCH_DIMENSIONS
+    if dimensions <= 0 or dimensions >= settings.EMBEDDING_DIMENSIONS:
+        return 0
+    return dimensions
+
+
+def two_stage_search() -> bool:
+    return _search_dimensions() > 0
+
+
+def query_vector_sql() -> str:
+    """Параметр :query_vec (строка '[...]'), приведенный к типу столбца embedding."""
+    return f"CAST(:query_vec AS {embedding_sql_type()})"
+
+
+def _short_vector_sql(expression: str) -> str:
+    dimensions = _search_dimensions()
+    return f"(subvector({expression}, 1, {dimensions})::halfvec({dimensions}))"
+
+
+def ann_distance_sql() -> str:
+    """Выражение косинусного расстояния, по которому работает ANN индекс.
+    При двухэтапном поиске — по первым VECTOR_SEARCH_DIMENSIONS измерениям
+    (модели text-embedding-3 допускают укорочение вектора)."""
+    if two_stage_search():
+        return f"{_short_vector_sql('embedding')} <=> {_short_vector_sql(query_vector_sql())}"
+    return f"embedding <=> {query_vector_sql()}"
+
+
+def _indexed_expression() -> str:
+    if two_stage_search():
+        return f"{_short_vector_sql('embedding')} halfvec_cosine_ops"
+    return f"embedding {_storage()}_cosine_ops"
+
+
+def fulltext_vector_sql() -> str:
+    """tsvector текста чанка. Конфигурация подставляется литералом: так выражение
+    совпадает с выражением индекса FULLTEXT_INDEX и планировщик может его использовать."""
+    config = settings.FULLTEXT_CONFIG.replace("'", "''")
+    return f"to_tsvector('{config}'::regconfig, text)"
+
+
+def _index_type() -> str:
+    index_type = settings.VECTOR_INDEX_TYPE.lower()
+    if index_type not in ("hnsw", "ivfflat", "none"):
+        logger.warning(f"Неизвестный VECTOR_INDEX_TYPE={settings.VECTOR_INDEX_TYPE!r}. ANN индекс не используется.")
+        return "none"
+    return index_type
+
+
+def _index_options() -> Dict[str, int]:
+    if _index_type() == "hnsw":
+        return {"m": settings.HNSW_M, "ef_construction": settings.HNSW_EF_CONSTRUCTION}
+    if _index_type() == "ivfflat":
+        return {"lists": settings.IVFFLAT_LISTS}
+    return {}
+
+
+def _binary_expression(expression: str = "embedding") -> str:
+    return f"(binary_quantize({expression})::bit({settings.EMBEDDING_DIMENSIONS}))"
+
+
+def _managed_indexes() -> Dict[str, Optional[Tuple[str, str, Dict[str, int]]]]:
+    """Управляемые индексы chunks: имя -> (метод, выражение с opclass, параметры)
+    или None, если индекс отключен настройками и должен быть удален."""
+    index_type = _index_type()
+    hnsw_options = {"m": settings.HNSW_M, "ef_construction": settings.HNSW_EF_CONSTRUCTION}
+    return {
+        CHUNKS_EMBEDDING_INDEX: (index_type, _indexed_expression(), _index_options()) if index_type != "none" else None,
+        # Бинарное квантование: 1 бит на измерение, поиск кандидатов по расстоянию Хэмминга
+        BINARY_EMBEDDING_INDEX: (
+            ("hnsw", f"{_binary_expression()} bit_hamming_ops", hnsw_options) if settings.VECTOR_BINARY_INDEX else None
+        ),
+        # Индекс по выражению, а не по хранимому столбцу: добавление столбца
+        # GENERATED ... STORED переписало бы всю таблицу chunks
+        FULLTEXT_INDEX: ("gin", fulltext_vector_sql(), {}),
+    }
+
+
+def index_create_sql(
+    table: str = "chunks", name: Optional[str] = None, concurrently: bool = True, only: bool = False,
+    index: str = CHUNKS_EMBEDDING_INDEX
+) -> Optional[str]:
+    """SQL создания управляемого индекса index (по умолчанию ANN индекса по embedding)
+    с параметрами из настроек (None, если индекс отключен). name — имя создаваемого
+    индекса, если оно отличается от index (индекс секции).
+
+    only=True создает индекс только на родительской секционированной таблице
+    (ON ONLY), индексы секций затем присоединяются через ATTACH PARTITION.
+    """
+    spec = _managed_indexes()[index]
+    if spec is None:
+        return None
+    method, expression, index_options = spec
+    options = ", ".join(f"{key} = {value}" for key, value in index_options.items())
+    options_sql = f" WITH ({options})" if options else ""
+    concurrently_sql = "CONCURRENTLY " if concurrently else ""
+    only_sql = "ONLY " if only else ""
+    return (
+        f"CREATE INDEX {concurrently_sql}IF NOT EXISTS {name or index} ON {only_sql}{table} "
+        f"USING {method} ({expression}){options_sql}"
+    )
+
+
+def _index_matches_settings(index: str, indexdef: str) -> bool:
+    # pg_get_indexdef выводит параметры в виде m='16', ef_construction='64',
+    # а выражение — как ((subvector(embedding, 1, 512))::halfvec(512)) halfvec_cosine_ops
+    method, _, index_options = _managed_indexes()[index]
+    expected = [f"USING {method} "] + [f"{key}='{value}'" for key, value in index_options.items()]
+    if index == FULLTEXT_INDEX:
+        # Смена FULLTEXT_CONFIG меняет выражение индекса: он перестраивается
+        expected.append(fulltext_vector_sql())
+    elif index == BINARY_EMBEDDING_INDEX:
+        expected += ["binary_quantize(embedding)", f"bit({settings.EMBEDDING_DIMENSIONS})", "bit_hamming_ops"]
+    elif two_stage_search():
+        expected += [f"subvector(embedding, 1, {_search_dimensions()})", "halfvec_cosine_ops"]
+    elif "subvector(" in indexdef:
+        return False
+    else:
+        expected.append(f"{_storage()}_cosine_ops")
+    return all(fragment in indexdef for fragment in expected)
+
+
+async def _build_partitioned_index(conn, index: str) -> None:
+    """Строит индекс секционированной chunks без блокировки записи:
+    пустой индекс ON ONLY на родителе, затем CONCURRENTLY на каждой секции
+    с присоединением к родительскому. Родительский индекс становится
+    валидным, когда присоединены индексы всех секций."""
+    await conn.execute(text(index_create_sql(concurrently=False, only=True, index=index)))
+    partitions = (await conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('chunks')
+        ORDER BY c.relname
+    """))).scalars().all()
+    # chunks_embedding_ann_idx -> chunks_c1_embedding_ann_idx
+    suffix = index.removeprefix("chunks_")
+    for partition in partitions:
+        partition_index = f"{partition}_{suffix}"
+        logger.info(f"Построение индекса {index} секции {partition}.")
+        await conn.execute(text(index_create_sql(table=partition, name=partition_index, index=index)))
+        await conn.execute(text(f"ALTER INDEX {index} ATTACH PARTITION {partition_index}"))
+
+
+async def _ensure_index(conn, index: str, partitioned: bool) -> None:
+    create_sql = index_create_sql(index=index)
+    existing = (await conn.execute(
+        text("""
+            SELECT pg_get_indexdef(i.indexrelid) AS indexdef, i.indisvalid
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name
+        """),
+        {"name": index}
+    )).first()
+
+    if existing is not None:
+        if create_sql and existing.indisvalid and _index_matches_settings(index, existing.indexdef):
+            logger.info(f"Индекс {index} актуален: {existing.indexdef}")
+            return
+        logger.warning(f"Индекс {index} не соответствует настройкам или невалиден, удаляем: {existing.indexdef}")
+        # Индекс секционированной таблицы нельзя удалить CONCURRENTLY
+        concurrently_sql = "" if partitioned else "CONCURRENTLY "
+        await conn.execute(text(f"DROP INDEX {concurrently_sql}IF EXISTS {index}"))
+
+    if create_sql is None:
+        logger.info(f"Индекс {index} отключен настройками.")
+        return
+
+    logger.info(f"Построение индекса: {create_sql}")
+    if partitioned:
+        await _build_partitioned_index(conn, index)
+    else:
+        await conn.execute(text(create_sql))
+    logger.info(f"Индекс {index} построен.")
+
+
+async def ensure_chunks_embedding_index(engine: AsyncEngine) -> None:
+    """Создает управляемые индексы chunks (ANN индекс по embedding, если включен —
+    индекс бинарного квантования, и полнотекстовый GIN индекс) или пересоздает их, если параметры в настройках
+    изменились либо прошлое построение было прервано (индекс невалиден).
+    Отключенные настройками индексы удаляются.
+
+    Индексы строятся CONCURRENTLY (для секционированной таблицы — по секциям),
+    поэтому запись в chunks не блокируется. При VECTOR_INDEX_TYPE=none
+    поиск выполняется точным перебором.
+    """
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+
+        locked = (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _INDEX_LOCK_KEY})).scalar()
+        if not locked:
+            logger.info("Индексы chunks обслуживаются другим воркером, пропускаем.")
+            return
+
+        try:
+            partitioned = (await conn.execute(text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('chunks')"))).scalar()
+            if settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM:
+                await conn.execute(
+                    text("SELECT set_config('maintenance_work_mem', :value, false)"),
+                    {"value": settings.VECTOR_INDEX_MAINTENANCE_WORK_MEM}
+                )
+            for index in _managed_indexes():
+                await _ensure_index(conn, index, partitioned)
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _INDEX_LOCK_KEY})
+
+
+async def ensure_embedding_storage(engine: AsyncEngine) -> None:
+    """Приводит тип столбцов эмбеддингов к EMBEDDING_STORAGE (vector/halfvec).
+
+    Смена vector <-> halfvec той же размерности выполняется ALTER COLUMN TYPE
+    (ANN индекс удаляется и затем перестраивается в фоне). Смена размерности
+    требует повторного получения эмбеддингов, поэтому для данных вызывает
+    ошибку старта; кэш ответов при этом просто очищается.
+    """
+    expected = embedding_sql_type()
+    async with engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _STORAGE_LOCK_KEY})
+        for table, column in _EMBEDDING_COLUMNS:
+            current = (await conn.execute(
+                text("""
+                    SELECT format_type(a.atttypid, a.atttypmod)
+                    FROM pg_attribute a
+                    WHERE a.attrelid = to_regclass(:table) AND a.attname = :column AND NOT a.attisdropped
+                """),
+                {"table": table, "column": column}
+            )).scalar()
+            if current is None or current == expected:
+                continue
+
+            same_dimensions = current.endswith(f"({settings.EMBEDDING_DIMENSIONS})")
+            if not same_dimensions:
+                if table not in _CACHE_TABLES:
+                    raise RuntimeError(
+                        f"Столбец {table}.{column} имеет тип {current}, а EMBEDDING_DIMENSIONS={settings.EMBEDDING_DIMENSIONS}. "
+                        f"Смена размерности требует повторного получения эмбеддингов всех документов."
+                    )
+                await conn.execute(text(f"DELETE FROM {table}"))
+
+            logger.warning(f"Смена типа {table}.{column}: {current} -> {expected}.")
+            if table == "chunks":
+                # Индексы по старому типу (opclass) несовместимы с новым столбцом
+                for index in _managed_indexes():
+                    if index == FULLTEXT_INDEX:
+                        continue
+                    await conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+            await conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE {expected} USING {column}::{expected}"))
+
+
+async def detect_pgvector_version(engine: AsyncEngine) -> Optional[Tuple[int, ...]]:
+    """Читает версию расширения vector из pg_extension. От нее зависят параметры
+    поиска: iterative_scan задается только для pgvector >= 0.8, иначе set_config
+    завершился бы ошибкой на каждом поиске с фильтром."""
+    global _pgvector_version
+    async with engine.connect() as conn:
+        extversion = (await conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'"))).scalar()
+    try:
+        _pgvector_version = tuple(int(part) for part in extversion.split("."))
+    except (AttributeError, ValueError):
+        logger.warning(f"Не удалось определить версию pgvector: {extversion!r}.")
+        _pgvector_version = None
+    if settings.VECTOR_ITERATIVE_SCAN != "off" and not _iterative_scan_supported():
+        logger.warning(
+            f"pgvector {extversion} не поддерживает iterative_scan (нужна >= 0.8): "
+            f"VECTOR_ITERATIVE_SCAN={settings.VECTOR_ITERATIVE_SCAN} не применяется."
+        )
+    return _pgvector_version
+
+
+def _iterative_scan_supported() -> bool:
+    return _pgvector_version is not None and _pgvector_version >= _ITERATIVE_SCAN_VERSION
+
+
+def search_strategy(strategy: Optional[str] = None) -> str:
+    """Стратегия поиска: явно заданная или VECTOR_SEARCH_STRATEGY."""
+    strategy = (strategy or settings.VECTOR_SEARCH_STRATEGY).lower()
+    if strategy not in SEARCH_STRATEGIES:
+        raise ValueError(f"Неизвестная стратегия поиска: {strategy!r}")
+    return strategy
+
+
+def binary_distance_sql() -> str:
+    """Расстояние Хэмминга между бинарно квантованными векторами (индекс BINARY_EMBEDDING_INDEX)."""
+    return f"{_binary_expression()} <~> binary_quantize({query_vector_sql()})"
+
+
+def ordered_scan_supported(strategy: str = STRATEGY_ANN) -> bool:
+    """True, если индекс стратегии может выдавать строки в строгом порядке расстояния
+    дальше ef_search (HNSW с iterative_scan = strict_order, pgvector >= 0.8).
+    Без этого страницы курсора после первых ef_search строк оказались бы пустыми."""
+    if strategy == STRATEGY_EXACT:
+        return True
+    index_type = "hnsw" if strategy == STRATEGY_BINARY else _index_type()
+    return index_type == "hnsw" and settings.VECTOR_ITERATIVE_SCAN != "off" and _iterative_scan_supported()
+
+
+def search_settings(
+    *, filtered: bool = False, ef_search: Optional[int] = None, probes: Optional[int] = None,
+    strategy: str = STRATEGY_ANN, candidates: int = 0, ordered: bool = False
+) -> Dict[str, str]:
+    """Параметры pgvector для одного поискового запроса.
+
+    ef_search/probes переопределяют значения из настроек: больше — выше recall,
+    но медленнее поиск. HNSW возвращает не больше ef_search строк, поэтому
+    ef_search поднимается до числа кандидатов (candidates) для пересчета.
+    Для поиска с фильтром включается итеративное сканирование индекса, чтобы
+    фильтр не «съедал» кандидатов и запрос возвращал полный limit (если версия
+    pgvector, определенная detect_pgvector_version, его поддерживает).
+    ordered=True (постраничный поиск по курсору) требует strict_order для HNSW:
+    при relaxed_order строки на границе страниц могут пропускаться.
+    Для стратегии exact индексные сканирования отключаются (точный перебор).
+    """
+    if strategy == STRATEGY_EXACT:
+        return {"enable_indexscan": "off"}
+
+    # Индекс бинарного квантования всегда HNSW
+    index_type = "hnsw" if strategy == STRATEGY_BINARY else _index_type()
+    values: Dict[str, str] = {}
+    if index_type == "hnsw":
+        values["hnsw.ef_search"] = str(max(ef_search or settings.HNSW_EF_SEARCH, candidates))
+    elif index_type == "ivfflat":
+        values["ivfflat.probes"] = str(probes or settings.IVFFLAT_PROBES)
+
+    if filtered and index_type != "none" and settings.VECTOR_ITERATIVE_SCAN != "off" and _iterative_scan_supported():
+        iterative_scan = settings.VECTOR_ITERATIVE_SCAN
+        if ordered and index_type == "hnsw":
+            iterative_scan = "strict_order"
+        values[f"{index_type}.iterative_scan"] = iterative_scan
+    return values
+
+
+def search_settings_statement(values: Dict[str, str]):
+    """Одна команда SELECT set_config(...), действующая до конца текущей транзакции."""
+    calls: List[str] = []
+    params: Dict[str, str] = {}
+    for i, (name, value) in enumerate(values.items()):
+        calls.append(f"set_config(:name_{i}, :value_{i}, true)")
+        params[f"name_{i}"] = name
+        params[f"value_{i}"] = value
+    return text(f"SELECT {', '.join(calls)}"), params
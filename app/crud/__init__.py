@@ -2,4 +2,10 @@ from .crud_company import company
 from .crud_file import file
 from .crud_message import message
 from .crud_files2 import files2
-from .crud_chunk import chunk
\ No newline at end of file
+from .crud_chunk import chunk
+from .crud_embedding import embedding
+from .crud_ingest_job import ingest_job
+from .crud_corpus_version import corpus_version
+from .crud_semantic_cache import semantic_cache
+from .crud_answer_cache import answer_cache
+from .crud_embedding_batch import embedding_batch
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from typing import Optional
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models.answer_cache import AnswerCacheEntry
+from app.schemas.answer_cache import AnswerCacheEntryCreate
+
+class CRUDAnswerCache(CRUDBase[AnswerCacheEntry, AnswerCacheEntryCreate, AnswerCacheEntryCreate]):
+
+    async def get_answer_async(
+        self, db: AsyncSession, *, platform_company_id: int, model: str,
+        prompt_hash: str, corpus_version: int, ttl: float
+    ) -> Optional[AnswerCacheEntry]:
+        """Запись для ключа (компания, модель, хэш запроса, версия корпуса) не старше ttl секунд.
+        Найденная запись отмечается как использованная (hit_count, last_hit_at)."""
+        entry = (await db.execute(
+            select(self.model).filter(
+                self.model.platform_company_id == platform_company_id,
+                self.model.model == model,
+                self.model.prompt_hash == prompt_hash,
+                self.model.corpus_version == corpus_version,
+                self.model.created_at > func.now() - timedelta(seconds=ttl)
+            )
+        )).scalars().first()
+        if entry is not None:
+            await db.execute(
+                update(self.model)
+                .where(self.model.id == entry.id)
+                .values(hit_count=self.model.hit_count + 1, last_hit_at=func.now())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return entry
+
+    async def store_async(self, db: AsyncSession, *, obj_in: AnswerCacheEntryCreate) -> None:
+        """Сохраняет ответ; если другой процесс уже сохранил ответ для этого ключа, оставляет его."""
+        await db.execute(
+            insert(self.model).values(**obj_in.model_dump()).on_conflict_do_nothing(constraint="uq_answer_cache_key")
+        )
+        await db.commit()
+
+    async def evict_async(self, db: AsyncSession, *, platform_company_id: int, corpus_version: int, ttl: float, max_entries: int) -> int:
+        """Удаляет записи компании от версий корпуса раньше corpus_version (текущей)
+        и старше ttl, затем давно не использованные записи сверх max_entries (LRU).
+        Возвращает число удаленных."""
+        result = await db.execute(
+            delete(self.model).where(
+                self.model.platform_company_id == platform_company_id,
+                (self.model.corpus_version < corpus_version) | (self.model.created_at <= func.now() - timedelta(seconds=ttl))
+            )
+        )
+        removed = result.rowcount
+        keep = (
+            select(self.model.id)
+            .filter(self.model.platform_company_id == platform_company_id)
+            .order_by(self.model.last_hit_at.desc())
+            .limit(max_entries)
+        )
+        result = await db.execute(
+            delete(self.model).where(self.model.platform_company_id == platform_company_id, self.model.id.not_in(keep))
+        )
+        await db.commit()
+        return removed + result.rowcount
+
+answer_cache = CRUDAnswerCache(AnswerCacheEntry)
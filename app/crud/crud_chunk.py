@@ -1,11 +1,23 @@
-from typing import List, Optional
-from sqlalchemy.orm import Session
-from sqlalchemy import text # Для использования SQL функций
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session, defer
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import text, bindparam, select, delete # Для использования SQL функций
+from sqlalchemy.sql.elements import TextClause
 from pgvector.sqlalchemy import Vector # Для типизации вектора
 
+from app.core import vector_index, partitions, memory_index
+from app.core.config import settings
 from app.crud.base import CRUDBase
 from app.models.chunk import Chunk
 from app.schemas.chunk import ChunkCreate, ChunkUpdate
+from app.utils import pg_copy
+
+# Колонки chunks для бинарного COPY (типы совпадают со схемой в app/core/partitions.py)
+_COPY_COLUMNS = ["id", "text", "index", "file_id", "embedding", "platform_company_id", "embedding_id"]
+
+
+def _copy_types() -> List[str]:
+    return ["int8", "text", "int8", "int8", settings.EMBEDDING_STORAGE.lower(), "int4", "int8"]
 
 class CRUDChunk(CRUDBase[Chunk, ChunkCreate, ChunkUpdate]):
     
@@ -25,40 +37,374 @@ class CRUDChunk(CRUDBase[Chunk, ChunkCreate, ChunkUpdate]):
         """Получает чанки для конкретного файла."""
         return db.query(self.model).filter(self.model.file_id == file_id).offset(skip).limit(limit).all()
 
-    def get_similar_chunks(self, db: Session, *, query_embedding: List[float], file_ids: Optional[List[int]] = None, limit: int = 5) -> List[Chunk]:
-        """Находит чанки, наиболее похожие на заданный эмбеддинг запроса.
-        Если передан список file_ids, ищет только в пределах этих файлов.
-        Если file_ids не передан или пуст, ищет по ВСЕМ чанкам.
-        Использует косинусное расстояние (<=>).
-        """
-        
+    def _rerank_candidates(self, *, strategy: str, limit: int) -> int:
+        """Сколько кандидатов отбирается по индексу для точного пересчета расстояния
+        (0 — без пересчета: порядок индекса и есть итоговый)."""
+        if strategy == vector_index.STRATEGY_BINARY:
+            return limit * max(1, settings.VECTOR_BINARY_OVERSAMPLE)
+        if strategy == vector_index.STRATEGY_ANN and vector_index.two_stage_search():
+            return max(limit, settings.VECTOR_RESCORE_CANDIDATES)
+        return 0
+
+    def _similar_chunks_query(
+        self, *, query_embedding: List[float], platform_company_id: Optional[int], file_ids: Optional[List[int]], limit: int,
+        strategy: str = vector_index.STRATEGY_ANN, with_embedding: bool = True,
+        max_distance: Optional[float] = None, after: Optional[Tuple[float, int]] = None
+    ) -> Tuple[TextClause, Dict[str, Any]]:
+        """Собирает SQL запрос поиска похожих чанков и его параметры.
+        with_embedding=False не возвращает столбец embedding (расстояние все равно
+        считается по нему). max_distance отсекает далекие чанки, after — курсор
+        (distance, id) последнего чанка предыдущей страницы."""
         params = {
             "query_vec": str(query_embedding), # pgvector ожидает вектор в виде строки
             "limit": limit
         }
         
+        query_vec = vector_index.query_vector_sql()
+        candidates = self._rerank_candidates(strategy=strategy, limit=limit)
+        columns = "id, text, index, file_id, platform_company_id" + (", embedding" if with_embedding else "")
+
         # Базовая часть запроса
-        sql_query = """
-            SELECT id, text, index, file_id, embedding 
+        sql_query = f"""
+            SELECT {columns},
+                   embedding <=> {query_vec} AS distance
             FROM chunks
             WHERE embedding IS NOT NULL 
         """
+
+        # Фильтр по ключу секционирования: планировщик оставляет одну секцию
+        # компании и ее собственный ANN индекс
+        if platform_company_id is not None:
+            sql_query += " AND platform_company_id = :platform_company_id "
+            params["platform_company_id"] = platform_company_id
         
         # Добавляем фильтр по file_id, если он предоставлен и не пуст
         if file_ids: # Проверяем, что список не None и не пустой
-            file_ids_tuple = tuple(file_ids)
             sql_query += " AND file_id IN :file_ids "
-            params["file_ids"] = file_ids_tuple
+            params["file_ids"] = list(file_ids)
         # Иначе фильтра по file_id не будет
 
-        # Добавляем сортировку и лимит
-        sql_query += " ORDER BY embedding <=> CAST(:query_vec AS vector) LIMIT :limit "
+        if max_distance is not None:
+            sql_query += f" AND embedding <=> {query_vec} <= :max_distance "
+            params["max_distance"] = max_distance
+        if after is not None:
+            # Сравнение строк (distance, id): следующая страница начинается строго после курсора
+            sql_query += f" AND (embedding <=> {query_vec}, id) > (:after_distance, :after_id) "
+            params["after_distance"], params["after_id"] = after
+
+        # Добавляем сортировку и лимит (ORDER BY по выражению индекса, чтобы он использовался)
+        if candidates:
+            # Двухэтапный поиск: кандидаты находятся по укороченному или бинарно
+            # квантованному вектору, итоговый порядок — по расстоянию между полными векторами
+            if strategy == vector_index.STRATEGY_BINARY:
+                order_by = vector_index.binary_distance_sql()
+            else:
+                order_by = vector_index.ann_distance_sql()
+            sql_query += f" ORDER BY {order_by} LIMIT :candidates "
+            sql_query = f"SELECT * FROM ({sql_query}) AS candidates ORDER BY distance LIMIT :limit"
+            params["candidates"] = candidates
+        elif strategy == vector_index.STRATEGY_EXACT:
+            sql_query += f" ORDER BY embedding <=> {query_vec} LIMIT :limit "
+        else:
+            sql_query += f" ORDER BY {vector_index.ann_distance_sql()} LIMIT :limit "
+            if file_ids:
+                # При итеративном сканировании (relaxed_order) порядок может слегка
+                # нарушаться, поэтому досортировываем найденные строки по расстоянию
+                sql_query = f"SELECT * FROM ({sql_query}) AS candidates ORDER BY distance"
         
+        if max_distance is not None or after is not None:
+            # Порог и курсор — фильтры: итеративное сканирование может нарушить порядок,
+            # а id задает однозначный порядок для курсора
+            sql_query = f"SELECT * FROM ({sql_query}) AS hits ORDER BY distance, id"
+
         query = text(sql_query)
+        if file_ids:
+            # expanding-параметр работает и с psycopg2, и с asyncpg
+            query = query.bindparams(bindparam("file_ids", expanding=True))
+        return query, params
+
+    def _hybrid_chunks_query(
+        self, *, query_embedding: List[float], query_text: str, platform_company_id: Optional[int],
+        file_ids: Optional[List[int]], limit: int
+    ) -> Tuple[TextClause, Dict[str, Any]]:
+        """Собирает SQL гибридного поиска: top-k векторного и top-k полнотекстового
+        поиска объединяются reciprocal rank fusion (sum 1 / (k + ранг)) в одном запросе."""
+        params = {
+            "query_vec": str(query_embedding),
+            "query_text": query_text,
+            "ts_config": settings.FULLTEXT_CONFIG,
+            "candidates": max(limit, settings.HYBRID_CANDIDATES),
+            "rrf_k": settings.HYBRID_RRF_K,
+            "limit": limit
+        }
+
+        # Общие фильтры обоих видов поиска
+        filters = ""
+        if platform_company_id is not None:
+            filters += " AND platform_company_id = :platform_company_id "
+            params["platform_company_id"] = platform_company_id
+        if file_ids:
+            filters += " AND file_id IN :file_ids "
+            params["file_ids"] = list(file_ids)
+
+        text_vector = vector_index.fulltext_vector_sql()
+        sql_query = f"""
+            WITH vector_hits AS (
+                SELECT id, row_number() OVER (ORDER BY distance) AS rank
+                FROM (
+                    SELECT id, embedding <=> {vector_index.query_vector_sql()} AS distance
+                    FROM chunks
+                    WHERE embedding IS NOT NULL {filters}
+                    ORDER BY {vector_index.ann_distance_sql()}
+                    LIMIT :candidates
+                ) AS nearest
+            ),
+            text_hits AS (
+                SELECT id, row_number() OVER (ORDER BY ts_rank_cd({text_vector}, query) DESC) AS rank
+                FROM chunks, websearch_to_tsquery(CAST(:ts_config AS regconfig), :query_text) AS query
+                WHERE {text_vector} @@ query {filters}
+                ORDER BY ts_rank_cd({text_vector}, query) DESC
+                LIMIT :candidates
+            ),
+            fused AS (
+                SELECT id, sum(1.0 / (:rrf_k + rank)) AS score
+                FROM (SELECT * FROM vector_hits UNION ALL SELECT * FROM text_hits) AS hits
+                GROUP BY id
+            )
+            SELECT id, text, index, file_id, platform_company_id, embedding, fused.score
+            FROM fused
+            JOIN chunks USING (id)
+            WHERE TRUE {filters}
+            ORDER BY fused.score DESC
+            LIMIT :limit
+        """
+
+        query = text(sql_query)
+        if file_ids:
+            query = query.bindparams(bindparam("file_ids", expanding=True))
+        return query, params
+
+    def get_similar_chunks(
+        self, db: Session, *, query_embedding: List[float],
+        platform_company_id: Optional[int] = None, file_ids: Optional[List[int]] = None, limit: int = 5,
+        ef_search: Optional[int] = None, probes: Optional[int] = None, strategy: Optional[str] = None
+    ) -> List[Chunk]:
+        """Находит чанки, наиболее похожие на заданный эмбеддинг запроса.
+        Если передан список file_ids, ищет только в пределах этих файлов.
+        Если file_ids не передан или пуст, ищет по ВСЕМ чанкам компании
+        platform_company_id (или всех компаний, если она не указана).
+        Использует косинусное расстояние (<=>).
+        ef_search (HNSW) / probes (IVFFlat) задают баланс recall/скорость для этого запроса.
+        strategy (ann | binary | exact, по умолчанию VECTOR_SEARCH_STRATEGY):
+        binary отбирает limit * VECTOR_BINARY_OVERSAMPLE кандидатов по расстоянию
+        Хэмминга и пересчитывает их точным <=>, exact — точный перебор без индекса.
+        """
+        strategy = vector_index.search_strategy(strategy)
+        settings_query, settings_params = vector_index.search_settings_statement(
+            vector_index.search_settings(
+                filtered=bool(file_ids), ef_search=ef_search, probes=probes,
+                strategy=strategy, candidates=self._rerank_candidates(strategy=strategy, limit=limit)
+            )
+        )
+        if settings_params:
+            db.execute(settings_query, settings_params)
+
+        query, params = self._similar_chunks_query(
+            query_embedding=query_embedding, platform_company_id=platform_company_id, file_ids=file_ids, limit=limit,
+            strategy=strategy
+        )
 
         # Выполняем "сырой" SQL запрос, но получаем ORM объекты
         results = db.query(Chunk).from_statement(query).params(**params).all()
         
         return results
 
-chunk = CRUDChunk(Chunk) 
\ No newline at end of file
+    def get_hybrid_chunks(
+        self, db: Session, *, query_embedding: List[float], query_text: str,
+        platform_company_id: Optional[int] = None, file_ids: Optional[List[int]] = None, limit: int = 5,
+        ef_search: Optional[int] = None, probes: Optional[int] = None
+    ) -> List[Chunk]:
+        """Гибридный поиск: векторное сходство с query_embedding и полнотекстовое
+        совпадение с query_text (точные артикулы, номера договоров, имена),
+        объединенные reciprocal rank fusion. Фильтры те же, что у get_similar_chunks."""
+        settings_query, settings_params = vector_index.search_settings_statement(
+            vector_index.search_settings(
+                filtered=bool(file_ids), ef_search=ef_search, probes=probes, candidates=settings.HYBRID_CANDIDATES
+            )
+        )
+        if settings_params:
+            db.execute(settings_query, settings_params)
+
+        query, params = self._hybrid_chunks_query(
+            query_embedding=query_embedding, query_text=query_text,
+            platform_company_id=platform_company_id, file_ids=file_ids, limit=limit
+        )
+        return db.query(Chunk).from_statement(query).params(**params).all()
+
+    # --- Асинхронные варианты ---
+
+    async def create_multi_async(self, db: AsyncSession, *, objs_in: List[ChunkCreate]) -> List[int]:
+        """Создает несколько чанков одним коммитом (AsyncSession). Возвращает ID чанков.
+        Перед вставкой создает недостающие секции chunks для компаний чанков (отдельным соединением).
+        Начиная с CHUNK_COPY_THRESHOLD строк чанки пишутся через COPY (copy_multi_async)."""
+        for platform_company_id in sorted({obj.platform_company_id for obj in objs_in}):
+            await partitions.ensure_company_partition(platform_company_id)
+        if len(objs_in) >= settings.CHUNK_COPY_THRESHOLD:
+            return await self.copy_multi_async(db, objs_in=objs_in)
+        db_objs = [Chunk(**obj.model_dump()) for obj in objs_in]
+        db.add_all(db_objs)
+        await db.commit()
+        return [db_obj.id for db_obj in db_objs]
+
+    async def copy_multi_async(self, db: AsyncSession, *, objs_in: List[ChunkCreate]) -> List[int]:
+        """Пишет чанки одной командой COPY chunks FROM STDIN (FORMAT binary).
+
+        ID выделяются заранее из последовательности chunks.id одним запросом,
+        векторы передаются в бинарном формате pgvector, без текстовой сериализации.
+        Секции компаний должны уже существовать (см. create_multi_async).
+        """
+        if not objs_in:
+            return []
+        ids = (await db.execute(
+            text("SELECT nextval(pg_get_serial_sequence('chunks', 'id')) FROM generate_series(1, :n)"),
+            {"n": len(objs_in)}
+        )).scalars().all()
+        rows = (
+            (chunk_id, obj.text, obj.index, obj.file_id, obj.embedding, obj.platform_company_id, obj.embedding_id)
+            for chunk_id, obj in zip(ids, objs_in)
+        )
+        # COPY выполняется на соединении asyncpg в той же транзакции, что и выделение ID
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_to_table(
+            "chunks",
+            source=pg_copy.iterate_async(pg_copy.encode_copy_binary(rows, _copy_types())),
+            columns=_COPY_COLUMNS,
+            format="binary"
+        )
+        await db.commit()
+        return list(ids)
+
+    async def remove_by_file_id_async(self, db: AsyncSession, *, file_id: int) -> int:
+        """Удаляет все чанки файла и исключает их из индекса в памяти. Возвращает число удаленных строк."""
+        result = await db.execute(
+            delete(Chunk).where(Chunk.file_id == file_id).returning(Chunk.id, Chunk.platform_company_id)
+        )
+        removed = result.all()
+        await db.commit()
+        by_company: Dict[int, List[int]] = {}
+        for chunk_id, platform_company_id in removed:
+            by_company.setdefault(platform_company_id, []).append(chunk_id)
+        for platform_company_id, chunk_ids in by_company.items():
+            await memory_index.remove_chunks(platform_company_id, chunk_ids)
+        return len(removed)
+
+    async def get_similar_chunks_async(
+        self, db: AsyncSession, *, query_embedding: List[float],
+        platform_company_id: Optional[int] = None, file_ids: Optional[List[int]] = None, limit: int = 5,
+        ef_search: Optional[int] = None, probes: Optional[int] = None, strategy: Optional[str] = None
+    ) -> List[Chunk]:
+        """Асинхронный вариант get_similar_chunks.
+        Для компаний из MEMORY_INDEX_COMPANIES с прогретым индексом в памяти ANN поиск
+        без фильтра по файлам выполняется в процессе, из БД читаются только найденные чанки."""
+        strategy = vector_index.search_strategy(strategy)
+        if strategy == vector_index.STRATEGY_ANN and platform_company_id is not None and not file_ids:
+            chunks = await self._memory_index_chunks(
+                db, query_embedding=query_embedding, platform_company_id=platform_company_id, limit=limit
+            )
+            if chunks is not None:
+                return chunks
+
+        settings_query, settings_params = vector_index.search_settings_statement(
+            vector_index.search_settings(
+                filtered=bool(file_ids), ef_search=ef_search, probes=probes,
+                strategy=strategy, candidates=self._rerank_candidates(strategy=strategy, limit=limit)
+            )
+        )
+        if settings_params:
+            # set_config(..., true) действует до конца транзакции, в которой выполняется поиск
+            await db.execute(settings_query, settings_params)
+
+        query, params = self._similar_chunks_query(
+            query_embedding=query_embedding, platform_company_id=platform_company_id, file_ids=file_ids, limit=limit,
+            strategy=strategy
+        )
+        result = await db.execute(select(Chunk).from_statement(query), params)
+        return list(result.scalars().all())
+
+    async def search_chunks_async(
+        self, db: AsyncSession, *, query_embedding: List[float], platform_company_id: int,
+        file_ids: Optional[List[int]] = None, limit: int = 10, max_distance: Optional[float] = None,
+        after: Optional[Tuple[float, int]] = None, ef_search: Optional[int] = None, probes: Optional[int] = None,
+        strategy: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Поиск без чтения эмбеддингов: строки (id, text, index, file_id, platform_company_id, distance)
+        в порядке (distance, id), не дальше max_distance и после курсора after.
+        Страницы курсора читают индекс в строгом порядке расстояния; если индекс
+        этого не умеет (pgvector < 0.8, IVFFlat), следующие страницы ищутся точным
+        перебором, иначе после первых ef_search строк они оказались бы пустыми."""
+        strategy = vector_index.search_strategy(strategy)
+        if after is not None and not vector_index.ordered_scan_supported(strategy):
+            strategy = vector_index.STRATEGY_EXACT
+        filtered = bool(file_ids) or max_distance is not None or after is not None
+        settings_query, settings_params = vector_index.search_settings_statement(
+            vector_index.search_settings(
+                filtered=filtered, ef_search=ef_search, probes=probes,
+                strategy=strategy, candidates=self._rerank_candidates(strategy=strategy, limit=limit), ordered=True
+            )
+        )
+        if settings_params:
+            await db.execute(settings_query, settings_params)
+
+        query, params = self._similar_chunks_query(
+            query_embedding=query_embedding, platform_company_id=platform_company_id, file_ids=file_ids, limit=limit,
+            strategy=strategy, with_embedding=False, max_distance=max_distance, after=after
+        )
+        result = await db.execute(query, params)
+        return list(result.mappings().all())
+
+    async def _memory_index_chunks(
+        self, db: AsyncSession, *, query_embedding: List[float], platform_company_id: int, limit: int
+    ) -> Optional[List[Chunk]]:
+        """Чанки из индекса в памяти или None, если индекс компании не прогрет
+        или в нем осталось меньше limit живых чанков среди найденных."""
+        # Запас на чанки, удаленные из БД, но еще не исключенные из индекса
+        ids = await memory_index.search(platform_company_id, query_embedding, limit * 2)
+        if ids is None:
+            return None
+        if not ids:
+            return []
+        # Эмбеддинги не читаются: для ответа нужны только текст и метаданные чанков
+        result = await db.execute(
+            select(Chunk)
+            .options(defer(Chunk.embedding))
+            .where(Chunk.platform_company_id == platform_company_id, Chunk.id.in_(ids))
+        )
+        by_id = {chunk.id: chunk for chunk in result.scalars().all()}
+        if len(by_id) < limit and len(by_id) < len(ids):
+            # Часть найденных чанков уже удалена: ближайшие живые могут быть вне индекса
+            return None
+        return [by_id[chunk_id] for chunk_id in ids if chunk_id in by_id][:limit]
+
+    async def get_hybrid_chunks_async(
+        self, db: AsyncSession, *, query_embedding: List[float], query_text: str,
+        platform_company_id: Optional[int] = None, file_ids: Optional[List[int]] = None, limit: int = 5,
+        ef_search: Optional[int] = None, probes: Optional[int] = None
+    ) -> List[Chunk]:
+        """Асинхронный вариант get_hybrid_chunks (оба вида поиска — один запрос к БД)."""
+        settings_query, settings_params = vector_index.search_settings_statement(
+            vector_index.search_settings(
+                filtered=bool(file_ids), ef_search=ef_search, probes=probes, candidates=settings.HYBRID_CANDIDATES
+            )
+        )
+        if settings_params:
+            await db.execute(settings_query, settings_params)
+
+        query, params = self._hybrid_chunks_query(
+            query_embedding=query_embedding, query_text=query_text,
+            platform_company_id=platform_company_id, file_ids=file_ids, limit=limit
+        )
+        result = await db.execute(select(Chunk).from_statement(query), params)
+        return list(result.scalars().all())
+
+
+chunk = CRUDChunk(Chunk)
@@ -1,9 +1,13 @@
 from typing import Optional
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core import company_cache
+from app.core.company_cache import CachedCompany
 from app.crud.base import CRUDBase
 from app.models.company import Company
-from app.schemas.company import CompanyCreate, CompanyUpdate
+from app.schemas.company import CompanyCreate, CompanyUpdate, RetrievalProfile
 
 class CRUDCompany(CRUDBase[Company, CompanyCreate, CompanyUpdate]):
     def get_by_platform_id(self, db: Session, *, platform_company_id: int) -> Optional[Company]:
@@ -17,7 +21,9 @@ class CRUDCompany(CRUDBase[Company, CompanyCreate, CompanyUpdate]):
             openai_vector_store_id=obj_in.openai_vector_store_id
         )
         db.add(db_obj)
+        company_cache.notify(db, platform_company_id=db_obj.platform_company_id)
         db.commit()
+        company_cache.cache.invalidate(db_obj.platform_company_id)
         db.refresh(db_obj)
         return db_obj
 
@@ -26,8 +32,57 @@ class CRUDCompany(CRUDBase[Company, CompanyCreate, CompanyUpdate]):
     def update_vector_store_id(self, db: Session, *, db_obj: Company, vector_store_id: str) -> Company:
         db_obj.openai_vector_store_id = vector_store_id
         db.add(db_obj)
+        company_cache.notify(db, platform_company_id=db_obj.platform_company_id)
         db.commit()
+        company_cache.cache.invalidate(db_obj.platform_company_id)
         db.refresh(db_obj)
         return db_obj
 
+    # --- Асинхронные варианты ---
+    async def get_by_platform_id_async(self, db: AsyncSession, *, platform_company_id: int) -> Optional[Company]:
+        result = await db.execute(select(self.model).filter(self.model.platform_company_id == platform_company_id))
+        return result.scalars().first()
+
+    async def get_cached_async(self, db: AsyncSession, *, platform_company_id: int) -> Optional[CachedCompany]:
+        """Компания из кэша процесса (company_cache); запрос к БД — только при промахе.
+        Возвращает снимок (id, platform_company_id, openai_vector_store_id), а не ORM-объект."""
+        cached = company_cache.cache.get(platform_company_id)
+        if cached is not None:
+            return cached
+        db_obj = await self.get_by_platform_id_async(db, platform_company_id=platform_company_id)
+        if db_obj is None:
+            return None
+        cached = CachedCompany.from_model(db_obj)
+        company_cache.cache.put(cached)
+        return cached
+
+    async def create_async(self, db: AsyncSession, *, obj_in: CompanyCreate) -> Company:
+        db_obj = self.model(**obj_in.model_dump())
+        db.add(db_obj)
+        await company_cache.notify_async(db, platform_company_id=db_obj.platform_company_id)
+        await db.commit()
+        company_cache.cache.invalidate(db_obj.platform_company_id)
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update_vector_store_id_async(self, db: AsyncSession, *, db_obj: Company, vector_store_id: str) -> Company:
+        db_obj.openai_vector_store_id = vector_store_id
+        db.add(db_obj)
+        await company_cache.notify_async(db, platform_company_id=db_obj.platform_company_id)
+        await db.commit()
+        company_cache.cache.invalidate(db_obj.platform_company_id)
+        await db.refresh(db_obj)
+        return db_obj
+
+    async def update_retrieval_profile_async(self, db: AsyncSession, *, db_obj: Company, profile: RetrievalProfile) -> Company:
+        """Заменяет профиль поиска компании целиком (None — значение по умолчанию)."""
+        for name, value in profile.model_dump().items():
+            setattr(db_obj, name, value)
+        db.add(db_obj)
+        await company_cache.notify_async(db, platform_company_id=db_obj.platform_company_id)
+        await db.commit()
+        company_cache.cache.invalidate(db_obj.platform_company_id)
+        await db.refresh(db_obj)
+        return db_obj
+
 company = CRUDCompany(Company) 
\ No newline at end of file
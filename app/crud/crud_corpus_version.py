@@ -0,0 +1,35 @@
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models.corpus_version import CorpusVersion
+
+# Корпус чанков компании в pgvector (/filespg, /messagespg)
+SCOPE_CHUNKS = "chunks"
+# Файлы компании в векторном хранилище OpenAI (/files, /messages)
+SCOPE_FILES = "files"
+
+class CRUDCorpusVersion(CRUDBase[CorpusVersion, CorpusVersion, CorpusVersion]):
+
+    async def get_version_async(self, db: AsyncSession, *, platform_company_id: int, scope: str) -> int:
+        """Текущая версия корпуса компании (0, если корпус еще не менялся)."""
+        version = (await db.execute(
+            select(self.model.version).filter(
+                self.model.platform_company_id == platform_company_id, self.model.scope == scope
+            )
+        )).scalar()
+        return version or 0
+
+    async def bump_async(self, db: AsyncSession, *, platform_company_id: int, scope: str) -> int:
+        """Увеличивает версию корпуса компании и возвращает новую версию."""
+        stmt = insert(self.model).values(platform_company_id=platform_company_id, scope=scope, version=1)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[self.model.platform_company_id, self.model.scope],
+            set_={"version": self.model.version + 1, "updated_at": stmt.excluded.updated_at}
+        ).returning(self.model.version)
+        version = (await db.execute(stmt)).scalar()
+        await db.commit()
+        return version
+
+corpus_version = CRUDCorpusVersion(CorpusVersion)
@@ -0,0 +1,37 @@
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models.embedding import Embedding
+from app.schemas.embedding import EmbeddingCreate
+
+class CRUDEmbedding(CRUDBase[Embedding, EmbeddingCreate, EmbeddingCreate]):
+
+    async def get_by_hashes_async(self, db: AsyncSession, *, content_hashes: List[str], model: str) -> Dict[str, Embedding]:
+        """Возвращает сохраненные эмбеддинги по хэшам текста для модели: {content_hash: Embedding}."""
+        if not content_hashes:
+            return {}
+        result = await db.execute(
+            select(self.model).filter(self.model.content_hash.in_(set(content_hashes)), self.model.model == model)
+        )
+        return {obj.content_hash: obj for obj in result.scalars().all()}
+
+    async def upsert_multi_async(self, db: AsyncSession, *, objs_in: List[EmbeddingCreate]) -> Dict[str, int]:
+        """Сохраняет эмбеддинги, пропуская уже существующие (content_hash, model).
+        Возвращает {content_hash: id} для всех переданных эмбеддингов."""
+        if not objs_in:
+            return {}
+        stmt = insert(self.model).values([obj.model_dump() for obj in objs_in])
+        # DO UPDATE без фактических изменений, чтобы RETURNING вернул id и для уже существующих строк
+        stmt = stmt.on_conflict_do_update(
+            constraint="uq_embeddings_content_hash_model",
+            set_={"model": stmt.excluded.model}
+        ).returning(self.model.id, self.model.content_hash)
+        rows = (await db.execute(stmt)).all()
+        await db.commit()
+        return {row.content_hash: row.id for row in rows}
+
+embedding = CRUDEmbedding(Embedding)
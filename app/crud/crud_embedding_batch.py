@@ -0,0 +1,29 @@
+from typing import List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models.embedding_batch import EmbeddingBatch
+
+# Статусы пакета, по которым еще есть работа
+UNFINISHED_STATUSES = ("created", "submitted", "completed")
+
+class CRUDEmbeddingBatch(CRUDBase[EmbeddingBatch, EmbeddingBatch, EmbeddingBatch]):
+
+    def _scope(self, stmt, *, platform_company_id: Optional[int], model: str):
+        company_filter = (
+            self.model.platform_company_id.is_(None) if platform_company_id is None
+            else self.model.platform_company_id == platform_company_id
+        )
+        return stmt.filter(company_filter, self.model.model == model)
+
+    async def get_unfinished_async(
+        self, db: AsyncSession, *, platform_company_id: Optional[int], model: str
+    ) -> List[EmbeddingBatch]:
+        """Незавершенные пакеты переиндексирования (для продолжения после перезапуска)."""
+        stmt = self._scope(select(self.model), platform_company_id=platform_company_id, model=model)
+        result = await db.execute(stmt.filter(self.model.status.in_(UNFINISHED_STATUSES)).order_by(self.model.id))
+        return list(result.scalars().all())
+
+embedding_batch = CRUDEmbeddingBatch(EmbeddingBatch)
@@ -1,5 +1,7 @@
-from typing import Optional, List
+from typing import Dict, Optional, List, Set, Tuple
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.crud.base import CRUDBase
 from app.models.file import File
@@ -26,4 +28,43 @@ class CRUDFile(CRUDBase[File, FileCreate, FileUpdate]):
         db.refresh(db_obj)
         return db_obj
 
+    # --- Асинхронные варианты ---
+    async def get_by_platform_ids_async(self, db: AsyncSession, *, platform_company_id: int, platform_file_id: int) -> Optional[File]:
+        result = await db.execute(
+            select(self.model)
+            .filter(self.model.platform_company_id == platform_company_id, self.model.platform_file_id == platform_file_id)
+        )
+        return result.scalars().first()
+
+    async def get_by_platform_file_ids_async(
+        self, db: AsyncSession, *, platform_company_id: int, platform_file_ids: List[int]
+    ) -> Dict[int, File]:
+        """Файлы компании по списку platform_file_id: {platform_file_id: File}."""
+        if not platform_file_ids:
+            return {}
+        result = await db.execute(
+            select(self.model)
+            .filter(self.model.platform_company_id == platform_company_id, self.model.platform_file_id.in_(set(platform_file_ids)))
+        )
+        return {obj.platform_file_id: obj for obj in result.scalars().all()}
+
+    async def get_referenced_openai_file_ids_async(self, db: AsyncSession, *, openai_file_ids: Set[str]) -> Set[str]:
+        """Те из openai_file_ids, на которые ссылаются записи files."""
+        if not openai_file_ids:
+            return set()
+        result = await db.execute(
+            select(self.model.openai_file_id).filter(self.model.openai_file_id.in_(openai_file_ids))
+        )
+        return set(result.scalars().all())
+
+    async def save_multi_async(
+        self, db: AsyncSession, *, updates: List[Tuple[File, FileUpdate]], objs_in: List[FileCreate]
+    ) -> None:
+        """Обновляет и создает записи файлов одной транзакцией."""
+        for db_obj, obj_in in updates:
+            for field, value in obj_in.model_dump(exclude_unset=True).items():
+                setattr(db_obj, field, value)
+        db.add_all([self.model(**obj_in.model_dump()) for obj_in in objs_in])
+        await db.commit()
+
 file = CRUDFile(File) 
\ No newline at end of file
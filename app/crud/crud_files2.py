@@ -1,3 +1,7 @@
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from app.crud.base import CRUDBase
 from app.models.files2 import Files2 # SQLAlchemy модель
 # Переименовываем импортируемую Pydantic схему, чтобы избежать конфликта
@@ -5,7 +9,13 @@ from app.schemas.files2 import Files2Create, Files2 as Files2Schema
 
 # Используем модель Files2 и схему Files2Schema в качестве UpdateSchemaType
 class CRUDFiles2(CRUDBase[Files2, Files2Create, Files2Schema]):
-    pass
+
+    async def get_by_document_id_async(self, db: AsyncSession, *, platform_company_id: int, document_id: str) -> Optional[Files2]:
+        result = await db.execute(
+            select(self.model)
+            .filter(self.model.platform_company_id == platform_company_id, self.model.document_id == document_id)
+        )
+        return result.scalars().first()
 
 # Передаем SQLAlchemy модель в конструктор
 files2 = CRUDFiles2(Files2) 
\ No newline at end of file
@@ -0,0 +1,106 @@
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, update, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models.ingest_job import IngestJob
+from app.schemas.ingest_job import IngestJobCreate
+
+class CRUDIngestJob(CRUDBase[IngestJob, IngestJobCreate, IngestJobCreate]):
+
+    async def claim_next_async(self, db: AsyncSession, *, worker_id: str) -> Optional[IngestJob]:
+        """Атомарно забирает следующую готовую к запуску задачу.
+        FOR UPDATE SKIP LOCKED позволяет воркерам разных процессов не мешать друг другу."""
+        next_id = (
+            select(self.model.id)
+            .filter(self.model.status == "queued", self.model.run_after <= func.now())
+            .order_by(self.model.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(self.model)
+            .where(self.model.id == next_id)
+            .values(
+                status="running",
+                attempts=self.model.attempts + 1,
+                locked_by=worker_id,
+                locked_at=func.now(),
+                started_at=func.coalesce(self.model.started_at, func.now())
+            )
+            .returning(self.model)
+            .execution_options(synchronize_session=False)
+        )
+        job = (await db.execute(stmt)).scalars().first()
+        await db.commit()
+        return job
+
+    async def update_progress_async(self, db: AsyncSession, *, job_id: int, worker_id: Optional[str] = None, **fields: Any) -> bool:
+        """Обновляет счетчики прогресса / checkpoint задачи. С worker_id обновление
+        выполняется, только пока задача в running у этого воркера (ее не вернули
+        в очередь как зависшую и не отдали другому). Возвращает, обновлена ли задача."""
+        if not fields:
+            return True
+        stmt = update(self.model).where(self.model.id == job_id)
+        if worker_id is not None:
+            stmt = stmt.where(self.model.status == "running", self.model.locked_by == worker_id)
+        result = await db.execute(stmt.values(**fields).execution_options(synchronize_session=False))
+        await db.commit()
+        return result.rowcount > 0
+
+    async def heartbeat_async(self, db: AsyncSession, *, job_id: int, worker_id: str) -> bool:
+        """Продлевает locked_at выполняемой задачи. False — задача воркеру больше не принадлежит."""
+        return await self.update_progress_async(db, job_id=job_id, worker_id=worker_id, locked_at=func.now())
+
+    async def mark_succeeded_async(self, db: AsyncSession, *, job: IngestJob, result: Dict[str, Any]) -> bool:
+        return await self.update_progress_async(
+            db, job_id=job.id, worker_id=job.locked_by,
+            status="succeeded", result=result, error=None, locked_by=None, finished_at=func.now()
+        )
+
+    async def mark_failed_async(self, db: AsyncSession, *, job: IngestJob, error: str, retry_delay: Optional[float]) -> bool:
+        """Возвращает задачу в очередь с задержкой retry_delay (секунды) или,
+        если retry_delay=None, завершает ее со статусом failed.
+        Как и mark_succeeded_async, действует, только пока задача у воркера job.locked_by."""
+        if retry_delay is None:
+            return await self.update_progress_async(
+                db, job_id=job.id, worker_id=job.locked_by, status="failed", error=error, locked_by=None, finished_at=func.now()
+            )
+        return await self.update_progress_async(
+            db, job_id=job.id, worker_id=job.locked_by, status="queued", error=error, locked_by=None,
+            run_after=func.now() + timedelta(seconds=retry_delay)
+        )
+
+    async def has_pending_for_file_async(self, db: AsyncSession, *, platform_company_id: int, platform_file_id: int) -> bool:
+        """True, если в очереди или в работе есть задача загрузки файла platform_file_id
+        компании (одиночная — payload.platform_file_id, массовая — элемент payload.files)."""
+        stmt = select(self.model.id).filter(
+            self.model.platform_company_id == platform_company_id,
+            self.model.status.in_(("queued", "running")),
+            (self.model.payload["platform_file_id"].astext == str(platform_file_id))
+            | self.model.payload["files"].contains([{"platform_file_id": platform_file_id}])
+        ).limit(1)
+        return (await db.execute(stmt)).first() is not None
+
+    async def requeue_stale_async(self, db: AsyncSession, *, stale_after: float) -> int:
+        """Возвращает в очередь задачи, «зависшие» в running (например, после падения процесса).
+        Задачи, исчерпавшие max_attempts, завершаются со статусом failed."""
+        exhausted = self.model.attempts >= self.model.max_attempts
+        result = await db.execute(
+            update(self.model)
+            .where(self.model.status == "running", self.model.locked_at < func.now() - timedelta(seconds=stale_after))
+            .values(
+                status=case((exhausted, "failed"), else_="queued"),
+                error=case((exhausted, "Задача зависла в последней попытке"), else_=self.model.error),
+                finished_at=case((exhausted, func.now()), else_=self.model.finished_at),
+                locked_by=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
+
+ingest_job = CRUDIngestJob(IngestJob)
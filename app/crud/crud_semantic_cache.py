@@ -0,0 +1,65 @@
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.crud.base import CRUDBase
+from app.models.semantic_cache import SemanticCacheEntry
+from app.schemas.semantic_cache import SemanticCacheEntryCreate
+
+class CRUDSemanticCache(CRUDBase[SemanticCacheEntry, SemanticCacheEntryCreate, SemanticCacheEntryCreate]):
+
+    async def find_similar_async(
+        self, db: AsyncSession, *, platform_company_id: int, corpus_version: int,
+        query_embedding: List[float], max_distance: float, ttl: float
+    ) -> Optional[SemanticCacheEntry]:
+        """Ближайшая по косинусному расстоянию запись компании не дальше max_distance,
+        созданная для текущей версии корпуса и не старше ttl секунд.
+        Найденная запись отмечается как использованная (hit_count, last_hit_at)."""
+        distance = self.model.query_embedding.cosine_distance(query_embedding)
+        entry = (await db.execute(
+            select(self.model)
+            .filter(
+                self.model.platform_company_id == platform_company_id,
+                self.model.corpus_version == corpus_version,
+                self.model.created_at > func.now() - timedelta(seconds=ttl),
+                distance <= max_distance
+            )
+            .order_by(distance)
+            .limit(1)
+        )).scalars().first()
+        if entry is not None:
+            await db.execute(
+                update(self.model)
+                .where(self.model.id == entry.id)
+                .values(hit_count=self.model.hit_count + 1, last_hit_at=func.now())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+        return entry
+
+    async def evict_async(self, db: AsyncSession, *, platform_company_id: int, corpus_version: int, ttl: float, max_entries: int) -> int:
+        """Удаляет записи компании от версий корпуса раньше corpus_version (текущей)
+        и старше ttl, затем давно не использованные записи сверх max_entries (LRU).
+        Возвращает число удаленных."""
+        result = await db.execute(
+            delete(self.model).where(
+                self.model.platform_company_id == platform_company_id,
+                (self.model.corpus_version < corpus_version) | (self.model.created_at <= func.now() - timedelta(seconds=ttl))
+            )
+        )
+        removed = result.rowcount
+        keep = (
+            select(self.model.id)
+            .filter(self.model.platform_company_id == platform_company_id)
+            .order_by(self.model.last_hit_at.desc())
+            .limit(max_entries)
+        )
+        result = await db.execute(
+            delete(self.model).where(self.model.platform_company_id == platform_company_id, self.model.id.not_in(keep))
+        )
+        await db.commit()
+        return removed + result.rowcount
+
+semantic_cache = CRUDSemanticCache(SemanticCacheEntry)
@@ -1,8 +1,12 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
+from app.core import company_cache, db_init, memory_index
+from app.services import context_packer, jobs
 from app.routes.api import api_router
+from app.utils import openai_client
 import logging
 
 # Настройка логирования
@@ -10,9 +14,27 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    context_packer.load_tokenizer()
+    await db_init.init_db()
+    if settings.INGEST_WORKERS_ENABLED:
+        jobs.start_workers()
+    memory_index.start_refresh()
+    company_cache.start_listener()
+    yield
+    await company_cache.stop_listener()
+    await memory_index.stop_refresh()
+    await jobs.stop_workers()
+    await db_init.shutdown_db()
+    # Закрываем общие пулы соединений OpenAI при остановке
+    await openai_client.close_openai_clients()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Настройка CORS
@@ -40,5 +62,20 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 async def read_root():
     return {"message": f"Welcome to {settings.PROJECT_NAME}"}
 
+@app.get("/openai/pool", tags=["Root"])
+async def read_openai_pool_stats():
+    # Состояние пулов соединений общих клиентов OpenAI
+    return openai_client.get_connection_pool_stats()
+
+@app.get("/openai/rate-limits", tags=["Root"])
+async def read_openai_rate_limit_stats():
+    # Лимиты моделей OpenAI и очередь планировщика запросов
+    return openai_client.get_rate_limit_stats()
+
+@app.get("/companies/cache", tags=["Root"])
+async def read_company_cache_stats():
+    # Кэш компаний текущего процесса
+    return company_cache.cache.stats()
+
 # Здесь можно добавить обработчики исключений, если нужно
 # Например, для кастомных HTTP исключений 
\ No newline at end of file
@@ -4,5 +4,11 @@ from .base import Base # Базовый класс для моделей
 from .company import Company
 from .file import File
 from .files2 import Files2
+from .embedding import Embedding
 from .chunk import Chunk
-from .message import Message 
\ No newline at end of file
+from .message import Message
+from .ingest_job import IngestJob
+from .corpus_version import CorpusVersion
+from .semantic_cache import SemanticCacheEntry
+from .answer_cache import AnswerCacheEntry
+from .embedding_batch import EmbeddingBatch
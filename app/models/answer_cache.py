@@ -0,0 +1,22 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime, UniqueConstraint, func
+from app.core.database import Base
+
+class AnswerCacheEntry(Base):
+    """Ответ AI на запрос /messages/ (file_search по хранилищу компании),
+    переиспользуемый для того же нормализованного запроса к той же версии файлов."""
+    __tablename__ = "answer_cache"
+    __table_args__ = (
+        UniqueConstraint("platform_company_id", "model", "prompt_hash", "corpus_version", name="uq_answer_cache_key"),
+    )
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), server_default=func.now()) # Для вытеснения LRU
+    hit_count = Column(Integer, nullable=False, default=0)
+    platform_company_id = Column(Integer, nullable=False, index=True)
+    # Версия корпуса files компании на момент запроса; запись с другой версией недействительна
+    corpus_version = Column(BigInteger, nullable=False)
+    model = Column(Text, nullable=False) # Модель и параметры file_search (openai_client.file_search_cache_key)
+    prompt_hash = Column(String(64), nullable=False) # sha256 нормализованного запроса
+    prompt = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
@@ -1,8 +1,7 @@
-from sqlalchemy import Column, BigInteger, Text, ForeignKey
+from sqlalchemy import Column, BigInteger, Integer, Text, ForeignKey
 from sqlalchemy.orm import relationship
-from pgvector.sqlalchemy import Vector # Импортируем тип Vector
-
 from app.core.database import Base
+from app.core.vector_index import embedding_column_type
 
 class Chunk(Base):
     __tablename__ = "chunks"
@@ -11,7 +10,14 @@ class Chunk(Base):
     text = Column(Text, nullable=False)
     index = Column(BigInteger, nullable=False) # Порядковый номер чанка (int8)
     file_id = Column(BigInteger, ForeignKey("files2.id"), nullable=False) # Связь с файлом (int8)
-    embedding = Column(Vector(1536), nullable=True) # Векторное представление (1536 измерений)
+    embedding = Column(embedding_column_type(), nullable=True) # Векторное представление (EMBEDDING_STORAGE(EMBEDDING_DIMENSIONS))
+    # Ссылка на общий эмбеддинг в таблице embeddings. Копия вектора остается в
+    # chunks.embedding, т.к. по ней построены ANN индексы секций компаний
+    embedding_id = Column(BigInteger, ForeignKey("embeddings.id"), nullable=True)
+    # Полнотекстовый GIN индекс по to_tsvector(FULLTEXT_CONFIG, text) строится
+    # в фоне (app/core/vector_index.py) и используется только в SQL гибридного поиска
+    # Ключ секционирования таблицы chunks (см. app/core/partitions.py)
+    platform_company_id = Column(Integer, nullable=False, default=0)
 
     # Опционально: связь для удобного доступа к файлу из чанка
     file = relationship("Files2") 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, func, Text
+from sqlalchemy import Column, Integer, String, DateTime, func, Text, Float
 from sqlalchemy.orm import relationship
 
 from app.core.database import Base
@@ -11,6 +11,14 @@ class Company(Base):
     platform_company_id = Column(Integer, unique=True, index=True, nullable=False)
     openai_vector_store_id = Column(Text, nullable=True) # ID векторной базы в OpenAI
 
+    # Профиль поиска file_search (NULL — значение по умолчанию OpenAI / FILE_SEARCH_MODEL)
+    retrieval_model = Column(Text, nullable=True) # Модель ответов /messages/
+    max_num_results = Column(Integer, nullable=True) # Фрагментов, которые file_search передает модели (1-50)
+    score_threshold = Column(Float, nullable=True) # Минимальная релевантность фрагмента (0-1)
+    # Статическая нарезка файлов при добавлении в хранилище (действует для новых файлов)
+    chunk_max_tokens = Column(Integer, nullable=True) # 100-4096
+    chunk_overlap_tokens = Column(Integer, nullable=True) # Не больше половины chunk_max_tokens
+
     # Отношения (если нужны в будущем)
     # files = relationship("File", back_populates="company")
     # messages = relationship("Message", back_populates="company") 
\ No newline at end of file
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, BigInteger, Integer, Text, DateTime, func
+
+from app.core.database import Base
+
+class CorpusVersion(Base):
+    """Версия корпуса документов компании. Увеличивается при каждом изменении
+    данных, по которым строятся ответы; кэши ответов привязаны к версии."""
+    __tablename__ = "corpus_versions"
+
+    platform_company_id = Column(Integer, primary_key=True)
+    scope = Column(Text, primary_key=True) # Корпус: chunks (pgvector), files (векторное хранилище OpenAI)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, BigInteger, String, Text, DateTime, UniqueConstraint, func
+from app.core.database import Base
+from app.core.vector_index import embedding_column_type
+
+class Embedding(Base):
+    """Эмбеддинг, адресуемый содержимым: один вектор на (sha256 нормализованного текста, модель)."""
+    __tablename__ = "embeddings"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    content_hash = Column(String(64), nullable=False) # sha256 нормализованного текста (hex)
+    model = Column(Text, nullable=False) # Модель, которой получен эмбеддинг
+    embedding = Column(embedding_column_type(), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("content_hash", "model", name="uq_embeddings_content_hash_model"),
+    )
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, BigInteger, Boolean, Integer, Text, DateTime, func
+
+from app.core.database import Base
+
+class EmbeddingBatch(Base):
+    """Пакет Batch API OpenAI с эмбеддингами чанков из диапазона ID
+    (фоновое переиндексирование, см. app/services/embedding_backfill.py)."""
+    __tablename__ = "embedding_batches"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    status = Column(Text, nullable=False, default="created", index=True) # created | submitted | completed | applied | failed
+    platform_company_id = Column(Integer, nullable=True) # None — чанки всех компаний
+    model = Column(Text, nullable=False) # Модель эмбеддингов
+    reembed = Column(Boolean, nullable=False, default=False) # Пересчитывать и эмбеддинги другой модели, а не только отсутствующие
+
+    # Диапазон ID чанков (включительно); чанки заново выбираются по нему на каждом шаге
+    first_chunk_id = Column(BigInteger, nullable=False)
+    last_chunk_id = Column(BigInteger, nullable=False)
+    requests = Column(Integer, nullable=False, default=0) # Уникальных текстов, отправленных в Batch API
+
+    openai_input_file_id = Column(Text, nullable=True)
+    openai_batch_id = Column(Text, nullable=True)
+    openai_output_file_id = Column(Text, nullable=True)
+    openai_error_file_id = Column(Text, nullable=True)
+
+    attempts = Column(Integer, nullable=False, default=0) # Отправок в Batch API
+    embedded = Column(Integer, nullable=False, default=0) # Эмбеддингов получено из результатов
+    applied_chunks = Column(Integer, nullable=False, default=0) # Чанков обновлено
+    error = Column(Text, nullable=True)
@@ -13,6 +13,8 @@ class File(Base):
     platform_file_id = Column(Integer, index=True, nullable=False) # ID файла на платформе
     file_text = Column(Text, nullable=False) # Содержимое файла
     openai_file_id = Column(Text, nullable=True) # ID файла в OpenAI
+    # sha256 file_text (hashing.exact_hash); записывается вместе с openai_file_id после успешной загрузки
+    content_hash = Column(String(64), nullable=True)
 
     # Отношение (если нужно в будущем)
     # company = relationship("Company", back_populates="files") 
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, Text
+from sqlalchemy import Column, BigInteger, Integer, String, Text, Index, text as sql_text
 from app.core.database import Base
 
 class Files2(Base):
@@ -6,4 +6,16 @@ class Files2(Base):
 
     # Используем BigInteger для соответствия int8 в PostgreSQL
     id = Column(BigInteger, primary_key=True, index=True)
-    text = Column(Text, nullable=False) 
\ No newline at end of file
+    text = Column(Text, nullable=False)
+    platform_company_id = Column(Integer, index=True, nullable=True) # Компания-владелец (NULL у старых файлов)
+    document_id = Column(Text, nullable=True) # ID документа у вызывающей стороны (повторная загрузка обновляет запись)
+    # sha256 text (hashing.exact_hash); записывается после сохранения всех чанков,
+    # поэтому совпадение хэша означает, что документ уже полностью обработан
+    content_hash = Column(String(64), nullable=True)
+
+    __table_args__ = (
+        Index(
+            "uq_files2_company_document", "platform_company_id", "document_id",
+            unique=True, postgresql_where=sql_text("document_id IS NOT NULL")
+        ),
+    ) 
\ No newline at end of file
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, BigInteger, Integer, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.core.database import Base
+
+class IngestJob(Base):
+    """Задача фоновой загрузки документа (очередь в Postgres, см. app/services/jobs.py)."""
+    __tablename__ = "ingest_jobs"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    kind = Column(Text, nullable=False) # Тип задачи: pg_process | openai_file
+    status = Column(Text, nullable=False, default="queued", index=True) # queued | running | succeeded | failed
+    platform_company_id = Column(Integer, nullable=True, index=True)
+    payload = Column(JSONB, nullable=False) # Параметры задачи (текст документа и т.п.)
+    checkpoint = Column(JSONB, nullable=True) # Состояние для продолжения после повтора (например, ID созданного файла)
+    result = Column(JSONB, nullable=True)
+    error = Column(Text, nullable=True) # Последняя ошибка
+
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), server_default=func.now()) # Не запускать раньше (задержка повтора)
+    locked_by = Column(Text, nullable=True) # Воркер, выполняющий задачу
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Прогресс обработки чанков
+    chunks_total = Column(Integer, nullable=False, default=0)
+    chunks_embedded = Column(Integer, nullable=False, default=0)
+    chunks_stored = Column(Integer, nullable=False, default=0)
+    chunks_failed = Column(Integer, nullable=False, default=0)
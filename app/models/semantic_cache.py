@@ -0,0 +1,21 @@
+from sqlalchemy import Column, BigInteger, Integer, Text, DateTime, func
+from sqlalchemy.dialects.postgresql import ARRAY
+from app.core.database import Base
+from app.core.vector_index import embedding_column_type
+
+class SemanticCacheEntry(Base):
+    """Ответ AI на запрос к чанкам компании, переиспользуемый для близких по смыслу запросов."""
+    __tablename__ = "semantic_cache"
+
+    id = Column(BigInteger, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), server_default=func.now()) # Для вытеснения LRU
+    hit_count = Column(Integer, nullable=False, default=0)
+    platform_company_id = Column(Integer, nullable=False, index=True)
+    # Версия корпуса chunks компании на момент поиска; запись с другой версией недействительна
+    corpus_version = Column(BigInteger, nullable=False)
+    query_text = Column(Text, nullable=False)
+    query_embedding = Column(embedding_column_type(), nullable=False)
+    answer = Column(Text, nullable=False)
+    source_chunk_ids = Column(ARRAY(BigInteger), nullable=False) # Чанки, из которых собран контекст
+    source_file_ids = Column(ARRAY(BigInteger), nullable=False)
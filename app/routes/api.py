@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.routes.endpoints import files, messages, filespg, messagespg
+from app.routes.endpoints import files, messages, filespg, messagespg, jobs, companies, search
 
 api_router = APIRouter()
 
@@ -8,4 +8,7 @@ api_router = APIRouter()
 api_router.include_router(files.router, prefix="/files", tags=["files"])
 api_router.include_router(messages.router, prefix="/messages", tags=["messages"]) 
 api_router.include_router(filespg.router, prefix="/filespg", tags=["filespg"]) 
-api_router.include_router(messagespg.router, prefix="/messagespg", tags=["messagespg"]) 
\ No newline at end of file
+api_router.include_router(messagespg.router, prefix="/messagespg", tags=["messagespg"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
+api_router.include_router(companies.router, prefix="/companies", tags=["companies"])
+api_router.include_router(search.router, prefix="/search", tags=["search"])
@@ -0,0 +1,52 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Path, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_async_db
+from app import crud, schemas
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+async def _get_company(db: AsyncSession, platform_company_id: int):
+    company = await crud.company.get_by_platform_id_async(db, platform_company_id=platform_company_id)
+    if not company:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Компания с ID {platform_company_id} не найдена"
+        )
+    return company
+
+
+@router.get(
+    "/{platform_company_id}/retrieval-profile",
+    response_model=schemas.company.RetrievalProfile,
+    summary="Профиль поиска компании (file_search и нарезка файлов)"
+)
+async def get_retrieval_profile(
+    platform_company_id: int = Path(..., description="ID компании на платформе"),
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.company.RetrievalProfile:
+    company = await _get_company(db, platform_company_id)
+    return schemas.company.RetrievalProfile.model_validate(company, from_attributes=True)
+
+
+@router.put(
+    "/{platform_company_id}/retrieval-profile",
+    response_model=schemas.company.RetrievalProfile,
+    summary="Изменение профиля поиска компании",
+    description="""Задает модель ответов /messages/, max_num_results и порог релевантности (score_threshold)
+                 инструмента file_search, а также статическую нарезку (chunk_max_tokens, chunk_overlap_tokens)
+                 файлов, добавляемых в хранилище компании. Незаданные поля — значения по умолчанию.
+                 Нарезка применяется к файлам, загруженным после изменения."""
+)
+async def set_retrieval_profile(
+    profile: schemas.company.RetrievalProfile,
+    platform_company_id: int = Path(..., description="ID компании на платформе"),
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.company.RetrievalProfile:
+    company = await _get_company(db, platform_company_id)
+    company = await crud.company.update_retrieval_profile_async(db, db_obj=company, profile=profile)
+    logger.info(f"Профиль поиска компании {platform_company_id} изменен: {profile.model_dump()}")
+    return schemas.company.RetrievalProfile.model_validate(company, from_attributes=True)
@@ -0,0 +1,29 @@
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Path, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import get_async_db
+from app import crud, schemas
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+@router.get(
+    "/{job_id}",
+    response_model=schemas.ingest_job.IngestJob,
+    summary="Статус фоновой задачи загрузки документа",
+    description="Возвращает статус (queued, running, succeeded, failed), число попыток, прогресс по чанкам \
+                 (chunks_total, chunks_embedded, chunks_stored, chunks_failed), последнюю ошибку и результат задачи."
+)
+async def get_job(
+    job_id: int = Path(..., description="ID задачи, полученный при постановке в очередь"),
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.ingest_job.IngestJob:
+    job = await crud.ingest_job.get_async(db, job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Задача с ID {job_id} не найдена"
+        )
+    return job
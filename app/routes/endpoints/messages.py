@@ -1,34 +1,23 @@
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app import crud, schemas
+from app.core.company_cache import CachedCompany
+from app.services import answer_cache
 from app.utils import openai_client
+from app.utils.sse import format_sse, SSE_HEADERS
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get(
-    "/",
-    response_model=schemas.response.PromptResponse,
-    summary="Получение ответа AI по промпту с использованием поиска по файлам компании",
-    description="Принимает ID компании и текст запроса (prompt). Находит векторное хранилище компании, \
-                 отправляет запрос в OpenAI с использованием поиска по этому хранилищу и возвращает текстовый ответ."
-)
-def get_ai_prompt_response(
-    *, # Делает все параметры query parameters именованными
-    db: Session = Depends(get_db),
-    platform_company_id: int = Query(..., description="ID компании на платформе"),
-    prompt: str = Query(..., description="Текст запроса к AI")
-) -> schemas.response.PromptResponse:
-    
-    logger.info(f"Получен запрос на промпт для компании {platform_company_id}.")
-
-    # 1. Найти компанию и ее vector_store_id
-    company = crud.company.get_by_platform_id(db, platform_company_id=platform_company_id)
+async def _get_company(db: AsyncSession, platform_company_id: int) -> CachedCompany:
+    """Находит компанию с ее vector_store_id и профилем поиска (404, если компании нет; 500, если у нее нет хранилища)."""
+    company = await crud.company.get_cached_async(db, platform_company_id=platform_company_id)
     if not company:
         logger.error(f"Компания с ID {platform_company_id} не найдена.")
         raise HTTPException(
@@ -45,12 +34,57 @@ def get_ai_prompt_response(
         )
     
     logger.info(f"Найден vector_store_id: {vector_store_id} для компании {platform_company_id}.")
+    return company
+
+
+async def _check_cache(db: AsyncSession, company: CachedCompany, prompt: str) -> Tuple[Optional[str], int]:
+    """Ищет ответ на тот же запрос с тем же профилем поиска в кэше ответов. Возвращает
+    ответ (или None) и версию файлов компании, с которой нужно сохранить новый ответ."""
+    corpus_version = await answer_cache.get_corpus_version(db, platform_company_id=company.platform_company_id)
+    answer = await answer_cache.lookup(
+        db,
+        platform_company_id=company.platform_company_id,
+        corpus_version=corpus_version,
+        model=openai_client.file_search_cache_key(company.profile),
+        prompt=prompt
+    )
+    # Возвращаем соединение в пул до ожидания ответа OpenAI, чтобы долгие
+    # запросы к AI не удерживали соединения с БД
+    await db.close()
+    return answer, corpus_version
+
+
+@router.get(
+    "/",
+    response_model=schemas.response.PromptResponse,
+    summary="Получение ответа AI по промпту с использованием поиска по файлам компании",
+    description="Принимает ID компании и текст запроса (prompt). Находит векторное хранилище компании, \
+                 отправляет запрос в OpenAI с использованием поиска по этому хранилищу и возвращает текстовый ответ. \
+                 Ответ на тот же запрос по текущим файлам компании возвращается из кэша ответов (cached=true)."
+)
+async def get_ai_prompt_response(
+    *, # Делает все параметры query parameters именованными
+    db: AsyncSession = Depends(get_async_db),
+    platform_company_id: int = Query(..., description="ID компании на платформе"),
+    prompt: str = Query(..., description="Текст запроса к AI")
+) -> schemas.response.PromptResponse:
+    
+    logger.info(f"Получен запрос на промпт для компании {platform_company_id}.")
+
+    # 1. Найти компанию, ее vector_store_id и профиль поиска
+    company = await _get_company(db, platform_company_id)
+
+    # Ответ на этот запрос уже мог быть получен по текущим файлам компании
+    cached, corpus_version = await _check_cache(db, company, prompt)
+    if cached is not None:
+        return schemas.response.PromptResponse(ai_response=cached, cached=True)
 
     # 2. Вызвать функцию OpenAI для получения ответа
     try:
-        ai_text_response = openai_client.get_prompt_response(
+        ai_text_response = await openai_client.get_prompt_response_async(
             prompt=prompt, 
-            vector_store_id=vector_store_id
+            vector_store_id=company.openai_vector_store_id,
+            profile=company.profile
         )
         
         if ai_text_response is None:
@@ -59,6 +93,13 @@ def get_ai_prompt_response(
              return schemas.response.PromptResponse(ai_response=None)
 
         logger.info(f"Получен ответ от OpenAI для компании {platform_company_id}.")
+        await answer_cache.store(
+            platform_company_id=platform_company_id,
+            corpus_version=corpus_version,
+            model=openai_client.file_search_cache_key(company.profile),
+            prompt=prompt,
+            answer=ai_text_response
+        )
         return schemas.response.PromptResponse(ai_response=ai_text_response)
 
     except ValueError as ve:
@@ -73,4 +114,73 @@ def get_ai_prompt_response(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Внутренняя ошибка сервера при обращении к AI: {e}"
-        ) 
\ No newline at end of file
+        )
+
+
+@router.get(
+    "/stream/",
+    response_class=StreamingResponse,
+    summary="Потоковое (SSE) получение ответа AI по промпту с поиском по файлам компании",
+    description="""То же, что GET /messages/, но ответ передается как Server-Sent Events по мере генерации.
+                 Первое событие `metadata` содержит данные поиска (platform_company_id, vector_store_id),
+                 затем идут события `token` с фрагментами ответа ({"delta": ...}) и завершающее `done`.
+                 Ответ из кэша ответов отправляется одним событием `token` (metadata.cached=true).
+                 При ошибке генерации отправляется событие `error`."""
+)
+async def get_ai_prompt_response_stream(
+    *,
+    db: AsyncSession = Depends(get_async_db),
+    platform_company_id: int = Query(..., description="ID компании на платформе"),
+    prompt: str = Query(..., description="Текст запроса к AI")
+) -> StreamingResponse:
+
+    logger.info(f"Получен потоковый запрос на промпт для компании {platform_company_id}.")
+    company = await _get_company(db, platform_company_id)
+    cached, corpus_version = await _check_cache(db, company, prompt)
+    if cached is not None:
+        async def cached_stream():
+            yield format_sse({"platform_company_id": platform_company_id, "cached": True}, event="metadata")
+            yield format_sse({"delta": cached}, event="token")
+            yield format_sse({}, event="done")
+
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    metadata = {
+        "platform_company_id": platform_company_id,
+        "vector_store_id": company.openai_vector_store_id,
+        "cached": False,
+    }
+
+    async def event_stream():
+        yield format_sse(metadata, event="metadata")
+        deltas: List[str] = []
+        try:
+            async for delta in openai_client.stream_prompt_response_async(
+                prompt=prompt, vector_store_id=company.openai_vector_store_id, profile=company.profile
+            ):
+                deltas.append(delta)
+                yield format_sse({"delta": delta}, event="token")
+        except Exception as e:
+            logger.error(f"Ошибка потокового обращения к OpenAI для компании {platform_company_id}: {e}")
+            yield format_sse({"detail": f"Ошибка при обращении к AI: {e}"}, event="error")
+            return
+        yield format_sse({}, event="done")
+        # В кэш попадает только полностью сгенерированный ответ
+        await answer_cache.store(
+            platform_company_id=platform_company_id,
+            corpus_version=corpus_version,
+            model=openai_client.file_search_cache_key(company.profile),
+            prompt=prompt,
+            answer="".join(deltas)
+        )
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get(
+    "/cache/stats/",
+    response_model=schemas.answer_cache.AnswerCacheStats,
+    summary="Статистика кэша ответов (текущий процесс)"
+)
+async def get_answer_cache_stats() -> schemas.answer_cache.AnswerCacheStats:
+    return answer_cache.get_stats()
@@ -1,76 +1,144 @@
 import logging
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Tuple
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import get_async_db
 from app import schemas, crud
+from app.models.chunk import Chunk
+from app.models.semantic_cache import SemanticCacheEntry
+from app.services import context_packer, semantic_cache
 from app.utils import openai_client
+from app.utils.sse import format_sse, SSE_HEADERS
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post(
-    "/query/", 
-    response_model=schemas.response.MessagePGResponse,
-    summary="Запрос к AI с поиском по ВСЕМ чанкам (pgvector)",
-    description="""Принимает текст запроса. Генерирует эмбеддинг запроса, 
-                 находит похожие чанки ВО ВСЕЙ базе данных (PostgreSQL + pgvector), 
-                 формирует контекст из найденных чанков и отправляет запрос в OpenAI 
-                 (используя get_prompt_response2) для получения финального ответа."""
-)
-def query_with_pgvector(
-    request: schemas.request.MessagePGRequest, 
-    db: Session = Depends(get_db)
-) -> schemas.response.MessagePGResponse:
-    
-    logger.info(f"Запрос на поиск по ВСЕМ чанкам для запроса: '{request.query_text[:50]}...'")
-
-    # --- Шаг 1: Поиск компании УДАЛЕН ---
+async def _embed_query(request: schemas.request.MessagePGRequest) -> List[float]:
+    """Эмбеддинг текста запроса (общий для семантического кэша и поиска чанков)."""
+    logger.info(f"Запрос на поиск по чанкам компании {request.platform_company_id} для запроса: '{request.query_text[:50]}...'")
 
-    # 2. Получить эмбеддинг для запроса
+    # 1. Получить эмбеддинг для запроса
     try:
-        query_embedding = openai_client.get_embedding(text=request.query_text)
+        query_embedding = await openai_client.get_embedding_async(text=request.query_text, model=settings.EMBEDDING_MODEL)
         if not query_embedding:
             raise HTTPException(status_code=500, detail="Не удалось сгенерировать эмбеддинг для запроса.")
         logger.info(f"Сгенерирован эмбеддинг для запроса: '{request.query_text[:50]}...'")
     except Exception as e:
         logger.exception(f"Ошибка генерации эмбеддинга: {e}") 
         raise HTTPException(status_code=500, detail=f"Ошибка генерации эмбеддинга запроса: {e}")
+    return query_embedding
 
-    # --- Шаг 3: Поиск ID файлов УДАЛЕН --- 
 
-    # 4. Найти похожие чанки по ВСЕЙ базе (без фильтра file_ids)
+async def _check_cache(
+    request: schemas.request.MessagePGRequest, db: AsyncSession, query_embedding: List[float]
+) -> Tuple[Optional[SemanticCacheEntry], int]:
+    """Ищет ответ на близкий запрос в семантическом кэше. Возвращает запись
+    (или None) и версию корпуса, с которой нужно сохранить новый ответ."""
+    corpus_version = await semantic_cache.get_corpus_version(db, platform_company_id=request.platform_company_id)
+    entry = await semantic_cache.lookup(
+        db,
+        platform_company_id=request.platform_company_id,
+        corpus_version=corpus_version,
+        query_embedding=query_embedding
+    )
+    if entry is not None:
+        await db.close()
+    return entry, corpus_version
+
+
+async def _retrieve_context(
+    request: schemas.request.MessagePGRequest, db: AsyncSession, query_embedding: List[float]
+) -> Tuple[List[Chunk], str, int]:
+    """Поиск похожих чанков компании и сборка промпта.
+    Возвращает чанки, промпт и число токенов контекста.
+    Общая часть обычного и потокового эндпоинтов."""
+    # 2. Найти похожие чанки компании (поиск затрагивает только ее секцию)
     try:
-        similar_chunks = crud.chunk.get_similar_chunks(
-            db=db,
-            query_embedding=query_embedding,
-            # file_ids=... # Фильтр по файлам убран
-            limit=5 
-        )
-        logger.info(f"Найдено {len(similar_chunks)} похожих чанков по всей базе.")
+        if request.search_mode == "hybrid":
+            # Векторный + полнотекстовый поиск с объединением RRF
+            similar_chunks = await crud.chunk.get_hybrid_chunks_async(
+                db=db,
+                query_embedding=query_embedding,
+                query_text=request.query_text,
+                platform_company_id=request.platform_company_id,
+                limit=5,
+                ef_search=request.ef_search,
+                probes=request.probes
+            )
+        else:
+            similar_chunks = await crud.chunk.get_similar_chunks_async(
+                db=db,
+                query_embedding=query_embedding,
+                platform_company_id=request.platform_company_id,
+                limit=5,
+                ef_search=request.ef_search,
+                probes=request.probes,
+                strategy=request.search_strategy
+            )
+        logger.info(f"Найдено {len(similar_chunks)} похожих чанков компании {request.platform_company_id} (режим {request.search_mode}).")
     except Exception as e:
         # Уточняем сообщение об ошибке
-        logger.exception(f"Ошибка векторного поиска чанков по всей базе: {e}")
+        logger.exception(f"Ошибка векторного поиска чанков компании {request.platform_company_id}: {e}")
         raise HTTPException(status_code=500, detail="Ошибка векторного поиска чанков.")
 
-    # 5. Сформировать контекст и промпт
+    # Возвращаем соединение в пул до ожидания ответа OpenAI
+    await db.close()
+
+    # 3. Сформировать контекст: соседние чанки склеиваются без перекрытия, объем ограничен бюджетом токенов
+    packed = context_packer.pack_context(similar_chunks)
     if not similar_chunks:
-        logger.warning("Похожие чанки не найдены во всей базе.")
+        logger.warning(f"Похожие чанки компании {request.platform_company_id} не найдены.")
         context = "Подходящий контекст не найден."
+    elif not packed.text:
+        logger.warning("Найденные чанки не содержат текстовых данных.")
+        context = "Подходящий контекст не найден (чанки без текста)."
     else:
-        context = "\n\n".join([chunk.text for chunk in similar_chunks if hasattr(chunk, 'text') and chunk.text])
-        if not context:
-             logger.warning("Найденные чанки не содержат текстовых данных.")
-             context = "Подходящий контекст не найден (чанки без текста)."
+        context = packed.text
+        logger.info(f"Контекст: {len(packed.chunk_ids)} из {len(similar_chunks)} чанков, {packed.tokens} токенов.")
 
     # Промпт для новой функции get_prompt_response2
     final_prompt = f"Используя следующий контекст:\n--- КОНТЕКСТ ---\n{context}\n--- КОНЕЦ КОНТЕКСТА ---\n\nОтветь на вопрос: {request.query_text}. Если контекста нет ответь что то по типу что данных по этому вопросу нет."
 
-    # 6. Вызвать OpenAI с использованием get_prompt_response2
+    return similar_chunks, final_prompt, packed.tokens
+
+
+@router.post(
+    "/query/", 
+    response_model=schemas.response.MessagePGResponse,
+    summary="Запрос к AI с поиском по чанкам компании (pgvector)",
+    description="""Принимает ID компании и текст запроса. Генерирует эмбеддинг запроса, 
+                 находит похожие чанки в секции компании (PostgreSQL + pgvector; search_mode=hybrid
+                 добавляет полнотекстовый поиск и объединяет результаты reciprocal rank fusion), 
+                 формирует контекст из найденных чанков и отправляет запрос в OpenAI 
+                 (используя get_prompt_response2) для получения финального ответа.
+                 Если близкий по смыслу запрос уже задавался по текущим данным компании,
+                 ответ возвращается из семантического кэша (cached=true) без поиска и вызова AI."""
+)
+async def query_with_pgvector(
+    request: schemas.request.MessagePGRequest, 
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.response.MessagePGResponse:
+
+    query_embedding = await _embed_query(request)
+
+    # Ответ на близкий по смыслу вопрос уже мог быть получен по текущим данным компании
+    cached, corpus_version = await _check_cache(request, db, query_embedding)
+    if cached is not None:
+        return schemas.response.MessagePGResponse(
+            ai_response=cached.answer,
+            retrieved_chunks_count=len(cached.source_chunk_ids),
+            cached=True
+        )
+
+    similar_chunks, final_prompt, context_tokens = await _retrieve_context(request, db, query_embedding)
+
+    # 4. Вызвать OpenAI с использованием get_prompt_response2
     try:
-        ai_text_response = openai_client.get_prompt_response2(
+        ai_text_response = await openai_client.get_prompt_response2_async(
             prompt=final_prompt
         )
         
@@ -78,16 +146,103 @@ def query_with_pgvector(
              logger.warning("OpenAI клиент (get_prompt_response2) вернул None.")
              return schemas.response.MessagePGResponse(
                  ai_response="Не удалось сгенерировать ответ AI.", 
-                 retrieved_chunks_count=len(similar_chunks)
+                 retrieved_chunks_count=len(similar_chunks),
+                 context_tokens=context_tokens
              )
 
         logger.info("Сгенерирован финальный ответ AI с помощью get_prompt_response2.")
+        await semantic_cache.store(
+            platform_company_id=request.platform_company_id,
+            corpus_version=corpus_version,
+            query_text=request.query_text,
+            query_embedding=query_embedding,
+            answer=ai_text_response,
+            chunks=similar_chunks
+        )
         return schemas.response.MessagePGResponse(
             ai_response=ai_text_response, 
-            retrieved_chunks_count=len(similar_chunks)
+            retrieved_chunks_count=len(similar_chunks),
+            context_tokens=context_tokens
         )
     
     except Exception as e:
         logger.exception(f"Ошибка при вызове get_prompt_response2: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка генерации ответа AI: {e}")
- 
\ No newline at end of file
+
+
+@router.post(
+    "/query/stream/",
+    response_class=StreamingResponse,
+    summary="Потоковый (SSE) запрос к AI с поиском по чанкам компании (pgvector)",
+    description="""То же, что /query/, но ответ передается как Server-Sent Events по мере генерации.
+                 Первое событие `metadata` содержит данные поиска (retrieved_chunks_count, file_ids, chunk_ids, context_tokens, cached),
+                 затем идут события `token` с фрагментами ответа ({"delta": ...}) и завершающее `done`.
+                 При ошибке генерации отправляется событие `error`."""
+)
+async def query_with_pgvector_stream(
+    request: schemas.request.MessagePGRequest,
+    db: AsyncSession = Depends(get_async_db)
+) -> StreamingResponse:
+
+    # Поиск выполняется до начала ответа, чтобы его ошибки возвращались обычным HTTP статусом
+    query_embedding = await _embed_query(request)
+    cached, corpus_version = await _check_cache(request, db, query_embedding)
+
+    if cached is not None:
+        # Ответ из кэша отправляется одним событием token
+        metadata = {
+            "retrieved_chunks_count": len(cached.source_chunk_ids),
+            "file_ids": list(cached.source_file_ids),
+            "chunk_ids": list(cached.source_chunk_ids),
+            "cached": True,
+        }
+
+        async def cached_stream():
+            yield format_sse(metadata, event="metadata")
+            yield format_sse({"delta": cached.answer}, event="token")
+            yield format_sse({}, event="done")
+
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+    similar_chunks, final_prompt, context_tokens = await _retrieve_context(request, db, query_embedding)
+
+    metadata = {
+        "retrieved_chunks_count": len(similar_chunks),
+        "file_ids": sorted({chunk.file_id for chunk in similar_chunks}),
+        "chunk_ids": [chunk.id for chunk in similar_chunks],
+        "context_tokens": context_tokens,
+        "cached": False,
+    }
+
+    async def event_stream():
+        yield format_sse(metadata, event="metadata")
+        deltas: List[str] = []
+        try:
+            async for delta in openai_client.stream_prompt_response2_async(prompt=final_prompt):
+                deltas.append(delta)
+                yield format_sse({"delta": delta}, event="token")
+        except Exception as e:
+            logger.exception(f"Ошибка потоковой генерации ответа AI: {e}")
+            yield format_sse({"detail": f"Ошибка генерации ответа AI: {e}"}, event="error")
+            return
+        yield format_sse({}, event="done")
+        # В кэш попадает только полностью сгенерированный ответ
+        await semantic_cache.store(
+            platform_company_id=request.platform_company_id,
+            corpus_version=corpus_version,
+            query_text=request.query_text,
+            query_embedding=query_embedding,
+            answer="".join(deltas),
+            chunks=similar_chunks
+        )
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@router.get(
+    "/cache/stats/",
+    response_model=schemas.semantic_cache.SemanticCacheStats,
+    summary="Статистика семантического кэша ответов (текущий процесс)"
+)
+async def get_semantic_cache_stats() -> schemas.semantic_cache.SemanticCacheStats:
+    return semantic_cache.get_stats()
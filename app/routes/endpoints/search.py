@@ -0,0 +1,103 @@
+import base64
+import binascii
+import json
+import logging
+from fastapi import APIRouter, HTTPException, status, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import get_async_db
+from app import schemas, crud
+from app.utils import hashing, openai_client
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _query_hash(request: schemas.request.SearchRequest) -> str:
+    """Отпечаток параметров, от которых зависит порядок результатов: курсор
+    действителен только для того же запроса."""
+    key = [
+        request.platform_company_id, request.query_text, sorted(request.file_ids or []),
+        request.max_distance, request.search_strategy or settings.VECTOR_SEARCH_STRATEGY
+    ]
+    return hashing.exact_hash(json.dumps(key, ensure_ascii=False))[:16]
+
+
+def _encode_cursor(distance: float, chunk_id: int, query_hash: str) -> str:
+    """Курсор — позиция (distance, id) последнего чанка страницы и отпечаток запроса."""
+    return base64.urlsafe_b64encode(json.dumps([distance, chunk_id, query_hash]).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: Optional[str], query_hash: str) -> Optional[Tuple[float, int]]:
+    if not cursor:
+        return None
+    try:
+        distance, chunk_id, cursor_hash = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        position = float(distance), int(chunk_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Некорректный cursor")
+    if cursor_hash != query_hash:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="cursor получен для другого запроса")
+    return position
+
+
+@router.post(
+    "/",
+    response_model=schemas.response.SearchResponse,
+    summary="Поиск чанков компании (pgvector) без вызова AI",
+    description="""Генерирует эмбеддинг запроса и возвращает ближайшие чанки компании
+                 (chunk_id, file_id, index, text, distance) в порядке возрастания расстояния.
+                 top_k — размер страницы, max_distance — порог расстояния, file_ids — фильтр по файлам.
+                 Следующая страница запрашивается тем же запросом с cursor=next_cursor
+                 (cursor другого запроса отклоняется с кодом 422).
+                 Эмбеддинги чанков из БД не читаются."""
+)
+async def search_chunks(
+    request: schemas.request.SearchRequest,
+    db: AsyncSession = Depends(get_async_db)
+) -> schemas.response.SearchResponse:
+    query_hash = _query_hash(request)
+    after = _decode_cursor(request.cursor, query_hash)
+    logger.info(f"Поиск по чанкам компании {request.platform_company_id}: '{request.query_text[:50]}...' (top_k={request.top_k}, cursor={after}).")
+
+    try:
+        query_embedding = await openai_client.get_embedding_async(text=request.query_text, model=settings.EMBEDDING_MODEL)
+    except Exception as e:
+        logger.exception(f"Ошибка генерации эмбеддинга: {e}")
+        query_embedding = None
+    if not query_embedding:
+        raise HTTPException(status_code=500, detail="Не удалось сгенерировать эмбеддинг для запроса.")
+
+    try:
+        # Лишняя строка показывает, есть ли следующая страница
+        rows = await crud.chunk.search_chunks_async(
+            db,
+            query_embedding=query_embedding,
+            platform_company_id=request.platform_company_id,
+            file_ids=request.file_ids,
+            limit=request.top_k + 1,
+            max_distance=request.max_distance,
+            after=after,
+            ef_search=request.ef_search,
+            probes=request.probes,
+            strategy=request.search_strategy
+        )
+    except Exception as e:
+        logger.exception(f"Ошибка векторного поиска чанков компании {request.platform_company_id}: {e}")
+        raise HTTPException(status_code=500, detail="Ошибка векторного поиска чанков.")
+    finally:
+        await db.close()
+
+    page = rows[:request.top_k]
+    next_cursor = _encode_cursor(page[-1]["distance"], page[-1]["id"], query_hash) if len(rows) > request.top_k else None
+    return schemas.response.SearchResponse(
+        results=[
+            schemas.response.SearchHit(
+                chunk_id=row["id"], file_id=row["file_id"], index=row["index"], text=row["text"], distance=row["distance"]
+            )
+            for row in page
+        ],
+        next_cursor=next_cursor
+    )
@@ -4,9 +4,13 @@ from . import message
 from . import request
 from . import response
 from .request import ProcessFileRequest, MessagePGRequest
-from .response import ProcessFileResponse, MessagePGResponse
+from .response import ProcessFileResponse, MessagePGResponse, JobSubmitResponse
 from .files2 import Files2, Files2Create
 from .chunk import Chunk, ChunkCreate, ChunkUpdate
+from .embedding import Embedding, EmbeddingCreate
+from .ingest_job import IngestJob, IngestJobCreate
+from .semantic_cache import SemanticCacheEntryCreate, SemanticCacheStats
+from .answer_cache import AnswerCacheEntryCreate, AnswerCacheStats
 
 # Опционально: можно импортировать конкретные схемы для удобства,
 # но импорта модулей request и response достаточно для исправления ошибки.
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+
+# Схема для создания записи кэша ответов /messages/
+class AnswerCacheEntryCreate(BaseModel):
+    platform_company_id: int
+    corpus_version: int
+    model: str
+    prompt_hash: str
+    prompt: str
+    answer: str
+
+# Статистика кэша ответов процесса
+class AnswerCacheStats(BaseModel):
+    memory_hits: int
+    shared_hits: int
+    misses: int
+    stores: int
+    memory_entries: int
+    hit_rate: float
@@ -5,9 +5,11 @@ class ChunkBase(BaseModel):
     text: str
     index: int # int для Pydantic
     file_id: int # int для Pydantic
+    platform_company_id: int # Компания (ключ секционирования chunks)
 
 class ChunkCreate(ChunkBase):
     embedding: Optional[List[float]] = None
+    embedding_id: Optional[int] = None # Ссылка на эмбеддинг в таблице embeddings
 
 class ChunkUpdate(BaseModel):
     # Обычно эмбеддинги не обновляются, но оставим для примера
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, model_validator
 from datetime import datetime
 from typing import Optional
 
@@ -23,4 +23,22 @@ class Company(CompanyBase):
     openai_vector_store_id: Optional[str] = None
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+
+# Профиль поиска компании: параметры file_search и нарезки файлов (None — значение по умолчанию)
+class RetrievalProfile(BaseModel):
+    retrieval_model: Optional[str] = None
+    max_num_results: Optional[int] = Field(None, ge=1, le=50)
+    score_threshold: Optional[float] = Field(None, ge=0, le=1)
+    chunk_max_tokens: Optional[int] = Field(None, ge=100, le=4096)
+    chunk_overlap_tokens: Optional[int] = Field(None, ge=0)
+
+    @model_validator(mode="after")
+    def _check_chunking(self):
+        # Ограничения OpenAI для chunking_strategy static
+        if (self.chunk_max_tokens is None) != (self.chunk_overlap_tokens is None):
+            raise ValueError("chunk_max_tokens и chunk_overlap_tokens задаются вместе")
+        if self.chunk_max_tokens is not None and self.chunk_overlap_tokens > self.chunk_max_tokens // 2:
+            raise ValueError("chunk_overlap_tokens не больше половины chunk_max_tokens")
+        return self
+
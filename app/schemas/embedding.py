@@ -0,0 +1,16 @@
+from pydantic import BaseModel
+from typing import List
+
+class EmbeddingBase(BaseModel):
+    content_hash: str
+    model: str
+
+class EmbeddingCreate(EmbeddingBase):
+    embedding: List[float]
+
+class Embedding(EmbeddingBase):
+    id: int
+    embedding: List[float]
+
+    class Config:
+        from_attributes = True
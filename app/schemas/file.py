@@ -11,11 +11,13 @@ class FileBase(BaseModel):
 # Схема для создания File
 class FileCreate(FileBase):
     openai_file_id: Optional[str] = None
+    content_hash: Optional[str] = None
 
 # Схема для обновления File
 class FileUpdate(BaseModel):
     file_text: Optional[str] = None
     openai_file_id: Optional[str] = None
+    content_hash: Optional[str] = None
 
 # Схема для чтения данных File из БД
 class FileInDBBase(FileBase):
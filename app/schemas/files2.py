@@ -1,7 +1,11 @@
 from pydantic import BaseModel
+from typing import Optional
 
 class Files2Base(BaseModel):
     text: str
+    platform_company_id: Optional[int] = None
+    document_id: Optional[str] = None
+    content_hash: Optional[str] = None
 
 class Files2Create(Files2Base):
     pass
@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Any, Dict, Literal, Optional
+
+JobStatus = Literal["queued", "running", "succeeded", "failed"]
+
+# Схема для создания задачи
+class IngestJobCreate(BaseModel):
+    kind: str
+    platform_company_id: Optional[int] = None
+    payload: Dict[str, Any]
+    max_attempts: int = 3
+
+# Схема для чтения задачи из БД
+class IngestJob(BaseModel):
+    id: int
+    kind: str
+    status: JobStatus
+    platform_company_id: Optional[int] = None
+    attempts: int
+    max_attempts: int
+    chunks_total: int = 0
+    chunks_embedded: int = 0
+    chunks_stored: int = 0
+    chunks_failed: int = 0
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -1,11 +1,19 @@
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 
 class SetFileRequest(BaseModel):
     platform_company_id: int
     platform_file_id: int
     file_text: str
 
+class BulkFileItem(BaseModel):
+    platform_file_id: int
+    file_text: str
+
+class BulkSetFilesRequest(BaseModel):
+    platform_company_id: int
+    files: List[BulkFileItem] = Field(..., min_length=1)
+
 class DeleteFileRequest(BaseModel):
     platform_company_id: int
     platform_file_id: int
@@ -18,8 +26,34 @@ class MessageRequestParams(BaseModel):
 
 # Схема запроса для обработки файла (чанкинг + эмбеддинг)
 class ProcessFileRequest(BaseModel):
+    platform_company_id: int
     text: str 
+    # ID документа у вызывающей стороны: повторная загрузка обновляет документ,
+    # а неизмененный текст не обрабатывается заново
+    document_id: Optional[str] = None
+    # batch: чанки сохраняются без новых эмбеддингов, их получит переиндексирование через Batch API
+    embedding_mode: Literal["sync", "batch"] = "sync"
 
 # Схема запроса для поиска по чанкам и генерации ответа
 class MessagePGRequest(BaseModel):
-    query_text: str 
\ No newline at end of file
+    platform_company_id: int # Поиск выполняется только по чанкам этой компании
+    query_text: str
+    # Необязательная настройка ANN поиска: больше — выше recall, медленнее запрос
+    ef_search: Optional[int] = Field(None, ge=1, le=1000, description="hnsw.ef_search для этого запроса")
+    probes: Optional[int] = Field(None, ge=1, description="ivfflat.probes для этого запроса")
+    # hybrid: векторный поиск + полнотекстовый (точные артикулы, номера, имена), объединенные RRF
+    search_mode: Literal["vector", "hybrid"] = "vector"
+    # Стратегия векторного поиска (по умолчанию VECTOR_SEARCH_STRATEGY): ann | binary | exact
+    search_strategy: Optional[Literal["ann", "binary", "exact"]] = None 
+
+class SearchRequest(BaseModel):
+    platform_company_id: int # Поиск выполняется только по чанкам этой компании
+    query_text: str
+    top_k: int = Field(10, ge=1, le=100, description="Чанков на странице")
+    max_distance: Optional[float] = Field(None, ge=0, le=2, description="Максимальное косинусное расстояние")
+    file_ids: Optional[List[int]] = Field(None, description="Искать только в этих файлах (files2.id)")
+    cursor: Optional[str] = Field(None, description="next_cursor предыдущей страницы")
+    ef_search: Optional[int] = Field(None, ge=1, le=1000, description="hnsw.ef_search для этого запроса")
+    probes: Optional[int] = Field(None, ge=1, description="ivfflat.probes для этого запроса")
+    search_strategy: Optional[Literal["ann", "binary", "exact"]] = None
+
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Literal, Optional, List
 
 from app.schemas.message import Message
 
@@ -7,6 +7,24 @@ class SetFileResponse(BaseModel):
     message: str
     platform_company_id: int
     platform_file_id: int
+    # Прежняя версия файла; открепляется и удаляется из OpenAI отдельной задачей
+    replaced_openai_file_id: Optional[str] = None
+    changed: bool = True # False — текст совпал с уже загруженным, ничего не делалось
+
+class BulkFileResult(BaseModel):
+    platform_file_id: int
+    status: Literal["created", "updated", "unchanged", "failed"]
+    openai_file_id: Optional[str] = None
+    replaced_openai_file_id: Optional[str] = None # Прежняя версия, удаляется отдельной задачей
+    error: Optional[str] = None
+
+class BulkSetFilesResponse(BaseModel):
+    platform_company_id: int
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    results: List[BulkFileResult]
 
 class DeleteFileResponse(BaseModel):
     message: str
@@ -24,14 +42,38 @@ class ErrorResponse(BaseModel):
 # Схема ответа для эндпоинта промпта
 class PromptResponse(BaseModel):
     ai_response: Optional[str] = None # Текст ответа от AI или None при ошибке 
+    cached: bool = False # Ответ взят из кэша ответов
 
 # Схема ответа для обработки файла (чанкинг + эмбеддинг)
 class ProcessFileResponse(BaseModel):
     file_id: int # ID созданного файла в таблице files2
     chunks_count: int # Количество созданных чанков
+    reused_embeddings: int = 0 # Чанков, эмбеддинг которых взят из хранилища без запроса к OpenAI
+    changed: bool = True # False — документ с этим document_id и тем же текстом уже обработан
     message: str 
 
 # Схема ответа для поиска по чанкам
 class MessagePGResponse(BaseModel):
     ai_response: Optional[str] = None
-    retrieved_chunks_count: int = 0 
\ No newline at end of file
+    retrieved_chunks_count: int = 0
+    cached: bool = False # Ответ взят из семантического кэша
+    context_tokens: int = 0 # Токенов контекста в промпте (0 для ответа из кэша) 
+
+# Найденный чанк (POST /search/)
+class SearchHit(BaseModel):
+    chunk_id: int
+    file_id: int
+    index: int
+    text: str
+    distance: float # Косинусное расстояние до запроса (меньше — ближе)
+
+class SearchResponse(BaseModel):
+    results: List[SearchHit]
+    next_cursor: Optional[str] = None # None — страниц больше нет
+
+# Схема ответа на постановку документа в очередь обработки (202 Accepted)
+class JobSubmitResponse(BaseModel):
+    job_id: Optional[int] = None # ID задачи, статус: GET /jobs/{job_id}; None, если обработка не нужна
+    status: str
+    message: str
+    changed: bool = True # False — содержимое не изменилось, задача не ставилась
@@ -0,0 +1,19 @@
+from pydantic import BaseModel
+from typing import List
+
+# Схема для создания записи семантического кэша
+class SemanticCacheEntryCreate(BaseModel):
+    platform_company_id: int
+    corpus_version: int
+    query_text: str
+    query_embedding: List[float]
+    answer: str
+    source_chunk_ids: List[int]
+    source_file_ids: List[int]
+
+# Статистика семантического кэша процесса
+class SemanticCacheStats(BaseModel):
+    hits: int
+    misses: int
+    stores: int
+    hit_rate: float
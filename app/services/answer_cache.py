@@ -0,0 +1,183 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import company_cache
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app import schemas, crud
+from app.crud.crud_corpus_version import SCOPE_FILES
+from app.utils import hashing
+
+logger = logging.getLogger(__name__)
+
+# Ключ: (platform_company_id, модель, хэш нормализованного запроса, версия корпуса files)
+_Key = Tuple[int, str, str, int]
+
+# Уровень в памяти процесса: LRU с временем жизни записи ANSWER_CACHE_TTL
+_entries: "OrderedDict[_Key, Tuple[float, str]]" = OrderedDict()
+
+# Версии корпуса files компаний, прочитанные этим процессом. Хранятся, только пока процесс
+# получает уведомления канала company_cache (COMPANY_CACHE_NOTIFY): invalidate_company
+# любого процесса отправляет по нему platform_company_id
+_versions: Dict[int, int] = {}
+# Номер сброса _versions: версия, прочитанная до сброса, не сохраняется
+_versions_epoch = 0
+
+# Счетчики процесса для GET /messages/cache/stats/
+_stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "stores": 0}
+
+
+def _forget_version(platform_company_id: Optional[int]) -> None:
+    global _versions_epoch
+    _versions_epoch += 1
+    if platform_company_id is None:
+        _versions.clear()
+    else:
+        _versions.pop(platform_company_id, None)
+
+
+company_cache.on_invalidate(_forget_version)
+
+
+def prompt_hash(prompt: str) -> str:
+    """Хэш запроса без учета регистра и пробельных символов."""
+    return hashing.content_hash(prompt.lower())
+
+
+async def get_corpus_version(db: AsyncSession, *, platform_company_id: int) -> int:
+    """Версию корпуса нужно прочитать до запроса к AI: если файлы изменятся
+    во время генерации ответа, ответ сохранится с устаревшей версией и не будет выдан.
+    При подписке на уведомления company_cache версия берется из памяти процесса."""
+    if not company_cache.listening():
+        return await crud.corpus_version.get_version_async(db, platform_company_id=platform_company_id, scope=SCOPE_FILES)
+    version = _versions.get(platform_company_id)
+    if version is None:
+        epoch = _versions_epoch
+        version = await crud.corpus_version.get_version_async(db, platform_company_id=platform_company_id, scope=SCOPE_FILES)
+        if epoch == _versions_epoch and company_cache.listening():
+            _versions[platform_company_id] = version
+    return version
+
+
+def _memory_get(key: _Key) -> Optional[str]:
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if entry[0] <= time.monotonic():
+        del _entries[key]
+        return None
+    _entries.move_to_end(key)
+    return entry[1]
+
+
+def _memory_put(key: _Key, answer: str) -> None:
+    _entries[key] = (time.monotonic() + settings.ANSWER_CACHE_TTL, answer)
+    _entries.move_to_end(key)
+    while len(_entries) > settings.ANSWER_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+
+async def lookup(
+    db: AsyncSession, *, platform_company_id: int, corpus_version: int, model: str, prompt: str
+) -> Optional[str]:
+    """Ответ на тот же запрос к текущей версии файлов компании: сначала из памяти
+    процесса, затем (ANSWER_CACHE_SHARED) из таблицы answer_cache."""
+    if not settings.ANSWER_CACHE_ENABLED:
+        return None
+    key = (platform_company_id, model, prompt_hash(prompt), corpus_version)
+    answer = _memory_get(key)
+    if answer is not None:
+        _stats["memory_hits"] += 1
+        return answer
+
+    if settings.ANSWER_CACHE_SHARED:
+        try:
+            entry = await crud.answer_cache.get_answer_async(
+                db,
+                platform_company_id=platform_company_id,
+                model=model,
+                prompt_hash=key[2],
+                corpus_version=corpus_version,
+                ttl=settings.ANSWER_CACHE_TTL
+            )
+        except Exception as e:
+            logger.warning(f"Ошибка поиска в кэше ответов компании {platform_company_id}: {e}")
+            await db.rollback()
+            entry = None
+        if entry is not None:
+            _stats["shared_hits"] += 1
+            _memory_put(key, entry.answer)
+            logger.info(f"Кэш ответов: ответ записи {entry.id} для запроса компании {platform_company_id}.")
+            return entry.answer
+
+    _stats["misses"] += 1
+    return None
+
+
+async def store(*, platform_company_id: int, corpus_version: int, model: str, prompt: str, answer: str) -> None:
+    """Сохраняет ответ в памяти процесса и (ANSWER_CACHE_SHARED) в таблице answer_cache,
+    вытесняя устаревшие записи компании. Использует отдельную сессию: вызывается
+    и после завершения потокового ответа. Ответ по уже устаревшей версии файлов
+    в таблицу не пишется: вытеснение по его версии удалило бы актуальные записи."""
+    if not settings.ANSWER_CACHE_ENABLED or not answer:
+        return
+    key = (platform_company_id, model, prompt_hash(prompt), corpus_version)
+    _memory_put(key, answer)
+    _stats["stores"] += 1
+    if not settings.ANSWER_CACHE_SHARED:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            current_version = await crud.corpus_version.get_version_async(db, platform_company_id=platform_company_id, scope=SCOPE_FILES)
+            if current_version != corpus_version:
+                logger.info(f"Кэш ответов: файлы компании {platform_company_id} изменились во время ответа, ответ не сохраняется.")
+                return
+            entry_in = schemas.answer_cache.AnswerCacheEntryCreate(
+                platform_company_id=platform_company_id,
+                corpus_version=corpus_version,
+                model=model,
+                prompt_hash=key[2],
+                prompt=prompt,
+                answer=answer
+            )
+            await crud.answer_cache.store_async(db, obj_in=entry_in)
+            await crud.answer_cache.evict_async(
+                db,
+                platform_company_id=platform_company_id,
+                corpus_version=corpus_version,
+                ttl=settings.ANSWER_CACHE_TTL,
+                max_entries=settings.ANSWER_CACHE_SHARED_MAX_ENTRIES
+            )
+    except Exception as e:
+        # Кэш необязателен: ошибка сохранения не влияет на ответ
+        logger.warning(f"Не удалось сохранить ответ в кэш ответов компании {platform_company_id}: {e}")
+
+
+async def invalidate_company(db: AsyncSession, *, platform_company_id: int) -> None:
+    """Делает недействительными кэшированные ответы компании (после изменения ее файлов).
+    Другие процессы получают уведомление company_cache вместе с новой версией (или читают
+    ее из БД при следующем запросе); записи этого процесса с прошлыми версиями удаляются сразу."""
+    # Уведомление уходит при commit в bump_async
+    await company_cache.notify_async(db, platform_company_id=platform_company_id)
+    version = await crud.corpus_version.bump_async(db, platform_company_id=platform_company_id, scope=SCOPE_FILES)
+    _forget_version(platform_company_id)
+    for key in [key for key in _entries if key[0] == platform_company_id]:
+        del _entries[key]
+    logger.info(f"Версия корпуса files компании {platform_company_id}: {version}.")
+
+
+def get_stats() -> schemas.answer_cache.AnswerCacheStats:
+    hits = _stats["memory_hits"] + _stats["shared_hits"]
+    lookups = hits + _stats["misses"]
+    return schemas.answer_cache.AnswerCacheStats(
+        memory_hits=_stats["memory_hits"],
+        shared_hits=_stats["shared_hits"],
+        misses=_stats["misses"],
+        stores=_stats["stores"],
+        memory_entries=len(_entries),
+        hit_rate=hits / lookups if lookups else 0.0
+    )
@@ -0,0 +1,122 @@
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+
+from app.core.config import settings
+from app.models.chunk import Chunk
+from app.services.ingestion import CHUNK_OVERLAP
+
+logger = logging.getLogger(__name__)
+
+# Разделитель фрагментов контекста в промпте
+SEPARATOR = "\n\n"
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int # Токенов в text (токенизатор модели ответа)
+    chunk_ids: List[int] = field(default_factory=list) # Чанки, вошедшие в контекст
+
+
+@dataclass
+class _Segment:
+    """Подряд идущие чанки одного файла, склеенные без перекрытия."""
+    rank: int # Лучший ранг (позиция в выдаче поиска) среди чанков сегмента
+    text: str
+    chunk_ids: List[int]
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def load_tokenizer() -> None:
+    """Загружает кодировку CONTEXT_TOKENIZER_MODEL при старте приложения: если ее
+    нельзя получить, приложение не запускается, а не падает на первом запросе."""
+    encoding = _encoding(settings.CONTEXT_TOKENIZER_MODEL)
+    logger.info(f"Токенизатор контекста: {encoding.name} ({settings.CONTEXT_TOKENIZER_MODEL}).")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return len(_encoding(model or settings.CONTEXT_TOKENIZER_MODEL).encode(text))
+
+
+def _truncate_to_tokens(text: str, max_tokens: int, model: str) -> str:
+    encoding = _encoding(model)
+    return encoding.decode(encoding.encode(text)[:max_tokens])
+
+
+def _strip_overlap(previous: str, current: str, overlap: int) -> str:
+    """Убирает из начала current текст, которым заканчивается previous
+    (перекрытие соседних чанков simple_chunker, не длиннее overlap символов)."""
+    for size in range(min(overlap, len(previous), len(current)), 0, -1):
+        if previous.endswith(current[:size]):
+            return current[size:]
+    return current
+
+
+def _merge_adjacent(chunks: List[Chunk], overlap: int) -> List[_Segment]:
+    """Склеивает найденные чанки одного файла с соседними index в сегменты."""
+    ranks: Dict[int, int] = {chunk.id: rank for rank, chunk in enumerate(chunks)}
+    by_file: Dict[int, List[Chunk]] = {}
+    for chunk in chunks:
+        if chunk.text:
+            by_file.setdefault(chunk.file_id, []).append(chunk)
+
+    segments: List[_Segment] = []
+    for file_chunks in by_file.values():
+        file_chunks.sort(key=lambda chunk: chunk.index)
+        current: Optional[_Segment] = None
+        previous: Optional[Chunk] = None
+        for chunk in file_chunks:
+            if current is not None and chunk.index == previous.index + 1:
+                current.text += _strip_overlap(previous.text, chunk.text, overlap)
+                current.chunk_ids.append(chunk.id)
+                current.rank = min(current.rank, ranks[chunk.id])
+            else:
+                current = _Segment(rank=ranks[chunk.id], text=chunk.text, chunk_ids=[chunk.id])
+                segments.append(current)
+            previous = chunk
+    segments.sort(key=lambda segment: segment.rank)
+    return segments
+
+
+def pack_context(
+    chunks: List[Chunk], *, token_budget: Optional[int] = None, model: Optional[str] = None,
+    overlap: int = CHUNK_OVERLAP
+) -> PackedContext:
+    """Собирает контекст промпта из найденных чанков (в порядке релевантности).
+
+    Соседние чанки одного файла склеиваются, перекрытие между ними удаляется.
+    Сегменты добавляются от самого релевантного, пока помещаются в token_budget
+    (CONTEXT_TOKEN_BUDGET); не поместившийся первый сегмент обрезается по токенам.
+    """
+    token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+    model = model or settings.CONTEXT_TOKENIZER_MODEL
+    separator_tokens = count_tokens(SEPARATOR, model)
+
+    parts: List[str] = []
+    chunk_ids: List[int] = []
+    used = 0
+    for segment in _merge_adjacent(chunks, overlap):
+        cost = count_tokens(segment.text, model) + (separator_tokens if parts else 0)
+        if used + cost <= token_budget:
+            parts.append(segment.text)
+            chunk_ids.extend(segment.chunk_ids)
+            used += cost
+        elif not parts:
+            # Даже самый релевантный фрагмент не помещается: берем его начало
+            parts.append(_truncate_to_tokens(segment.text, token_budget, model))
+            chunk_ids.extend(segment.chunk_ids)
+            used = count_tokens(parts[0], model)
+
+    text = SEPARATOR.join(parts)
+    return PackedContext(text=text, tokens=count_tokens(text, model) if text else 0, chunk_ids=chunk_ids)
@@ -0,0 +1,304 @@
+"""Переиндексирование эмбеддингов чанков через Batch API OpenAI.
+
+Чанки без эмбеддинга (или, с --reembed, с эмбеддингом другой модели) делятся
+на пакеты по диапазонам ID. Для каждого пакета уникальные тексты записываются
+в JSONL, файл загружается и отправляется в Batch API; результаты построчно
+сохраняются в хранилище embeddings (custom_id — хэш текста), после чего
+чанки диапазона получают вектор из хранилища одним UPDATE в БД.
+
+Состояние пакетов хранится в таблице embedding_batches, каждый шаг
+идемпотентен, поэтому повторный запуск продолжает работу с места остановки:
+незавершенные пакеты доводятся до конца, новые создаются после последнего
+из них. Чанки, запросы которых в Batch API завершились ошибкой, остаются
+без эмбеддинга и попадают в пакеты следующего запуска.
+
+    python -m app.services.embedding_backfill --company-id 1
+    python -m app.services.embedding_backfill --reembed --no-wait
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import memory_index
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine
+from app import crud, schemas
+from app.models.embedding_batch import EmbeddingBatch
+from app.services import semantic_cache
+from app.utils import openai_client, hashing
+
+logger = logging.getLogger(__name__)
+
+# Статусы пакета Batch API, после которых результатов не будет
+_OPENAI_FAILED_STATUSES = ("failed", "expired", "cancelled")
+# Эмбеддингов из файла результатов на одну запись в хранилище
+_STORE_BATCH = 500
+# Чанков на один UPDATE
+_APPLY_BATCH = 1000
+
+_PENDING_CHUNKS = text("""
+    SELECT c.id, c.text, c.platform_company_id
+    FROM chunks c
+    LEFT JOIN embeddings e ON e.id = c.embedding_id
+    WHERE c.id > :after_id AND c.id <= :until_id
+      AND (CAST(:platform_company_id AS integer) IS NULL OR c.platform_company_id = :platform_company_id)
+      AND (c.embedding IS NULL OR (:reembed AND e.model IS DISTINCT FROM :model))
+    ORDER BY c.id
+    LIMIT :limit
+""")
+
+_APPLY_EMBEDDINGS = text("""
+    UPDATE chunks AS c
+    SET embedding = e.embedding, embedding_id = e.id
+    FROM unnest(CAST(:chunk_ids AS bigint[]), CAST(:company_ids AS integer[]), CAST(:embedding_ids AS bigint[]))
+        AS v(chunk_id, platform_company_id, embedding_id)
+    JOIN embeddings e ON e.id = v.embedding_id
+    WHERE c.id = v.chunk_id AND c.platform_company_id = v.platform_company_id
+""")
+
+
+async def _pending_chunks(
+    db: AsyncSession, *, platform_company_id: Optional[int], model: str, reembed: bool,
+    after_id: int, until_id: int, limit: int
+):
+    return (await db.execute(_PENDING_CHUNKS, {
+        "platform_company_id": platform_company_id, "model": model, "reembed": reembed,
+        "after_id": after_id, "until_id": until_id, "limit": limit
+    })).all()
+
+
+async def _range_chunks(db: AsyncSession, batch: EmbeddingBatch):
+    """Чанки диапазона пакета, которым все еще нужен эмбеддинг."""
+    return await _pending_chunks(
+        db, platform_company_id=batch.platform_company_id, model=batch.model, reembed=batch.reembed,
+        after_id=batch.first_chunk_id - 1, until_id=batch.last_chunk_id, limit=batch.last_chunk_id - batch.first_chunk_id + 1
+    )
+
+
+async def _missing_texts(db: AsyncSession, rows, model: str) -> Dict[str, str]:
+    """{хэш: нормализованный текст} для текстов, которых нет в хранилище embeddings."""
+    texts = {hashing.content_hash(row.text): row.text for row in rows}
+    stored = await crud.embedding.get_by_hashes_async(db, content_hashes=list(texts), model=model)
+    return {content_hash: hashing.normalize_text(chunk_text) for content_hash, chunk_text in texts.items() if content_hash not in stored}
+
+
+async def create_batch(
+    db: AsyncSession, *, platform_company_id: Optional[int], model: str, reembed: bool, after_id: int
+) -> Optional[EmbeddingBatch]:
+    """Записывает следующий диапазон чанков после after_id как новый пакет (None — чанков больше нет)."""
+    rows = await _pending_chunks(
+        db, platform_company_id=platform_company_id, model=model, reembed=reembed,
+        after_id=after_id, until_id=2 ** 63 - 1, limit=settings.EMBEDDING_BATCH_MAX_CHUNKS
+    )
+    if not rows:
+        return None
+    batch = EmbeddingBatch(
+        status="created",
+        platform_company_id=platform_company_id,
+        model=model,
+        reembed=reembed,
+        first_chunk_id=rows[0].id,
+        last_chunk_id=rows[-1].id
+    )
+    db.add(batch)
+    await db.commit()
+    await db.refresh(batch)
+    logger.info(f"Пакет эмбеддингов {batch.id}: чанки {batch.first_chunk_id}..{batch.last_chunk_id} ({len(rows)} шт.).")
+    return batch
+
+
+async def _submit(db: AsyncSession, batch: EmbeddingBatch) -> None:
+    """Загружает JSONL с недостающими текстами диапазона и создает пакет Batch API."""
+    missing = await _missing_texts(db, await _range_chunks(db, batch), batch.model)
+    if not missing:
+        # Все тексты уже есть в хранилище: остается обновить чанки
+        await crud.embedding_batch.update_async(db, db_obj=batch, obj_in={"status": "completed", "requests": 0})
+        return
+
+    fd, path = tempfile.mkstemp(prefix=f"embedding_batch_{batch.id}_", suffix=".jsonl")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for content_hash, chunk_text in missing.items():
+                f.write(json.dumps(openai_client.embedding_batch_request(content_hash, chunk_text, batch.model), ensure_ascii=False))
+                f.write("\n")
+        input_file_id = await openai_client.upload_file_async(path, purpose="batch")
+    finally:
+        os.remove(path)
+    # ID файла сохраняется до создания пакета: при сбое между шагами файл удаляется при повторе
+    await crud.embedding_batch.update_async(db, db_obj=batch, obj_in={"openai_input_file_id": input_file_id, "requests": len(missing)})
+    openai_batch = await openai_client.create_batch_async(input_file_id, metadata={"embedding_batch_id": str(batch.id)})
+    await crud.embedding_batch.update_async(db, db_obj=batch, obj_in={
+        "status": "submitted",
+        "openai_batch_id": openai_batch.id,
+        "attempts": batch.attempts + 1,
+        "error": None
+    })
+
+
+async def _store_results(db: AsyncSession, batch: EmbeddingBatch, output_file_id: str) -> int:
+    """Построчно переносит эмбеддинги из файла результатов в хранилище embeddings."""
+    stored = 0
+    failed = 0
+    pending: List[schemas.embedding.EmbeddingCreate] = []
+    async for line in openai_client.iter_file_lines_async(output_file_id):
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            failed += 1
+            continue
+        pending.append(schemas.embedding.EmbeddingCreate(
+            content_hash=result["custom_id"],
+            model=batch.model,
+            embedding=response["body"]["data"][0]["embedding"]
+        ))
+        if len(pending) >= _STORE_BATCH:
+            stored += len(await crud.embedding.upsert_multi_async(db, objs_in=pending))
+            pending = []
+    if pending:
+        stored += len(await crud.embedding.upsert_multi_async(db, objs_in=pending))
+    if failed:
+        logger.warning(f"Пакет эмбеддингов {batch.id}: {failed} запросов завершились ошибкой, чанки останутся без эмбеддинга до следующего запуска.")
+    return stored
+
+
+async def _poll(db: AsyncSession, batch: EmbeddingBatch) -> None:
+    openai_batch = await openai_client.retrieve_batch_async(batch.openai_batch_id)
+    if openai_batch.status == "completed":
+        stored = await _store_results(db, batch, openai_batch.output_file_id) if openai_batch.output_file_id else 0
+        await crud.embedding_batch.update_async(db, db_obj=batch, obj_in={
+            "status": "completed",
+            "openai_output_file_id": openai_batch.output_file_id,
+            "openai_error_file_id": openai_batch.error_file_id,
+            "embedded": stored
+        })
+        logger.info(f"Пакет эмбеддингов {batch.id} ({openai_batch.id}) выполнен: получено {stored} эмбеддингов.")
+    elif openai_batch.status in _OPENAI_FAILED_STATUSES:
+        errors = getattr(openai_batch, "errors", None)
+        error = f"{openai_batch.status}: {errors}" if errors else openai_batch.status
+        # Повторная отправка: created снова загрузит тексты диапазона, которым еще нужен эмбеддинг
+        status = "failed" if batch.attempts >= settings.EMBEDDING_BATCH_MAX_ATTEMPTS else "created"
+        await crud.embedding_batch.update_async(db, db_obj=batch, obj_in={"status": status, "error": error})
+        logger.error(f"Пакет эмбеддингов {batch.id} ({openai_batch.id}) не выполнен ({error}), новый статус {status}.")
+    else:
+        counts = openai_batch.request_counts
+        progress = f"{counts.completed}/{counts.total}" if counts else "?"
+        logger.info(f"Пакет эмбеддингов {batch.id} ({openai_batch.id}): {openai_batch.status}, выполнено {progress}.")
+
+
+async def _apply(db: AsyncSession, batch: EmbeddingBatch) -> None:
+    """Записывает эмбеддинги из хранилища в чанки диапазона пакета."""
+    rows = await _range_chunks(db, batch)
+    hashes = [hashing.content_hash(row.text) for row in rows]
+    stored = await crud.embedding.get_by_hashes_async(db, content_hashes=hashes, model=batch.model)
+    matched = [(row, stored[content_hash].id) for row, content_hash in zip(rows, hashes) if content_hash in stored]
+
+    companies: Set[int] = set()
+    for start in range(0, len(matched), _APPLY_BATCH):
+        part = matched[start:start + _APPLY_BATCH]
+        await db.execute(_APPLY_EMBEDDINGS, {
+            "chunk_ids": [row.id for row, _ in part],
+            "company_ids": [row.platform_company_id for row, _ in part],
+            "embedding_ids": [embedding_id for _, embedding_id in part]
+        })
+        await db.commit()
+        companies.update(row.platform_company_id for row, _ in part)
+
+    for platform_company_id in sorted(companies):
+        # Ответы кэша собраны без этих чанков; индекс в памяти не содержит их векторов
+        await semantic_cache.invalidate_company(db, platform_company_id=platform_company_id)
+        while not memory_index.reset_company(platform_company_id):
+            await asyncio.sleep(1)
+    await crud.embedding_batch.update_async(db, db_obj=batch, obj_in={"status": "applied", "applied_chunks": len(matched)})
+    logger.info(f"Пакет эмбеддингов {batch.id}: обновлено {len(matched)} из {len(rows)} чанков диапазона.")
+
+
+async def advance(db: AsyncSession, batch: EmbeddingBatch) -> None:
+    """Выполняет следующий шаг пакета в зависимости от его статуса."""
+    if batch.status == "created":
+        if batch.openai_input_file_id:
+            # Файл прошлой попытки (сбой до создания пакета или failed/expired)
+            try:
+                await openai_client.delete_file_async(batch.openai_input_file_id)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить входной файл {batch.openai_input_file_id} пакета {batch.id}: {e}")
+        await _submit(db, batch)
+    elif batch.status == "submitted":
+        await _poll(db, batch)
+    if batch.status == "completed":
+        await _apply(db, batch)
+
+
+async def _advance_safely(db: AsyncSession, batch: EmbeddingBatch) -> None:
+    try:
+        await advance(db, batch)
+    except Exception as e:
+        await db.rollback()
+        logger.exception(f"Ошибка обработки пакета эмбеддингов {batch.id}: {e}")
+
+
+async def run_backfill(
+    *, platform_company_id: Optional[int] = None, reembed: bool = False, wait: bool = True,
+    poll_interval: Optional[float] = None
+) -> None:
+    """Продолжает незавершенные пакеты и создает новые, пока не будут обработаны все чанки.
+    wait=False — выполнить один проход (отправить пакеты и проверить готовые) и выйти."""
+    model = settings.EMBEDDING_MODEL
+    poll_interval = poll_interval or settings.EMBEDDING_BATCH_POLL_INTERVAL
+    scanned_all = False
+    after_id: Optional[int] = None
+    while True:
+        async with AsyncSessionLocal() as db:
+            unfinished = await crud.embedding_batch.get_unfinished_async(db, platform_company_id=platform_company_id, model=model)
+            if after_id is None:
+                # Продолжение: новые пакеты начинаются после диапазонов незавершенных
+                after_id = max((batch.last_chunk_id for batch in unfinished), default=0)
+            for batch in unfinished:
+                await _advance_safely(db, batch)
+
+            active = sum(1 for batch in unfinished if batch.status in ("created", "submitted"))
+            while not scanned_all and active < settings.EMBEDDING_BATCH_MAX_ACTIVE:
+                batch = await create_batch(db, platform_company_id=platform_company_id, model=model, reembed=reembed, after_id=after_id)
+                if batch is None:
+                    scanned_all = True
+                    break
+                after_id = batch.last_chunk_id
+                await _advance_safely(db, batch)
+                active += 1
+
+            remaining = await crud.embedding_batch.get_unfinished_async(db, platform_company_id=platform_company_id, model=model)
+
+        if scanned_all and not remaining:
+            logger.info("Переиндексирование эмбеддингов завершено.")
+            return
+        if not wait:
+            logger.info(f"Незавершенных пакетов эмбеддингов: {len(remaining)}.")
+            return
+        await asyncio.sleep(poll_interval)
+
+
+async def _main(args: argparse.Namespace) -> None:
+    try:
+        await run_backfill(
+            platform_company_id=args.company_id, reembed=args.reembed, wait=not args.no_wait,
+            poll_interval=args.poll_interval
+        )
+    finally:
+        await openai_client.close_openai_clients()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Переиндексирование эмбеддингов чанков через Batch API OpenAI")
+    parser.add_argument("--company-id", type=int, default=None, help="platform_company_id (по умолчанию все компании)")
+    parser.add_argument("--reembed", action="store_true", help="Пересчитать и эмбеддинги другой модели (EMBEDDING_MODEL)")
+    parser.add_argument("--no-wait", action="store_true", help="Один проход без ожидания выполнения пакетов")
+    parser.add_argument("--poll-interval", type=float, default=None, help="Секунды между проверками пакетов")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,604 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from openai import NotFoundError
+from sqlalchemy import text as sql_text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core import memory_index, partitions
+from app.core.company_cache import CachedCompany
+from app.core.database import AsyncSessionLocal
+from app import schemas, crud
+from app.services import answer_cache, semantic_cache
+from app.utils import openai_client, openai_ratelimit, hashing, single_flight
+
+logger = logging.getLogger(__name__)
+
+# Колбэк прогресса: принимает счетчики задачи (chunks_total, chunks_embedded, ...) и checkpoint
+ProgressCallback = Callable[..., Awaitable[None]]
+
+
+class IngestionError(Exception):
+    """Ошибка обработки документа, повтор которой не поможет (например, ошибка конфигурации компании)."""
+
+
+class RetryableIngestionError(Exception):
+    """Временная ошибка обработки документа (429/5xx OpenAI): задача будет повторена позже."""
+
+
+async def _no_progress(**fields: Any) -> None:
+    return None
+
+
+# Класс двухключевого advisory lock (int4) для создания компании и ее векторного хранилища
+_COMPANY_LOCK_CLASS = 72105
+
+# Параметры чанкинга (перекрытие учитывается при сборке контекста, см. context_packer)
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+
+# --- Вспомогательная функция для чанкинга --- 
+def simple_chunker(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Простой чанкер текста.
+    Делит текст на части примерно chunk_size символов с перекрытием chunk_overlap.
+    Создает один чанк, если текст короче chunk_size.
+    """
+    if len(text) <= chunk_size:
+        # Если текст короткий, возвращаем его как один чанк
+        stripped_text = text.strip()
+        return [stripped_text] if stripped_text else [] 
+
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        next_start = start + chunk_size - chunk_overlap
+        if next_start <= start: # Предотвращение бесконечного цикла при большом перекрытии
+            next_start = start + chunk_size # Двигаемся дальше без перекрытия в этом случае
+        start = next_start
+        if start >= len(text):
+            break
+    return [chunk for chunk in chunks if chunk.strip()]
+
+def _to_list(embedding) -> List[float]:
+    # vector читается как numpy.ndarray, halfvec — как pgvector HalfVector
+    if hasattr(embedding, "to_list"):
+        return embedding.to_list()
+    if hasattr(embedding, "tolist"):
+        return embedding.tolist()
+    return list(embedding)
+
+
+async def resolve_embeddings(
+    db: AsyncSession, chunks_text: List[str], request_missing: bool = True
+) -> Tuple[List[Optional[List[float]]], List[Optional[int]], int]:
+    """Получает эмбеддинги чанков через хранилище embeddings, адресуемое содержимым.
+
+    Для каждого чанка вычисляется sha256 нормализованного текста. Уже известные
+    (хэш, модель) берутся из хранилища, остальные уникальные тексты пакетно
+    отправляются в OpenAI и сохраняются. Одинаковые чанки внутри файла и между
+    файлами эмбеддятся один раз. При request_missing=False OpenAI не вызывается:
+    недостающие эмбеддинги получит переиндексирование через Batch API.
+    Временная ошибка OpenAI (429/5xx) поднимает RetryableIngestionError.
+
+    Returns:
+        (эмбеддинги, id в таблице embeddings, число переиспользованных эмбеддингов);
+        для чанков, эмбеддинг которых получить не удалось, — None.
+    """
+    model = settings.EMBEDDING_MODEL
+    hashes = [hashing.content_hash(chunk_text) for chunk_text in chunks_text]
+
+    vectors: Dict[str, List[float]] = {}
+    ids: Dict[str, int] = {}
+    stored = await crud.embedding.get_by_hashes_async(db, content_hashes=hashes, model=model)
+    for content_hash, obj in stored.items():
+        vectors[content_hash] = _to_list(obj.embedding)
+        ids[content_hash] = obj.id
+    reused = sum(1 for content_hash in hashes if content_hash in vectors)
+
+    # Уникальные тексты, которых нет в хранилище
+    missing: Dict[str, str] = {}
+    for content_hash, chunk_text in zip(hashes, chunks_text):
+        if content_hash not in vectors and content_hash not in missing:
+            missing[content_hash] = hashing.normalize_text(chunk_text)
+
+    if missing and request_missing:
+        try:
+            new_embeddings = await openai_client.get_embeddings_async(
+                texts=list(missing.values()), model=model, raise_retryable=True
+            )
+        except Exception as e:
+            if openai_ratelimit.is_retryable(e):
+                # Чанки без эмбеддингов не сохраняются: задача повторится, когда лимит восстановится
+                raise RetryableIngestionError(f"OpenAI временно не выдает эмбеддинги: {e}") from e
+            logger.exception(f"Ошибка пакетной генерации эмбеддингов: {e}. Чанки будут сохранены без эмбеддингов.")
+            new_embeddings = [None] * len(missing)
+
+        to_store = [
+            schemas.embedding.EmbeddingCreate(content_hash=content_hash, model=model, embedding=embedding)
+            for content_hash, embedding in zip(missing.keys(), new_embeddings) if embedding
+        ]
+        for obj in to_store:
+            vectors[obj.content_hash] = obj.embedding
+        try:
+            # Отдельная сессия: ошибка записи в хранилище не должна откатывать транзакцию запроса
+            async with AsyncSessionLocal() as store_db:
+                ids.update(await crud.embedding.upsert_multi_async(store_db, objs_in=to_store))
+        except Exception as e:
+            # Вектор все равно сохраняется в чанке, теряется только дедупликация
+            logger.exception(f"Ошибка сохранения эмбеддингов в хранилище: {e}")
+
+    logger.info(f"Эмбеддинги чанков: {reused} из хранилища, {len(missing)} уникальных текстов запрошено в OpenAI.")
+    return [vectors.get(h) for h in hashes], [ids.get(h) for h in hashes], reused
+
+
+async def find_unchanged_pg_document(
+    db: AsyncSession, *, platform_company_id: int, document_id: Optional[str], text: str
+):
+    """Запись files2 документа, если он уже полностью обработан с этим же текстом, иначе None."""
+    if not document_id:
+        return None
+    db_file = await crud.files2.get_by_document_id_async(db, platform_company_id=platform_company_id, document_id=document_id)
+    if db_file and db_file.content_hash == hashing.exact_hash(text):
+        return db_file
+    return None
+
+
+async def process_pg_document(
+    db: AsyncSession,
+    *,
+    platform_company_id: int,
+    text: str,
+    document_id: Optional[str] = None,
+    file_id: Optional[int] = None,
+    defer_embeddings: bool = False,
+    progress: ProgressCallback = _no_progress
+) -> Dict[str, Any]:
+    """Сохраняет текст в files2, разбивает на чанки, получает эмбеддинги и сохраняет
+    чанки в секцию компании таблицы chunks.
+
+    С document_id документ обновляется: если текст совпадает с уже обработанным,
+    ничего не делается (changed=False), иначе чанки прежней версии заменяются.
+    Если передан file_id (повтор задачи), используется уже созданная запись files2,
+    а ее чанки от прерванной попытки удаляются. defer_embeddings=True сохраняет
+    чанки только с уже известными эмбеддингами (остальные — через Batch API).
+
+    Returns:
+        Словарь с полями ProcessFileResponse.
+    """
+    logger.info(f"Обработка текста файла компании {platform_company_id} (длина: {len(text)}).")
+
+    if not file_id:
+        unchanged = await find_unchanged_pg_document(db, platform_company_id=platform_company_id, document_id=document_id, text=text)
+        if unchanged:
+            logger.info(f"Документ {document_id} компании {platform_company_id} не изменился (files2 ID {unchanged.id}).")
+            return schemas.response.ProcessFileResponse(
+                file_id=unchanged.id,
+                chunks_count=0,
+                changed=False,
+                message="Документ не изменился, обработка не требуется."
+            ).model_dump()
+        if document_id:
+            existing = await crud.files2.get_by_document_id_async(db, platform_company_id=platform_company_id, document_id=document_id)
+            file_id = existing.id if existing else None
+
+    # 1. Сохранить оригинальный текст в files2 (или продолжить с уже сохраненным)
+    db_file = await crud.files2.get_async(db, file_id) if file_id else None
+    if db_file:
+        # Сначала checkpoint: при сбое повтор продолжит с этой записью
+        await progress(checkpoint={"file_id": db_file.id})
+        # Хэш сбрасывается до замены чанков и записывается снова после сохранения новых
+        db_file = await crud.files2.update_async(db, db_obj=db_file, obj_in={"text": text, "content_hash": None})
+        removed = await crud.chunk.remove_by_file_id_async(db, file_id=db_file.id)
+        logger.info(f"Повторная обработка файла files2 ID {db_file.id}: удалено {removed} чанков прежней версии или прошлой попытки.")
+    else:
+        file_in = schemas.files2.Files2Create(text=text, platform_company_id=platform_company_id, document_id=document_id)
+        db_file = await crud.files2.create_async(db=db, obj_in=file_in)
+        logger.info(f"Текст сохранен в files2 с ID: {db_file.id}")
+    file_id = db_file.id
+    await progress(checkpoint={"file_id": file_id})
+
+    # 2. Разбить текст на чанки
+    chunks_text = simple_chunker(text)
+    if not chunks_text:
+         logger.warning("Текст не был разбит на чанки (возможно, пустой?).")
+         return schemas.response.ProcessFileResponse(
+             file_id=file_id,
+             chunks_count=0,
+             message="Файл сохранен, но чанки не созданы (текст пустой)."
+         ).model_dump()
+    logger.info(f"Текст разбит на {len(chunks_text)} чанков.")
+    await progress(chunks_total=len(chunks_text))
+
+    # 3. Получить эмбеддинги (из хранилища по хэшу текста или пакетно из OpenAI) и подготовить чанки
+    embeddings, embedding_ids, reused_embeddings = await resolve_embeddings(db, chunks_text, request_missing=not defer_embeddings)
+
+    chunks_to_create: List[schemas.chunk.ChunkCreate] = []
+    failed_embeddings = 0
+    for i, (chunk_text, embedding, embedding_id) in enumerate(zip(chunks_text, embeddings, embedding_ids)):
+        if not embedding:
+            if not defer_embeddings:
+                logger.warning(f"Не удалось получить эмбеддинг для чанка {i} файла {file_id}. Чанк будет сохранен без эмбеддинга.")
+            failed_embeddings += 1
+
+        chunks_to_create.append(schemas.chunk.ChunkCreate(
+            text=chunk_text,
+            index=i,
+            file_id=file_id,
+            platform_company_id=platform_company_id,
+            embedding=embedding,
+            embedding_id=embedding_id
+        ))
+    await progress(chunks_embedded=len(chunks_text) - failed_embeddings, chunks_failed=failed_embeddings)
+
+    # 4. Сохранить чанки в базу данных (bulk create)
+    chunk_ids = await crud.chunk.create_multi_async(db=db, objs_in=chunks_to_create)
+    logger.info(f"Успешно сохранено {len(chunk_ids)} чанков для файла {file_id} в БД.")
+    await progress(chunks_stored=len(chunk_ids))
+    await crud.files2.update_async(db, db_obj=db_file, obj_in={"content_hash": hashing.exact_hash(text)})
+    # Ответы, собранные по прежнему набору чанков компании, больше не выдаются из кэша
+    await semantic_cache.invalidate_company(db, platform_company_id=platform_company_id)
+    # Новые чанки сразу дописываются в индекс в памяти (если компания в MEMORY_INDEX_COMPANIES)
+    try:
+        await memory_index.refresh_company(platform_company_id)
+    except Exception as e:
+        logger.warning(f"Не удалось обновить индекс в памяти компании {platform_company_id}: {e}")
+
+    if failed_embeddings > 0 and defer_embeddings:
+         message = f"Файл и {len(chunk_ids)} чанков сохранены, эмбеддинги {failed_embeddings} чанков будут получены через Batch API."
+    elif failed_embeddings > 0:
+         message = f"Файл и {len(chunk_ids)} чанков успешно обработаны, но для {failed_embeddings} чанков не удалось получить эмбеддинг."
+    else:
+         message = f"Файл и {len(chunk_ids)} чанков успешно обработаны."
+    return schemas.response.ProcessFileResponse(
+        file_id=file_id,
+        chunks_count=len(chunk_ids),
+        reused_embeddings=reused_embeddings,
+        message=message
+    ).model_dump()
+
+
+async def get_or_create_company(db: AsyncSession, *, platform_company_id: int) -> CachedCompany:
+    """Находит компанию (через кэш компаний) или создает ее вместе с векторным хранилищем OpenAI.
+    Одновременные первые загрузки документов компании создают одно хранилище:
+    в процессе их объединяет single-flight, между процессами — advisory lock."""
+    company = await crud.company.get_cached_async(db, platform_company_id=platform_company_id)
+    if company:
+        logger.info(f"Компания {company.platform_company_id} (ID: {company.id}) найдена. Vector Store ID: {company.openai_vector_store_id}")
+        return company
+
+    return await single_flight.group.do(
+        ("company_bootstrap", platform_company_id),
+        lambda: _bootstrap_company(platform_company_id)
+    )
+
+
+async def _bootstrap_company(platform_company_id: int) -> CachedCompany:
+    """Создает компанию под advisory lock в собственной сессии: общий для нескольких
+    запросов вызов не должен зависеть от сессии одного из них."""
+    async with AsyncSessionLocal() as db:
+        # Блокировка держится до конца транзакции: остальные процессы дождутся commit и найдут компанию
+        await db.execute(
+            sql_text("SELECT pg_advisory_xact_lock(:key, :company_id)"),
+            {"key": _COMPANY_LOCK_CLASS, "company_id": platform_company_id}
+        )
+        company = await crud.company.get_by_platform_id_async(db, platform_company_id=platform_company_id)
+        if company:
+            await db.commit()
+            logger.info(f"Компания {company.platform_company_id} (ID: {company.id}) создана другим процессом. Vector Store ID: {company.openai_vector_store_id}")
+            return CachedCompany.from_model(company)
+
+        logger.warning(f"Компания с ID {platform_company_id} не найдена. Создание новой компании и векторного хранилища.")
+        vector_store_id = None
+        try:
+            # Создаем векторное хранилище в OpenAI
+            vector_store_name = f"Company_{platform_company_id}_Store"
+            vector_store = await openai_client.create_vector_store_async(name=vector_store_name)
+            vector_store_id = vector_store.id
+            logger.info(f"Создано векторное хранилище OpenAI с ID: {vector_store_id} для компании {platform_company_id}")
+
+            company_in = schemas.company.CompanyCreate(
+                platform_company_id=platform_company_id,
+                openai_vector_store_id=vector_store_id
+            )
+            company = await crud.company.create_async(db=db, obj_in=company_in)
+            logger.info(f"Создана запись для компании ID {company.id} (platform_id: {company.platform_company_id}) в базе данных.")
+        except Exception as e:
+            logger.error(f"Ошибка при создании компании {platform_company_id} или векторного хранилища: {e}")
+            # Если векторное хранилище было создано, но запись в БД не удалась, удаляем хранилище
+            if vector_store_id:
+                try:
+                    logger.warning(f"Попытка удалить векторное хранилище {vector_store_id} из-за ошибки сохранения компании в БД.")
+                    await openai_client.delete_vector_store_async(vector_store_id)
+                except Exception as delete_exc:
+                    logger.error(f"Не удалось удалить векторное хранилище {vector_store_id} после ошибки: {delete_exc}")
+            raise
+
+    # Секция chunks создается заранее, а не при первой вставке чанков компании.
+    # Ошибка не критична: create_multi_async повторит попытку
+    try:
+        await partitions.ensure_company_partition(platform_company_id)
+    except Exception as e:
+        logger.warning(f"Не удалось создать секцию chunks для компании {platform_company_id}: {e}")
+    return CachedCompany.from_model(company)
+
+
+async def is_openai_file_unchanged(
+    db: AsyncSession, *, platform_company_id: int, platform_file_id: int, file_text: str
+) -> bool:
+    """True, если этот же текст файла уже загружен в векторное хранилище компании
+    и после него файл не ставился на загрузку: задача в очереди заменит загруженную
+    версию другой, поэтому повтор прежнего текста тоже нужно поставить в очередь
+    (задача сама сравнит текст с сохраненным к моменту выполнения)."""
+    db_file = await crud.file.get_by_platform_ids_async(db, platform_company_id=platform_company_id, platform_file_id=platform_file_id)
+    if not (db_file and db_file.openai_file_id and db_file.content_hash == hashing.exact_hash(file_text)):
+        return False
+    return not await crud.ingest_job.has_pending_for_file_async(
+        db, platform_company_id=platform_company_id, platform_file_id=platform_file_id
+    )
+
+
+async def set_openai_file(
+    db: AsyncSession,
+    *,
+    platform_company_id: int,
+    platform_file_id: int,
+    file_text: str,
+    progress: ProgressCallback = _no_progress
+) -> Dict[str, Any]:
+    """Загружает текст файла в OpenAI (из памяти) и добавляет его в векторное хранилище компании.
+    Если файл уже зарегистрирован, заменяет его новой версией: новый файл загружается
+    и прикрепляется первым, а ID старого возвращается в replaced_openai_file_id —
+    его открепление и удаление выполняет отдельная задача (cleanup_openai_file).
+    Неизмененный текст (совпадает хэш) не загружается повторно: changed=False.
+
+    Returns:
+        Словарь с полями SetFileResponse.
+    """
+    # 1. Проверяем существование компании (создаем при первой загрузке)
+    company = await get_or_create_company(db, platform_company_id=platform_company_id)
+
+    vector_store_id = company.openai_vector_store_id # Получаем ID хранилища
+    if not vector_store_id:
+        logger.error(f"У компании {company.platform_company_id} (ID: {company.id}) отсутствует ID векторного хранилища. Невозможно обработать файл.")
+        raise IngestionError("Ошибка конфигурации компании: отсутствует vector_store_id")
+
+    # Используем метод get_by_platform_ids для поиска файла
+    db_file = await crud.file.get_by_platform_ids_async(db, platform_company_id=platform_company_id, platform_file_id=platform_file_id)
+    content_hash = hashing.exact_hash(file_text)
+    if db_file and db_file.openai_file_id and db_file.content_hash == content_hash:
+        logger.info(f"Файл с platform_id {platform_file_id} не изменился (OpenAI ID: {db_file.openai_file_id}), загрузка не требуется.")
+        return schemas.response.SetFileResponse(
+            platform_company_id=platform_company_id,
+            platform_file_id=platform_file_id,
+            changed=False,
+            message="Файл не изменился"
+        ).model_dump()
+    old_openai_file_id = db_file.openai_file_id if db_file else None
+    if db_file:
+        logger.info(f"Файл с platform_id {platform_file_id} уже существует в базе данных (ID: {db_file.id}, OpenAI ID: {old_openai_file_id}). Обновление файла.")
+    else:
+        logger.info(f"Файл с platform_id {platform_file_id} не найден в базе данных. Создание нового файла.")
+
+    openai_file_id = None # Инициализация для блока except
+    try:
+        # 2. Загружаем новый файл в OpenAI прямо из памяти
+        openai_file_id = await openai_client.upload_bytes_async(
+            file_text.encode("utf-8"),
+            filename=f"Company_{platform_company_id}-File_{platform_file_id}.txt",
+            purpose="assistants"
+        )
+        logger.info(f"Файл загружен в OpenAI с ID: {openai_file_id}")
+
+        # 3. Добавляем файл в векторное хранилище компании (нарезка — по профилю компании)
+        await openai_client.add_file_to_vector_store_async(
+            vector_store_id=vector_store_id,
+            file_id=openai_file_id,
+            chunking_strategy=openai_client.chunking_strategy(company.profile)
+        )
+        logger.info(f"Файл {openai_file_id} добавлен в векторное хранилище {vector_store_id}")
+
+        # 4. Сохраняем новый OpenAI ID в нашей базе данных
+        if db_file:
+            # Старый файл запоминается до обновления записи: при повторе задачи он будет удален,
+            # если запись уже ссылается на новый (см. jobs._submit_cleanup)
+            await progress(checkpoint={"replaced_openai_file_id": old_openai_file_id})
+            file_update = schemas.file.FileUpdate(file_text=file_text, openai_file_id=openai_file_id, content_hash=content_hash)
+            db_file = await crud.file.update_async(db=db, db_obj=db_file, obj_in=file_update)
+            logger.info(f"Запись файла ID {db_file.id} обновлена в базе данных. Новый OpenAI ID: {db_file.openai_file_id}")
+        else:
+            file_in = schemas.file.FileCreate(
+                platform_file_id=platform_file_id,
+                platform_company_id=platform_company_id,
+                file_text=file_text,
+                openai_file_id=openai_file_id,
+                content_hash=content_hash
+            )
+            db_file = await crud.file.create_async(db=db, obj_in=file_in)
+            logger.info(f"Создана запись для файла ID {db_file.id} (platform_id: {db_file.platform_file_id}) в базе данных.")
+
+    except Exception as e:
+        logger.error(f"Ошибка при обработке файла platform_id {platform_file_id}: {e}")
+        if openai_file_id:
+            try:
+                logger.warning(f"Попытка удалить новый файл {openai_file_id} из OpenAI из-за ошибки.")
+                await openai_client.delete_file_async(openai_file_id)
+            except Exception as delete_exc:
+                logger.error(f"Не удалось удалить новый файл {openai_file_id} из OpenAI после ошибки: {delete_exc}")
+        raise
+
+    # Ответы /messages/, полученные по прежним файлам компании, больше не выдаются из кэша
+    await answer_cache.invalidate_company(db, platform_company_id=platform_company_id)
+
+    return schemas.response.SetFileResponse(
+        platform_company_id=platform_company_id,
+        platform_file_id=platform_file_id,
+        replaced_openai_file_id=old_openai_file_id,
+        message="Файл успешно обработан"
+    ).model_dump()
+
+
+async def cleanup_openai_file(*, vector_store_id: Optional[str], openai_file_id: str) -> None:
+    """Открепляет замененный файл от векторного хранилища и удаляет его из OpenAI.
+    Уже удаленные связь или файл не считаются ошибкой; остальные ошибки
+    пробрасываются, чтобы задача была повторена."""
+    if vector_store_id:
+        try:
+            await openai_client.delete_file_from_vector_store_async(vector_store_id=vector_store_id, file_id=openai_file_id)
+        except NotFoundError:
+            logger.info(f"Связи файла {openai_file_id} с хранилищем {vector_store_id} уже нет.")
+    try:
+        await openai_client.delete_file_async(file_id=openai_file_id)
+    except NotFoundError:
+        logger.info(f"Файл {openai_file_id} уже удален из OpenAI.")
+
+
+async def set_openai_files_bulk(
+    db: AsyncSession,
+    *,
+    platform_company_id: int,
+    files: List[Dict[str, Any]],
+    progress: ProgressCallback = _no_progress
+) -> Dict[str, Any]:
+    """Массовый вариант set_openai_file для многих документов компании.
+
+    Неизмененные документы пропускаются, остальные загружаются в OpenAI параллельно
+    (до FILES_BULK_UPLOAD_CONCURRENCY), прикрепляются к хранилищу пакетами
+    vector_stores.file_batches, а записи files сохраняются одной транзакцией.
+    Ошибка отдельного документа не прерывает остальные: результат по каждому
+    документу — в results. Замененные файлы возвращаются в replaced_openai_file_id
+    и удаляются отдельными задачами, как в set_openai_file.
+
+    Returns:
+        Словарь с полями BulkSetFilesResponse.
+    """
+    company = await get_or_create_company(db, platform_company_id=platform_company_id)
+    vector_store_id = company.openai_vector_store_id
+    if not vector_store_id:
+        raise IngestionError("Ошибка конфигурации компании: отсутствует vector_store_id")
+
+    # Повторяющийся platform_file_id: действует последняя версия текста
+    texts: Dict[int, str] = {item["platform_file_id"]: item["file_text"] for item in files}
+    existing = await crud.file.get_by_platform_file_ids_async(db, platform_company_id=platform_company_id, platform_file_ids=list(texts))
+    hashes = {platform_file_id: hashing.exact_hash(file_text) for platform_file_id, file_text in texts.items()}
+
+    results: Dict[int, schemas.response.BulkFileResult] = {}
+    to_upload: List[int] = []
+    for platform_file_id in texts:
+        db_file = existing.get(platform_file_id)
+        if db_file and db_file.openai_file_id and db_file.content_hash == hashes[platform_file_id]:
+            results[platform_file_id] = schemas.response.BulkFileResult(
+                platform_file_id=platform_file_id, status="unchanged", openai_file_id=db_file.openai_file_id
+            )
+        else:
+            to_upload.append(platform_file_id)
+    logger.info(f"Массовая загрузка компании {platform_company_id}: {len(texts)} документов, {len(to_upload)} к загрузке.")
+
+    # 1. Параллельная загрузка файлов из памяти
+    semaphore = asyncio.Semaphore(max(1, settings.FILES_BULK_UPLOAD_CONCURRENCY))
+    uploaded: Dict[int, str] = {}
+
+    async def _upload(platform_file_id: int) -> None:
+        async with semaphore:
+            try:
+                uploaded[platform_file_id] = await openai_client.upload_bytes_async(
+                    texts[platform_file_id].encode("utf-8"),
+                    filename=f"Company_{platform_company_id}-File_{platform_file_id}.txt",
+                    purpose="assistants"
+                )
+            except Exception as e:
+                results[platform_file_id] = schemas.response.BulkFileResult(
+                    platform_file_id=platform_file_id, status="failed", error=f"Ошибка загрузки в OpenAI: {e}"
+                )
+
+    await asyncio.gather(*(_upload(platform_file_id) for platform_file_id in to_upload))
+
+    # 2. Прикрепление к хранилищу пакетами file_batches (пакеты выполняются параллельно)
+    file_ids = list(uploaded.values())
+    batch_size = max(1, settings.VECTOR_STORE_FILE_BATCH_SIZE)
+    failed_file_ids: Dict[str, str] = {}
+
+    async def _attach(batch_file_ids: List[str]) -> None:
+        try:
+            _, failed = await openai_client.add_files_batch_to_vector_store_async(
+                vector_store_id, batch_file_ids, chunking_strategy=openai_client.chunking_strategy(company.profile)
+            )
+            failed_file_ids.update({file_id: "Файл не прикреплен к векторному хранилищу" for file_id in failed})
+        except Exception as e:
+            failed_file_ids.update({file_id: f"Ошибка прикрепления к векторному хранилищу: {e}" for file_id in batch_file_ids})
+
+    await asyncio.gather(*(_attach(file_ids[start:start + batch_size]) for start in range(0, len(file_ids), batch_size)))
+
+    # 3. Записи files одной транзакцией
+    updates: List[Tuple[Any, schemas.file.FileUpdate]] = []
+    creates: List[schemas.file.FileCreate] = []
+    for platform_file_id, openai_file_id in uploaded.items():
+        if openai_file_id in failed_file_ids:
+            results[platform_file_id] = schemas.response.BulkFileResult(
+                platform_file_id=platform_file_id, status="failed", error=failed_file_ids[openai_file_id]
+            )
+            continue
+        db_file = existing.get(platform_file_id)
+        if db_file:
+            results[platform_file_id] = schemas.response.BulkFileResult(
+                platform_file_id=platform_file_id, status="updated", openai_file_id=openai_file_id,
+                replaced_openai_file_id=db_file.openai_file_id
+            )
+            updates.append((db_file, schemas.file.FileUpdate(
+                file_text=texts[platform_file_id], openai_file_id=openai_file_id, content_hash=hashes[platform_file_id]
+            )))
+        else:
+            results[platform_file_id] = schemas.response.BulkFileResult(
+                platform_file_id=platform_file_id, status="created", openai_file_id=openai_file_id
+            )
+            creates.append(schemas.file.FileCreate(
+                platform_file_id=platform_file_id,
+                platform_company_id=platform_company_id,
+                file_text=texts[platform_file_id],
+                openai_file_id=openai_file_id,
+                content_hash=hashes[platform_file_id]
+            ))
+
+    replaced = [result.replaced_openai_file_id for result in results.values() if result.replaced_openai_file_id]
+    try:
+        # Старые файлы запоминаются до обновления записей: при повторе задачи удаляются те из них,
+        # на которые записи files уже не ссылаются (см. jobs._submit_cleanup)
+        await progress(checkpoint={"replaced_openai_file_ids": replaced})
+        await crud.file.save_multi_async(db, updates=updates, objs_in=creates)
+    except Exception:
+        # Записи не сохранены: новые файлы не нужны
+        await db.rollback()
+        await _delete_files_quietly(file_ids)
+        raise
+
+    # Файлы, которые не удалось прикрепить, не сохранены в files
+    await _delete_files_quietly(list(failed_file_ids))
+    if updates or creates:
+        await answer_cache.invalidate_company(db, platform_company_id=platform_company_id)
+
+    ordered = [results[platform_file_id] for platform_file_id in texts]
+    counts = {status: sum(1 for result in ordered if result.status == status) for status in ("created", "updated", "unchanged", "failed")}
+    logger.info(f"Массовая загрузка компании {platform_company_id} завершена: {counts}.")
+    return schemas.response.BulkSetFilesResponse(
+        platform_company_id=platform_company_id,
+        results=ordered,
+        **counts
+    ).model_dump()
+
+
+async def _delete_files_quietly(file_ids: List[str]) -> None:
+    """Удаляет загруженные, но не сохраненные файлы OpenAI (ошибки только логируются)."""
+    semaphore = asyncio.Semaphore(max(1, settings.FILES_BULK_UPLOAD_CONCURRENCY))
+
+    async def _delete(file_id: str) -> None:
+        async with semaphore:
+            try:
+                await openai_client.delete_file_async(file_id)
+            except Exception as e:
+                logger.warning(f"Не удалось удалить файл {file_id} из OpenAI: {e}")
+
+    await asyncio.gather(*(_delete(file_id) for file_id in file_ids))
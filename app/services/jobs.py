@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app import schemas, crud
+from app.models.ingest_job import IngestJob
+from app.services import ingestion
+from app.services.ingestion import IngestionError, ProgressCallback
+
+logger = logging.getLogger(__name__)
+
+# Типы задач
+JOB_KIND_PG_PROCESS = "pg_process" # Документ -> files2 + чанки с эмбеддингами (pgvector)
+JOB_KIND_OPENAI_FILE = "openai_file" # Документ -> файл в векторном хранилище OpenAI
+JOB_KIND_OPENAI_FILE_CLEANUP = "openai_file_cleanup" # Открепление и удаление замененного файла OpenAI
+JOB_KIND_OPENAI_FILE_BULK = "openai_file_bulk" # Много документов компании -> файлы в векторном хранилище OpenAI
+
+# Событие «в очереди появилась задача»: будит воркеры раньше очередного опроса
+_wakeup = asyncio.Event()
+_worker_tasks: List[asyncio.Task] = []
+
+
+async def _run_pg_process(db: AsyncSession, job: IngestJob, progress: ProgressCallback) -> Dict[str, Any]:
+    return await ingestion.process_pg_document(
+        db,
+        platform_company_id=job.platform_company_id,
+        text=job.payload["text"],
+        document_id=job.payload.get("document_id"),
+        file_id=(job.checkpoint or {}).get("file_id"),
+        defer_embeddings=job.payload.get("embedding_mode") == "batch",
+        progress=progress
+    )
+
+
+async def _run_openai_file(db: AsyncSession, job: IngestJob, progress: ProgressCallback) -> Dict[str, Any]:
+    result = await ingestion.set_openai_file(
+        db,
+        platform_company_id=job.platform_company_id,
+        platform_file_id=job.payload["platform_file_id"],
+        file_text=job.payload["file_text"],
+        progress=progress
+    )
+    # Старая версия удаляется отдельной задачей, чтобы замена не ждала двух лишних запросов к OpenAI.
+    # Checkpoint прерванной попытки хранит файл, замененный до сбоя
+    checkpoint = job.checkpoint or {}
+    await _submit_cleanup(db, job, {checkpoint.get("replaced_openai_file_id"), result.get("replaced_openai_file_id")})
+    return result
+
+
+async def _run_openai_file_bulk(db: AsyncSession, job: IngestJob, progress: ProgressCallback) -> Dict[str, Any]:
+    result = await ingestion.set_openai_files_bulk(
+        db,
+        platform_company_id=job.platform_company_id,
+        files=job.payload["files"],
+        progress=progress
+    )
+    checkpoint = job.checkpoint or {}
+    replaced = set(checkpoint.get("replaced_openai_file_ids") or [])
+    replaced.update(item["replaced_openai_file_id"] for item in result["results"])
+    await _submit_cleanup(db, job, replaced)
+    return result
+
+
+async def _submit_cleanup(db: AsyncSession, job: IngestJob, openai_file_ids: Set[Optional[str]]) -> None:
+    """Ставит задачи удаления замененных файлов OpenAI компании задачи.
+    Checkpoint пишется до сохранения записей files: если сохранение не удалось,
+    «замененный» файл все еще используется. Удаляются только файлы, на которые
+    не ссылается ни одна запись files."""
+    openai_file_ids = openai_file_ids - {None}
+    if not openai_file_ids:
+        return
+    referenced = await crud.file.get_referenced_openai_file_ids_async(db, openai_file_ids=openai_file_ids)
+    if referenced:
+        logger.info(f"Задача {job.id}: файлы {sorted(referenced)} еще используются и не удаляются.")
+    openai_file_ids = openai_file_ids - referenced
+    if not openai_file_ids:
+        return
+    company = await crud.company.get_cached_async(db, platform_company_id=job.platform_company_id)
+    for openai_file_id in sorted(openai_file_ids):
+        await submit_job(
+            db,
+            kind=JOB_KIND_OPENAI_FILE_CLEANUP,
+            platform_company_id=job.platform_company_id,
+            payload={"vector_store_id": company.openai_vector_store_id if company else None, "openai_file_id": openai_file_id}
+        )
+
+
+async def _run_openai_file_cleanup(db: AsyncSession, job: IngestJob, progress: ProgressCallback) -> Dict[str, Any]:
+    await ingestion.cleanup_openai_file(
+        vector_store_id=job.payload.get("vector_store_id"),
+        openai_file_id=job.payload["openai_file_id"]
+    )
+    return {"openai_file_id": job.payload["openai_file_id"], "message": "Замененный файл удален из OpenAI"}
+
+
+_HANDLERS: Dict[str, Callable[[AsyncSession, IngestJob, ProgressCallback], Awaitable[Dict[str, Any]]]] = {
+    JOB_KIND_PG_PROCESS: _run_pg_process,
+    JOB_KIND_OPENAI_FILE: _run_openai_file,
+    JOB_KIND_OPENAI_FILE_CLEANUP: _run_openai_file_cleanup,
+    JOB_KIND_OPENAI_FILE_BULK: _run_openai_file_bulk,
+}
+
+
+async def submit_job(db: AsyncSession, *, kind: str, platform_company_id: Optional[int], payload: Dict[str, Any]) -> IngestJob:
+    """Ставит задачу в очередь и будит воркеры этого процесса.
+    Воркеры других процессов заберут ее при следующем опросе."""
+    if kind not in _HANDLERS:
+        raise ValueError(f"Неизвестный тип задачи: {kind!r}")
+    job_in = schemas.ingest_job.IngestJobCreate(
+        kind=kind,
+        platform_company_id=platform_company_id,
+        payload=payload,
+        max_attempts=settings.INGEST_JOB_MAX_ATTEMPTS
+    )
+    job = await crud.ingest_job.create_async(db, obj_in=job_in)
+    logger.info(f"Задача {job.id} ({kind}) поставлена в очередь для компании {platform_company_id}.")
+    _wakeup.set()
+    return job
+
+
+def _progress_reporter(job: IngestJob) -> ProgressCallback:
+    """Записывает прогресс задачи отдельной сессией, чтобы он был виден
+    в GET /jobs/{id} до завершения обработки. Каждое обновление продлевает
+    locked_at. Прогресс пишется, только пока задача принадлежит этому воркеру."""
+    async def report(**fields: Any) -> None:
+        try:
+            async with AsyncSessionLocal() as db:
+                await crud.ingest_job.update_progress_async(db, job_id=job.id, worker_id=job.locked_by, locked_at=func.now(), **fields)
+        except Exception as e:
+            # Прогресс информационный, его потеря не должна прерывать обработку
+            logger.warning(f"Не удалось обновить прогресс задачи {job.id}: {e}")
+    return report
+
+
+async def _heartbeat(job: IngestJob) -> None:
+    """Продлевает locked_at, пока задача выполняется: задача без долгих шагов
+    с прогрессом не должна считаться зависшей и запускаться вторым воркером."""
+    while True:
+        await asyncio.sleep(settings.INGEST_JOB_HEARTBEAT_INTERVAL)
+        try:
+            async with AsyncSessionLocal() as db:
+                owned = await crud.ingest_job.heartbeat_async(db, job_id=job.id, worker_id=job.locked_by)
+        except Exception as e:
+            logger.warning(f"Не удалось продлить блокировку задачи {job.id}: {e}")
+            continue
+        if not owned:
+            logger.warning(f"Задача {job.id} больше не принадлежит воркеру {job.locked_by}: ее результат не будет записан.")
+            return
+
+
+def _retry_delay(job: IngestJob, error: Exception) -> Optional[float]:
+    """Задержка перед повтором (экспоненциальная) или None, если повторять не нужно."""
+    if isinstance(error, IngestionError) or job.attempts >= job.max_attempts:
+        return None
+    return settings.INGEST_JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+
+
+async def _run_job(job: IngestJob) -> None:
+    logger.info(f"Задача {job.id} ({job.kind}) запущена, попытка {job.attempts} из {job.max_attempts}.")
+    heartbeat = asyncio.create_task(_heartbeat(job))
+    try:
+        handler = _HANDLERS.get(job.kind)
+        if handler is None:
+            raise IngestionError(f"Неизвестный тип задачи: {job.kind!r}")
+        async with AsyncSessionLocal() as db:
+            result = await handler(db, job, _progress_reporter(job))
+    except asyncio.CancelledError:
+        # Остановка процесса: возвращаем задачу в очередь без ожидания INGEST_JOB_STALE_AFTER
+        async with AsyncSessionLocal() as db:
+            await asyncio.shield(crud.ingest_job.mark_failed_async(db, job=job, error="Прервана остановкой воркера", retry_delay=0))
+        raise
+    except Exception as e:
+        delay = _retry_delay(job, e)
+        if delay is None:
+            logger.exception(f"Задача {job.id} ({job.kind}) завершилась ошибкой: {e}")
+        else:
+            logger.warning(f"Задача {job.id} ({job.kind}) завершилась ошибкой, повтор через {delay:.0f} с: {e}")
+        async with AsyncSessionLocal() as db:
+            if not await crud.ingest_job.mark_failed_async(db, job=job, error=str(e), retry_delay=delay):
+                logger.warning(f"Задача {job.id} передана другому воркеру: ошибка этой попытки не записана.")
+        return
+    finally:
+        heartbeat.cancel()
+
+    async with AsyncSessionLocal() as db:
+        if not await crud.ingest_job.mark_succeeded_async(db, job=job, result=result):
+            logger.warning(f"Задача {job.id} передана другому воркеру: результат этой попытки не записан.")
+            return
+    logger.info(f"Задача {job.id} ({job.kind}) выполнена.")
+
+
+async def _worker(worker_id: str) -> None:
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await crud.ingest_job.claim_next_async(db, worker_id=worker_id)
+        except Exception as e:
+            logger.error(f"Воркер {worker_id}: ошибка получения задачи из очереди: {e}")
+            job = None
+
+        if job is not None:
+            await _run_job(job)
+            continue
+
+        # Очередь пуста: ждем новую задачу или следующий опрос
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.INGEST_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+async def _requeue_stale_jobs() -> None:
+    """Периодически возвращает в очередь задачи, воркер которых перестал отвечать."""
+    interval = max(settings.INGEST_POLL_INTERVAL, settings.INGEST_JOB_STALE_AFTER / 4)
+    while True:
+        try:
+            async with AsyncSessionLocal() as db:
+                requeued = await crud.ingest_job.requeue_stale_async(db, stale_after=settings.INGEST_JOB_STALE_AFTER)
+            if requeued:
+                logger.warning(f"Зависших задач возвращено в очередь или завершено (max_attempts): {requeued}.")
+        except Exception as e:
+            logger.error(f"Ошибка возврата зависших задач в очередь: {e}")
+        await asyncio.sleep(interval)
+
+
+def start_workers() -> None:
+    """Запускает пул воркеров очереди загрузки (INGEST_WORKER_CONCURRENCY задач одновременно)."""
+    if _worker_tasks:
+        return
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(settings.INGEST_WORKER_CONCURRENCY):
+        _worker_tasks.append(asyncio.create_task(_worker(f"{prefix}:{i}")))
+    _worker_tasks.append(asyncio.create_task(_requeue_stale_jobs()))
+    logger.info(f"Запущено воркеров очереди загрузки: {settings.INGEST_WORKER_CONCURRENCY}.")
+
+
+async def stop_workers() -> None:
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
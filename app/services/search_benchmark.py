@@ -0,0 +1,120 @@
+"""Сравнение стратегий поиска похожих чанков с точным перебором.
+
+Запросами служат эмбеддинги случайных чанков компании. Для каждой стратегии
+измеряется время запроса и recall@limit относительно стратегии exact.
+
+    python -m app.services.search_benchmark --company-id 1 --queries 50 --limit 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from app.core import vector_index
+from app.core.database import AsyncSessionLocal, async_engine
+from app import crud
+
+logger = logging.getLogger(__name__)
+
+
+async def _sample_queries(platform_company_id: int, count: int) -> List[List[float]]:
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(
+            text("""
+                SELECT embedding::text
+                FROM chunks
+                WHERE platform_company_id = :platform_company_id AND embedding IS NOT NULL
+                ORDER BY random()
+                LIMIT :count
+            """),
+            {"platform_company_id": platform_company_id, "count": count}
+        )).scalars().all()
+    return [json.loads(row) for row in rows]
+
+
+async def _search(
+    query_embedding: List[float], platform_company_id: int, limit: int, strategy: str, ef_search: Optional[int]
+) -> Dict[str, object]:
+    # Отдельная сессия (транзакция) на запрос: set_config(..., true) не переходит между стратегиями
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        chunks = await crud.chunk.get_similar_chunks_async(
+            db,
+            query_embedding=query_embedding,
+            platform_company_id=platform_company_id,
+            limit=limit,
+            ef_search=ef_search,
+            strategy=strategy
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    return {"ids": [chunk.id for chunk in chunks], "ms": elapsed_ms}
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run_benchmark(
+    *, platform_company_id: int, queries: int = 50, limit: int = 5,
+    strategies: Optional[List[str]] = None, ef_search: Optional[int] = None
+) -> Dict[str, Dict[str, float]]:
+    """Возвращает {стратегия: {recall, mean_ms, p50_ms, p95_ms}}; эталон — exact."""
+    strategies = strategies or [vector_index.STRATEGY_ANN, vector_index.STRATEGY_BINARY]
+    query_embeddings = await _sample_queries(platform_company_id, queries)
+    if not query_embeddings:
+        raise ValueError(f"У компании {platform_company_id} нет чанков с эмбеддингами.")
+
+    results: Dict[str, Dict[str, float]] = {}
+    exact: List[List[int]] = []
+    for strategy in [vector_index.STRATEGY_EXACT] + [s for s in strategies if s != vector_index.STRATEGY_EXACT]:
+        timings: List[float] = []
+        recalls: List[float] = []
+        for i, query_embedding in enumerate(query_embeddings):
+            found = await _search(query_embedding, platform_company_id, limit, strategy, ef_search)
+            timings.append(found["ms"])
+            if strategy == vector_index.STRATEGY_EXACT:
+                exact.append(found["ids"])
+            elif exact[i]:
+                recalls.append(len(set(found["ids"]) & set(exact[i])) / len(exact[i]))
+        results[strategy] = {
+            "recall": statistics.mean(recalls) if recalls else 1.0,
+            "mean_ms": statistics.mean(timings),
+            "p50_ms": _percentile(timings, 0.5),
+            "p95_ms": _percentile(timings, 0.95),
+        }
+    return results
+
+
+async def _main(args: argparse.Namespace) -> None:
+    try:
+        await vector_index.detect_pgvector_version(async_engine)
+        results = await run_benchmark(
+            platform_company_id=args.company_id,
+            queries=args.queries,
+            limit=args.limit,
+            strategies=args.strategies.split(","),
+            ef_search=args.ef_search
+        )
+    finally:
+        await async_engine.dispose()
+
+    print(f"{'strategy':<10} {'recall@' + str(args.limit):>10} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10}")
+    for strategy, stats in results.items():
+        print(f"{strategy:<10} {stats['recall']:>10.3f} {stats['mean_ms']:>10.2f} {stats['p50_ms']:>10.2f} {stats['p95_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall и задержка стратегий поиска чанков относительно точного перебора")
+    parser.add_argument("--company-id", type=int, required=True)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--strategies", default="ann,binary", help="Через запятую: ann, binary")
+    parser.add_argument("--ef-search", type=int, default=None)
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(_main(parser.parse_args()))
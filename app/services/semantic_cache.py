@@ -0,0 +1,105 @@
+import logging
+from typing import List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app import schemas, crud
+from app.crud.crud_corpus_version import SCOPE_CHUNKS
+from app.models.chunk import Chunk
+from app.models.semantic_cache import SemanticCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# Счетчики процесса для GET /messagespg/cache/stats/
+_stats = {"hits": 0, "misses": 0, "stores": 0}
+
+
+async def lookup(
+    db: AsyncSession, *, platform_company_id: int, corpus_version: int, query_embedding: List[float]
+) -> Optional[SemanticCacheEntry]:
+    """Ищет сохраненный для этой версии корпуса ответ на близкий по смыслу запрос
+    компании (косинусное расстояние не больше SEMANTIC_CACHE_MAX_DISTANCE)."""
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    try:
+        entry = await crud.semantic_cache.find_similar_async(
+            db,
+            platform_company_id=platform_company_id,
+            corpus_version=corpus_version,
+            query_embedding=query_embedding,
+            max_distance=settings.SEMANTIC_CACHE_MAX_DISTANCE,
+            ttl=settings.SEMANTIC_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Ошибка поиска в семантическом кэше компании {platform_company_id}: {e}")
+        await db.rollback()
+        entry = None
+    if entry is None:
+        _stats["misses"] += 1
+    else:
+        _stats["hits"] += 1
+        logger.info(f"Семантический кэш: ответ записи {entry.id} для запроса компании {platform_company_id}.")
+    return entry
+
+
+async def get_corpus_version(db: AsyncSession, *, platform_company_id: int) -> int:
+    """Версию корпуса нужно прочитать до поиска чанков: если корпус изменится
+    во время генерации ответа, ответ сохранится с устаревшей версией и не будет выдан."""
+    return await crud.corpus_version.get_version_async(db, platform_company_id=platform_company_id, scope=SCOPE_CHUNKS)
+
+
+async def store(
+    *, platform_company_id: int, corpus_version: int, query_text: str,
+    query_embedding: List[float], answer: str, chunks: List[Chunk]
+) -> None:
+    """Сохраняет ответ и вытесняет устаревшие записи компании.
+    Использует отдельную сессию: вызывается и после завершения потокового ответа.
+    Ответ, собранный по уже устаревшей версии корпуса, не сохраняется: он не был
+    бы выдан, а вытеснение по его версии удалило бы актуальные записи."""
+    if not settings.SEMANTIC_CACHE_ENABLED or not answer:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            current_version = await get_corpus_version(db, platform_company_id=platform_company_id)
+            if current_version != corpus_version:
+                logger.info(f"Семантический кэш: корпус компании {platform_company_id} изменился во время ответа, ответ не сохраняется.")
+                return
+            entry_in = schemas.semantic_cache.SemanticCacheEntryCreate(
+                platform_company_id=platform_company_id,
+                corpus_version=corpus_version,
+                query_text=query_text,
+                query_embedding=query_embedding,
+                answer=answer,
+                source_chunk_ids=[chunk.id for chunk in chunks],
+                source_file_ids=sorted({chunk.file_id for chunk in chunks})
+            )
+            await crud.semantic_cache.create_async(db, obj_in=entry_in)
+            _stats["stores"] += 1
+            await crud.semantic_cache.evict_async(
+                db,
+                platform_company_id=platform_company_id,
+                corpus_version=corpus_version,
+                ttl=settings.SEMANTIC_CACHE_TTL,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES
+            )
+    except Exception as e:
+        # Кэш необязателен: ошибка сохранения не влияет на ответ
+        logger.warning(f"Не удалось сохранить ответ в семантический кэш компании {platform_company_id}: {e}")
+
+
+async def invalidate_company(db: AsyncSession, *, platform_company_id: int) -> None:
+    """Делает недействительными кэшированные ответы компании (после изменения ее чанков)."""
+    version = await crud.corpus_version.bump_async(db, platform_company_id=platform_company_id, scope=SCOPE_CHUNKS)
+    logger.info(f"Версия корпуса chunks компании {platform_company_id}: {version}.")
+
+
+def get_stats() -> schemas.semantic_cache.SemanticCacheStats:
+    lookups = _stats["hits"] + _stats["misses"]
+    return schemas.semantic_cache.SemanticCacheStats(
+        hits=_stats["hits"],
+        misses=_stats["misses"],
+        stores=_stats["stores"],
+        hit_rate=_stats["hits"] / lookups if lookups else 0.0
+    )
@@ -6,12 +6,16 @@ from . import openai_client
 from .openai_client import (
     # client as openai_api_client, # Не экспортируется client, есть get_openai_client
     get_openai_client, # Добавляем
+    get_async_openai_client,
+    get_connection_pool_stats,
     create_vector_store,
     delete_vector_store, # Добавляем
     upload_file, # Исправляем имя
     delete_file, # Исправляем имя
     add_file_to_vector_store,
     delete_file_from_vector_store, # Исправляем имя
+    get_embedding,
+    get_embeddings,
     # remove_file_from_vector_store, # Неверное имя
     # delete_file_from_openai, # Неверное имя
     # get_openai_response # Этой функции нет
@@ -0,0 +1,17 @@
+import hashlib
+
+
+def normalize_text(text: str) -> str:
+    """Нормализует текст перед хэшированием и эмбеддингом: схлопывает пробельные
+    символы (в том числе переводы строк) в один пробел и обрезает края."""
+    return " ".join(text.split())
+
+
+def exact_hash(text: str) -> str:
+    """sha256 (hex) текста без нормализации: совпадает только у побайтно одинаковых документов."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def content_hash(text: str) -> str:
+    """sha256 (hex) нормализованного текста."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
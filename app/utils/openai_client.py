@@ -1,22 +1,146 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+import asyncio
+import httpx
 import logging
 import os
+import threading
 from dotenv import load_dotenv
 import time
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
+
+from app.core.config import settings
+from app.schemas.company import RetrievalProfile
+from app.utils import openai_ratelimit, single_flight
+from app.utils.openai_ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, estimate_tokens
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Общие на весь процесс клиенты OpenAI и их пулы соединений (создаются лениво)
+_client: Optional[OpenAI] = None
+_async_client: Optional[AsyncOpenAI] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_client_lock = threading.Lock()
+
 
-def get_openai_client():
+def _get_api_key() -> str:
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
         logger.error("API-ключ OpenAI не найден в переменных окружения (OPENAI_API_KEY).")
         raise ValueError("Необходимо установить переменную окружения OPENAI_API_KEY")
-    return OpenAI(api_key=api_key)
+    return api_key
+
+
+def _http2_enabled() -> bool:
+    if not settings.OPENAI_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logger.warning("OPENAI_HTTP2 включен, но пакет h2 не установлен. Используется HTTP/1.1.")
+        return False
+    return True
+
+
+def _http_client_options() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY
+        ),
+        "timeout": httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT),
+        "http2": _http2_enabled()
+    }
+
+
+def get_openai_client() -> OpenAI:
+    """Возвращает общий для процесса синхронный клиент OpenAI, создавая его при первом вызове."""
+    global _client, _http_client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _http_client = DefaultHttpxClient(**_http_client_options())
+                _client = OpenAI(
+                    api_key=_get_api_key(),
+                    base_url=settings.OPENAI_BASE_URL or None,
+                    max_retries=settings.OPENAI_MAX_RETRIES,
+                    http_client=_http_client
+                )
+                logger.info("Создан общий синхронный клиент OpenAI.")
+    return _client
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Возвращает общий для процесса асинхронный клиент OpenAI, создавая его при первом вызове."""
+    global _async_client, _async_http_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_http_client = DefaultAsyncHttpxClient(**_http_client_options())
+                _async_client = AsyncOpenAI(
+                    api_key=_get_api_key(),
+                    base_url=settings.OPENAI_BASE_URL or None,
+                    max_retries=settings.OPENAI_MAX_RETRIES,
+                    http_client=_async_http_client
+                )
+                logger.info("Создан общий асинхронный клиент OpenAI.")
+    return _async_client
+
+
+def _scheduled(client):
+    """Клиент для запросов через openai_ratelimit: повторы выполняет планировщик, а не SDK."""
+    if settings.OPENAI_RATE_LIMIT_ENABLED:
+        return client.with_options(max_retries=0)
+    return client
+
+
+def get_rate_limit_stats() -> Dict[str, Any]:
+    """Состояние планировщика лимитов OpenAI и объединения одинаковых запросов (текущий процесс)."""
+    return {**openai_ratelimit.scheduler.stats(), "single_flight": single_flight.group.stats()}
+
+
+def _pool_stats(http_client) -> Optional[Dict[str, Any]]:
+    if http_client is None:
+        return None
+    # httpx не публикует состояние пула, читаем его из транспорта httpcore
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    connections = list(getattr(pool, "connections", None) or [])
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "pending_requests": len(getattr(pool, "_requests", None) or []),
+        "max_connections": settings.OPENAI_MAX_CONNECTIONS,
+        "max_keepalive_connections": settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        "http2": _http2_enabled()
+    }
+
+
+def get_connection_pool_stats() -> Dict[str, Optional[Dict[str, Any]]]:
+    """Статистика пулов соединений общих клиентов OpenAI (None, если клиент еще не создан)."""
+    return {
+        "sync": _pool_stats(_http_client),
+        "async": _pool_stats(_async_http_client)
+    }
+
+
+async def close_openai_clients() -> None:
+    """Закрывает общие клиенты OpenAI и их пулы соединений (при остановке приложения)."""
+    global _client, _async_client, _http_client, _async_http_client
+    with _client_lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = _http_client = _async_http_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
+    logger.info("Общие клиенты OpenAI закрыты.")
 
 
 def upload_file(file_path: str, purpose: str = "fine-tune"):
@@ -87,9 +211,34 @@ def delete_file_from_vector_store(vector_store_id: str, file_id: str):
         logger.error(f"Ошибка удаления файла {file_id} из хранилища {vector_store_id}: {e}")
         raise
 
-def get_prompt_response(prompt: str, vector_store_id: str):
-    client = get_openai_client()
-    model = "gpt-4o-mini" # Модель задана жестко
+# Модель ответов с file_search, если в профиле компании она не задана
+FILE_SEARCH_MODEL = "gpt-4o-mini"
+
+
+def file_search_cache_key(profile: Optional[RetrievalProfile] = None) -> str:
+    """Модель и параметры file_search профиля одной строкой (для ключа кэша ответов)."""
+    profile = profile or RetrievalProfile()
+    return f"{profile.retrieval_model or FILE_SEARCH_MODEL};n={profile.max_num_results};t={profile.score_threshold}"
+
+
+def chunking_strategy(profile: Optional[RetrievalProfile] = None) -> Optional[Dict[str, Any]]:
+    """chunking_strategy static из профиля компании (None — нарезка OpenAI по умолчанию)."""
+    if profile is None or profile.chunk_max_tokens is None:
+        return None
+    return {
+        "type": "static",
+        "static": {
+            "max_chunk_size_tokens": profile.chunk_max_tokens,
+            "chunk_overlap_tokens": profile.chunk_overlap_tokens
+        }
+    }
+
+
+def _build_file_search_request(prompt: str, vector_store_id: str, profile: Optional[RetrievalProfile] = None) -> Dict[str, Any]:
+    """Формирует параметры запроса responses.create с инструментом file_search.
+    Модель, число фрагментов и порог релевантности берутся из профиля компании."""
+    profile = profile or RetrievalProfile()
+    model = profile.retrieval_model or FILE_SEARCH_MODEL
     system_instruction = "Ты — полезный ассистент. Ответь на основе предоставленных файлов на вопрос пользователя ниже, отвечай только по данным в файлах, если данных по вопросу нет в файлах напиши что данных нет. Вопрос пользователя:" # Фиксированная инструкция
 
     # Добавляем системную инструкцию в начало input
@@ -97,52 +246,70 @@ def get_prompt_response(prompt: str, vector_store_id: str):
     logger.info("Добавлена фиксированная системная инструкция к input.")
 
     # Формируем инструмент file_search согласно примеру пользователя
-    tools = [{
+    tool = {
         "type": "file_search",
         "vector_store_ids": [vector_store_id] # Помещаем ID в список
-    }]
+    }
+    if profile.max_num_results is not None:
+        tool["max_num_results"] = profile.max_num_results
+    if profile.score_threshold is not None:
+        tool["ranking_options"] = {"score_threshold": profile.score_threshold}
+    tools = [tool]
 
     logger.info(f"Запрос к модели {model} с input: '{full_input[:100]}...' и file_search в хранилище {vector_store_id}")
+    return {"model": model, "input": full_input, "tools": tools}
+
+
+def _check_responses_api(client) -> None:
+    # ПРЕДУПРЕЖДЕНИЕ: Метод 'client.responses.create' не является стандартным...
+    logger.warning("Вызов нестандартного метода 'client.responses.create' согласно запросу пользователя.")
+    if not hasattr(client, 'responses') or not hasattr(client.responses, 'create'):
+         logger.error("Атрибут 'client.responses.create' не найден. Этот метод не существует в стандартном API.")
+         raise AttributeError("Метод 'client.responses.create' не найден в клиенте OpenAI.")
+
 
+def _extract_response_text(response) -> Optional[str]:
+    """Извлекает текст ответа ассистента из ответа responses.create."""
+    assistant_text = None
     try:
-        # ПРЕДУПРЕЖДЕНИЕ: Метод 'client.responses.create' не является стандартным...
-        logger.warning("Вызов нестандартного метода 'client.responses.create' согласно запросу пользователя.")
-        if not hasattr(client, 'responses') or not hasattr(client.responses, 'create'):
-             logger.error("Атрибут 'client.responses.create' не найден. Этот метод не существует в стандартном API.")
-             raise AttributeError("Метод 'client.responses.create' не найден в клиенте OpenAI.")
+        if response and hasattr(response, 'output') and isinstance(response.output, list):
+            for item in response.output:
+                 # Ищем сообщение от ассистента
+                if hasattr(item, 'type') and item.type == 'message' and hasattr(item, 'role') and item.role == 'assistant':
+                     # Проверяем наличие и тип контента
+                    if hasattr(item, 'content') and isinstance(item.content, list) and len(item.content) > 0:
+                        first_content = item.content[0]
+                        # Ищем текстовый блок
+                        if hasattr(first_content, 'type') and first_content.type == 'output_text' and hasattr(first_content, 'text'):
+                            assistant_text = first_content.text
+                            logger.info("Извлечен текст ответа ассистента.")
+                            break # Нашли текст, выходим из цикла
+        
+        if not assistant_text:
+             logger.warning("Не удалось извлечь текст ответа ассистента из ответа API. Структура ответа не соответствует ожидаемой.")
 
-        response = client.responses.create(
-            model=model,
-            input=full_input,
-            tools=tools
+    except Exception as parse_exc:
+        logger.error(f"Ошибка парсинга ответа от OpenAI (метод responses.create): {parse_exc}")
+        assistant_text = None # Возвращаем None в случае ошибки парсинга
+    
+    return assistant_text # Возвращаем извлеченный текст или None
+
+
+def get_prompt_response(prompt: str, vector_store_id: str, profile: Optional[RetrievalProfile] = None):
+    client = get_openai_client()
+    request = _build_file_search_request(prompt, vector_store_id, profile)
+
+    try:
+        _check_responses_api(client)
+        response = openai_ratelimit.call_sync(
+            _scheduled(client).responses.with_raw_response.create,
+            tokens=estimate_tokens([request["input"]], settings.OPENAI_COMPLETION_TOKENS_ESTIMATE),
+            **request
         )
-        
-        logger.info(f"Получен ответ от модели {model} (метод responses.create).")
+        logger.info(f"Получен ответ от модели {request['model']} (метод responses.create).")
 
         # Парсим ответ для извлечения текста ассистента
-        assistant_text = None
-        try:
-            if response and hasattr(response, 'output') and isinstance(response.output, list):
-                for item in response.output:
-                     # Ищем сообщение от ассистента
-                    if hasattr(item, 'type') and item.type == 'message' and hasattr(item, 'role') and item.role == 'assistant':
-                         # Проверяем наличие и тип контента
-                        if hasattr(item, 'content') and isinstance(item.content, list) and len(item.content) > 0:
-                            first_content = item.content[0]
-                            # Ищем текстовый блок
-                            if hasattr(first_content, 'type') and first_content.type == 'output_text' and hasattr(first_content, 'text'):
-                                assistant_text = first_content.text
-                                logger.info("Извлечен текст ответа ассистента.")
-                                break # Нашли текст, выходим из цикла
-            
-            if not assistant_text:
-                 logger.warning("Не удалось извлечь текст ответа ассистента из ответа API. Структура ответа не соответствует ожидаемой.")
-
-        except Exception as parse_exc:
-            logger.error(f"Ошибка парсинга ответа от OpenAI (метод responses.create): {parse_exc}")
-            assistant_text = None # Возвращаем None в случае ошибки парсинга
-        
-        return assistant_text # Возвращаем извлеченный текст или None
+        return _extract_response_text(response)
 
     except AttributeError as e:
          logger.error(f"Ошибка вызова 'client.responses.create': {e}. Этот метод не найден в клиенте OpenAI. Рекомендуется использовать client.chat.completions.create или Assistants API.")
@@ -151,39 +318,155 @@ def get_prompt_response(prompt: str, vector_store_id: str):
         logger.error(f"Ошибка при вызове OpenAI API (метод responses.create): {e}")
         raise
 
-def get_embedding(text: str, model: str = "text-embedding-3-small") -> Optional[List[float]]:
+def _prepare_embedding_text(text: str) -> Optional[str]:
+    if not text or not text.strip():
+        logger.warning("Получен пустой текст для генерации эмбеддинга.")
+        return None
+    # Заменяем символы новой строки, т.к. OpenAI их не рекомендует в эмбеддингах
+    return text.replace("\n", " ")
+
+
+def _embedding_options(model: str) -> Dict[str, Any]:
+    # Укороченные эмбеддинги (параметр dimensions) поддерживают только модели text-embedding-3
+    if model.startswith("text-embedding-3"):
+        return {"dimensions": settings.EMBEDDING_DIMENSIONS}
+    return {}
+
+
+def _extract_embedding(response, text: str, model: str) -> Optional[List[float]]:
+    # Извлекаем эмбеддинг из ответа
+    if response and response.data and len(response.data) > 0:
+        embedding = response.data[0].embedding
+        logger.info(f"Сгенерирован эмбеддинг размерности {len(embedding)} для текста: '{text[:50]}...' моделью {model}")
+        return embedding
+    else:
+        logger.error(f"Не удалось получить данные эмбеддинга из ответа OpenAI API для модели {model}.")
+        return None
+
+
+def get_embedding(
+    text: str, model: str = "text-embedding-3-small", priority: int = PRIORITY_INTERACTIVE
+) -> Optional[List[float]]:
     """
     Генерирует векторное представление (эмбеддинг) для заданного текста.
 
     Args:
         text: Текст для генерации эмбеддинга.
         model: Модель для генерации эмбеддингов (по умолчанию 'text-embedding-3-small').
+        priority: Приоритет в планировщике лимитов OpenAI (PRIORITY_INTERACTIVE или PRIORITY_BACKGROUND).
 
     Returns:
-        Список чисел (float), представляющий эмбеддинг текста, или None при ошибке.
+        Список чисел (float), представляющий эмбеддинг текста, или None при ошибке
+        (в том числе после исчерпания повторов 429/5xx).
     """
     client = get_openai_client()
-    if not text or not text.strip():
-        logger.warning("Получен пустой текст для генерации эмбеддинга.")
+    text = _prepare_embedding_text(text)
+    if text is None:
         return None
     
     try:
-        # Заменяем символы новой строки, т.к. OpenAI их не рекомендует в эмбеддингах
-        text = text.replace("\n", " ")
-        response = client.embeddings.create(input=[text], model=model) 
-        
-        # Извлекаем эмбеддинг из ответа
-        if response and response.data and len(response.data) > 0:
-            embedding = response.data[0].embedding
-            logger.info(f"Сгенерирован эмбеддинг размерности {len(embedding)} для текста: '{text[:50]}...' моделью {model}")
-            return embedding
-        else:
-            logger.error(f"Не удалось получить данные эмбеддинга из ответа OpenAI API для модели {model}.")
-            return None
+        response = openai_ratelimit.call_sync(
+            _scheduled(client).embeddings.with_raw_response.create,
+            model=model, tokens=estimate_tokens([text]), priority=priority,
+            input=[text], **_embedding_options(model)
+        )
+        return _extract_embedding(response, text, model)
     except Exception as e:
         logger.exception(f"Ошибка при генерации эмбеддинга для текста '{text[:50]}...' моделью {model}: {e}")
         return None
 
+def _prepare_embedding_batches(texts: List[str], batch_size: Optional[int]) -> List[List[Tuple[int, str]]]:
+    """Разбивает непустые тексты на пакеты пар (позиция в texts, подготовленный текст)."""
+    batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+    # Пустые тексты не отправляем, для них результат сразу None
+    prepared = [(i, text.replace("\n", " ")) for i, text in enumerate(texts) if text and text.strip()]
+    if len(prepared) < len(texts):
+        logger.warning(f"Пропущено {len(texts) - len(prepared)} пустых текстов при пакетной генерации эмбеддингов.")
+    return [prepared[start:start + batch_size] for start in range(0, len(prepared), batch_size)]
+
+
+def _log_embeddings_result(results: List[Optional[List[float]]], batches: List[List[Tuple[int, str]]], model: str) -> None:
+    submitted = sum(len(batch) for batch in batches)
+    failed = sum(1 for batch in batches for i, _ in batch if results[i] is None)
+    logger.info(f"Сгенерировано {submitted - failed} эмбеддингов из {len(results)} ({len(batches)} пакетов) моделью {model}.")
+
+
+def get_embeddings(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    batch_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None
+) -> List[Optional[List[float]]]:
+    """
+    Генерирует эмбеддинги для списка текстов пакетами.
+
+    Тексты отправляются по batch_size штук в одном вызове embeddings.create,
+    до max_concurrency пакетов выполняются параллельно. Запросы идут с фоновым
+    приоритетом планировщика лимитов OpenAI. Если пакет целиком
+    завершился ошибкой, его тексты повторно обрабатываются по одному, чтобы
+    один проблемный текст не лишал эмбеддингов весь пакет.
+
+    Args:
+        texts: Тексты для генерации эмбеддингов.
+        model: Модель для генерации эмбеддингов (по умолчанию 'text-embedding-3-small').
+        batch_size: Размер пакета (по умолчанию settings.EMBEDDING_BATCH_SIZE).
+        max_concurrency: Число параллельных пакетов (по умолчанию settings.EMBEDDING_MAX_CONCURRENCY).
+
+    Returns:
+        Список той же длины, что и texts: эмбеддинг для каждого текста или None,
+        если для этого текста эмбеддинг получить не удалось.
+    """
+    max_concurrency = max(1, max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY)
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    batches = _prepare_embedding_batches(texts, batch_size)
+    if not batches:
+        return results
+
+    client = get_openai_client()
+
+    def _embed_batch(batch):
+        try:
+            inputs = [text for _, text in batch]
+            response = openai_ratelimit.call_sync(
+                _scheduled(client).embeddings.with_raw_response.create,
+                model=model, tokens=estimate_tokens(inputs), priority=PRIORITY_BACKGROUND,
+                input=inputs, **_embedding_options(model)
+            )
+            for item in response.data:
+                results[batch[item.index][0]] = item.embedding
+        except Exception as e:
+            logger.warning(f"Ошибка пакетной генерации эмбеддингов ({len(batch)} текстов) моделью {model}: {e}. Повтор по одному тексту.")
+            for i, text in batch:
+                results[i] = get_embedding(text=text, model=model, priority=PRIORITY_BACKGROUND)
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(batches))) as executor:
+        list(executor.map(_embed_batch, batches))
+
+    _log_embeddings_result(results, batches, model)
+    return results
+
+def _build_chat_messages(prompt: str) -> List[Dict[str, str]]:
+    system_instruction = "Ты — полезный ассистент. Отвечай на основе предоставленного контекста." # Можно адаптировать
+    return [
+        {"role": "system", "content": system_instruction},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _extract_chat_text(completion, model: str) -> Optional[str]:
+    if completion.choices and len(completion.choices) > 0:
+        assistant_response = completion.choices[0].message.content
+        logger.info(f"Получен ответ от модели {model}.")
+        if assistant_response:
+             return assistant_response.strip()
+        else:
+             logger.warning(f"Модель {model} вернула пустой ответ.")
+             return None
+    else:
+        logger.error(f"Не удалось получить ответ от модели {model}. Ответ API не содержит choices.")
+        return None
+
+
 def get_prompt_response2(prompt: str, model: str = "gpt-4o-mini") -> Optional[str]:
     """
     Генерирует ответ на промпт с использованием модели чата OpenAI.
@@ -196,36 +479,336 @@ def get_prompt_response2(prompt: str, model: str = "gpt-4o-mini") -> Optional[st
         Строка с ответом от модели или None при ошибке.
     """
     client = get_openai_client()
-    system_instruction = "Ты — полезный ассистент. Отвечай на основе предоставленного контекста." # Можно адаптировать
     
     try:
         logger.info(f"Запрос к модели {model} с промптом: '{prompt[:100]}...'")
         
-        completion = client.chat.completions.create(
+        completion = openai_ratelimit.call_sync(
+            _scheduled(client).chat.completions.with_raw_response.create,
             model=model,
-            messages=[
-                {"role": "system", "content": system_instruction},
-                {"role": "user", "content": prompt}
-            ]
+            tokens=estimate_tokens([prompt], settings.OPENAI_COMPLETION_TOKENS_ESTIMATE),
+            messages=_build_chat_messages(prompt)
         )
-        
-        if completion.choices and len(completion.choices) > 0:
-            assistant_response = completion.choices[0].message.content
-            logger.info(f"Получен ответ от модели {model}.")
-            if assistant_response:
-                 return assistant_response.strip()
-            else:
-                 logger.warning(f"Модель {model} вернула пустой ответ.")
-                 return None
-        else:
-            logger.error(f"Не удалось получить ответ от модели {model}. Ответ API не содержит choices.")
-            return None
+        return _extract_chat_text(completion, model)
 
     except Exception as e:
         logger.exception(f"Ошибка при вызове OpenAI Chat Completions API (модель {model}): {e}")
         return None
 
 
+# --- Асинхронные варианты (общий AsyncOpenAI клиент) ---
+# Повторяют поведение синхронных функций выше, но не блокируют event loop,
+# поэтому один воркер может держать сотни одновременных запросов к OpenAI.
+
+async def upload_file_async(file_path: str, purpose: str = "fine-tune"):
+    client = get_async_openai_client()
+    try:
+        with open(file_path, "rb") as file:
+            uploaded_file = await client.files.create(
+                file=file,
+                purpose=purpose
+            )
+        logger.info(f"Файл {file_path} успешно загружен. ID: {uploaded_file.id}")
+        return uploaded_file.id
+    except Exception as e:
+        logger.error(f"Ошибка загрузки файла {file_path}: {e}")
+        raise
+
+async def upload_bytes_async(content: bytes, filename: str, purpose: str = "assistants"):
+    """Загружает содержимое из памяти (без временного файла на диске)."""
+    client = get_async_openai_client()
+    try:
+        uploaded_file = await client.files.create(file=(filename, content), purpose=purpose)
+        logger.info(f"Файл {filename} ({len(content)} байт) успешно загружен. ID: {uploaded_file.id}")
+        return uploaded_file.id
+    except Exception as e:
+        logger.error(f"Ошибка загрузки файла {filename}: {e}")
+        raise
+
+async def delete_file_async(file_id: str):
+    client = get_async_openai_client()
+    try:
+        await client.files.delete(file_id)
+        logger.info(f"Файл {file_id} успешно удален")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка удаления файла {file_id}: {e}")
+        raise
+
+
+async def create_vector_store_async(name: str = ""):
+    client = get_async_openai_client()
+    vector_store = await client.vector_stores.create(name=name)
+    logger.info(f"Создано векторное хранилище: {vector_store.id}")
+    return vector_store
+
+async def delete_vector_store_async(vector_store_id: str):
+    client = get_async_openai_client()
+    try:
+        response = await client.vector_stores.delete(vector_store_id=vector_store_id)
+        logger.info(f"Векторное хранилище {vector_store_id} успешно удалено.")
+        return response
+    except Exception as e:
+        logger.error(f"Ошибка удаления векторного хранилища {vector_store_id}: {e}")
+        raise
+
+
+async def add_file_to_vector_store_async(vector_store_id: str, file_id: str, chunking_strategy: Optional[Dict[str, Any]] = None):
+    """Прикрепляет файл к векторному хранилищу и ждет окончания его обработки:
+    после возврата файл уже участвует в file_search. Если обработка не завершилась
+    успешно, поднимает RuntimeError."""
+    client = get_async_openai_client()
+    try:
+        vector_store_file = await client.vector_stores.files.create_and_poll(
+            vector_store_id=vector_store_id,
+            file_id=file_id,
+            **({"chunking_strategy": chunking_strategy} if chunking_strategy else {})
+        )
+        if vector_store_file.status != "completed":
+            raise RuntimeError(f"обработка файла завершилась со статусом {vector_store_file.status}: {vector_store_file.last_error}")
+        logger.info(f"Файл {file_id} добавлен в векторное хранилище {vector_store_id}. ID связи: {vector_store_file.id}")
+        return vector_store_file
+    except Exception as e:
+        logger.error(f"Ошибка добавления файла {file_id} в хранилище {vector_store_id}: {e}")
+        raise
+
+async def add_files_batch_to_vector_store_async(
+    vector_store_id: str, file_ids: List[str], chunking_strategy: Optional[Dict[str, Any]] = None
+) -> Tuple[Any, List[str]]:
+    """Прикрепляет файлы к векторному хранилищу одним vector_stores.file_batches и ждет
+    завершения пакета (один опрос на пакет, а не на файл).
+
+    Returns:
+        (пакет, ID файлов, которые не удалось прикрепить)
+    """
+    client = get_async_openai_client()
+    batch = await client.vector_stores.file_batches.create_and_poll(
+        vector_store_id=vector_store_id,
+        file_ids=file_ids,
+        **({"chunking_strategy": chunking_strategy} if chunking_strategy else {})
+    )
+    completed = set()
+    async for vector_store_file in client.vector_stores.file_batches.list_files(
+        vector_store_id=vector_store_id, batch_id=batch.id, filter="completed"
+    ):
+        completed.add(vector_store_file.id)
+    failed = [file_id for file_id in file_ids if file_id not in completed]
+    logger.info(f"Пакет {batch.id} ({batch.status}): прикреплено {len(completed)} из {len(file_ids)} файлов к хранилищу {vector_store_id}.")
+    return batch, failed
+
+async def delete_file_from_vector_store_async(vector_store_id: str, file_id: str):
+    client = get_async_openai_client()
+    try:
+        deleted_file = await client.vector_stores.files.delete(
+            vector_store_id=vector_store_id,
+            file_id=file_id
+        )
+        logger.info(f"Файл {file_id} удален из векторного хранилища {vector_store_id}")
+        return deleted_file
+    except Exception as e:
+        logger.error(f"Ошибка удаления файла {file_id} из хранилища {vector_store_id}: {e}")
+        raise
+
+async def get_prompt_response_async(prompt: str, vector_store_id: str, profile: Optional[RetrievalProfile] = None):
+    client = get_async_openai_client()
+    request = _build_file_search_request(prompt, vector_store_id, profile)
+
+    try:
+        _check_responses_api(client)
+        # Одинаковые одновременные запросы к хранилищу выполняются одним вызовом
+        response = await single_flight.group.do(
+            ("responses", file_search_cache_key(profile), vector_store_id, prompt),
+            lambda: openai_ratelimit.call_async(
+                _scheduled(client).responses.with_raw_response.create,
+                tokens=estimate_tokens([request["input"]], settings.OPENAI_COMPLETION_TOKENS_ESTIMATE),
+                **request
+            )
+        )
+        logger.info(f"Получен ответ от модели {request['model']} (метод responses.create).")
+        return _extract_response_text(response)
+
+    except AttributeError as e:
+         logger.error(f"Ошибка вызова 'client.responses.create': {e}. Этот метод не найден в клиенте OpenAI.")
+         raise ValueError("Метод 'client.responses.create' не найден в клиенте OpenAI.") from e
+    except Exception as e:
+        logger.error(f"Ошибка при вызове OpenAI API (метод responses.create): {e}")
+        raise
+
+async def get_embedding_async(
+    text: str, model: str = "text-embedding-3-small", priority: int = PRIORITY_INTERACTIVE,
+    raise_retryable: bool = False
+) -> Optional[List[float]]:
+    """Асинхронный вариант get_embedding. С raise_retryable=True временная ошибка
+    (429/5xx после всех повторов) пробрасывается, а не превращается в None."""
+    client = get_async_openai_client()
+    text = _prepare_embedding_text(text)
+    if text is None:
+        return None
+
+    try:
+        response = await single_flight.group.do(
+            ("embedding", model, text),
+            lambda: openai_ratelimit.call_async(
+                _scheduled(client).embeddings.with_raw_response.create,
+                model=model, tokens=estimate_tokens([text]), priority=priority,
+                input=[text], **_embedding_options(model)
+            )
+        )
+        return _extract_embedding(response, text, model)
+    except Exception as e:
+        if raise_retryable and openai_ratelimit.is_retryable(e):
+            raise
+        logger.exception(f"Ошибка при генерации эмбеддинга для текста '{text[:50]}...' моделью {model}: {e}")
+        return None
+
+async def get_embeddings_async(
+    texts: List[str],
+    model: str = "text-embedding-3-small",
+    batch_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    raise_retryable: bool = False
+) -> List[Optional[List[float]]]:
+    """Асинхронный вариант get_embeddings: пакеты выполняются конкурентно, не более max_concurrency одновременно.
+    С raise_retryable=True временная ошибка пакета пробрасывается без повтора по одному тексту."""
+    max_concurrency = max(1, max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY)
+    results: List[Optional[List[float]]] = [None] * len(texts)
+    batches = _prepare_embedding_batches(texts, batch_size)
+    if not batches:
+        return results
+
+    client = get_async_openai_client()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _embed_batch(batch):
+        async with semaphore:
+            try:
+                inputs = [text for _, text in batch]
+                response = await openai_ratelimit.call_async(
+                    _scheduled(client).embeddings.with_raw_response.create,
+                    model=model, tokens=estimate_tokens(inputs), priority=PRIORITY_BACKGROUND,
+                    input=inputs, **_embedding_options(model)
+                )
+                for item in response.data:
+                    results[batch[item.index][0]] = item.embedding
+            except Exception as e:
+                if raise_retryable and openai_ratelimit.is_retryable(e):
+                    raise
+                logger.warning(f"Ошибка пакетной генерации эмбеддингов ({len(batch)} текстов) моделью {model}: {e}. Повтор по одному тексту.")
+                for i, text in batch:
+                    results[i] = await get_embedding_async(
+                        text=text, model=model, priority=PRIORITY_BACKGROUND, raise_retryable=raise_retryable
+                    )
+
+    await asyncio.gather(*(_embed_batch(batch) for batch in batches))
+
+    _log_embeddings_result(results, batches, model)
+    return results
+
+# --- Batch API (асинхронная обработка со скидкой, без синхронных лимитов) ---
+
+def embedding_batch_request(custom_id: str, text: str, model: str) -> Dict[str, Any]:
+    """Строка JSONL входного файла Batch API с запросом эмбеддинга одного текста."""
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/embeddings",
+        "body": {"model": model, "input": text, **_embedding_options(model)}
+    }
+
+
+async def create_batch_async(input_file_id: str, endpoint: str = "/v1/embeddings", metadata: Optional[Dict[str, str]] = None):
+    client = get_async_openai_client()
+    batch = await client.batches.create(
+        input_file_id=input_file_id,
+        endpoint=endpoint,
+        completion_window="24h",
+        metadata=metadata
+    )
+    logger.info(f"Создан пакет Batch API {batch.id} из файла {input_file_id} ({endpoint}).")
+    return batch
+
+
+async def retrieve_batch_async(batch_id: str):
+    client = get_async_openai_client()
+    return await client.batches.retrieve(batch_id)
+
+
+async def iter_file_lines_async(file_id: str) -> AsyncIterator[str]:
+    """Построчно читает содержимое файла OpenAI (результаты Batch API), не загружая его в память целиком."""
+    client = get_async_openai_client()
+    async with client.files.with_streaming_response.content(file_id) as response:
+        async for line in response.iter_lines():
+            if line:
+                yield line
+
+
+async def get_prompt_response2_async(prompt: str, model: str = "gpt-4o-mini") -> Optional[str]:
+    """Асинхронный вариант get_prompt_response2."""
+    client = get_async_openai_client()
+
+    try:
+        logger.info(f"Запрос к модели {model} с промптом: '{prompt[:100]}...'")
+
+        completion = await single_flight.group.do(
+            ("chat", model, prompt),
+            lambda: openai_ratelimit.call_async(
+                _scheduled(client).chat.completions.with_raw_response.create,
+                model=model,
+                tokens=estimate_tokens([prompt], settings.OPENAI_COMPLETION_TOKENS_ESTIMATE),
+                messages=_build_chat_messages(prompt)
+            )
+        )
+        return _extract_chat_text(completion, model)
+
+    except Exception as e:
+        logger.exception(f"Ошибка при вызове OpenAI Chat Completions API (модель {model}): {e}")
+        return None
+
 
+# --- Потоковые (stream=True) варианты для SSE ---
 
+async def stream_prompt_response_async(
+    prompt: str, vector_store_id: str, profile: Optional[RetrievalProfile] = None
+) -> AsyncIterator[str]:
+    """Потоковый вариант get_prompt_response: отдает фрагменты текста ответа
+    (события response.output_text.delta Responses API) по мере генерации."""
+    client = get_async_openai_client()
+    request = _build_file_search_request(prompt, vector_store_id, profile)
 
+    try:
+        _check_responses_api(client)
+    except AttributeError as e:
+        raise ValueError("Метод 'client.responses.create' не найден в клиенте OpenAI.") from e
+
+    # Лимиты и повторы применяются только к открытию потока
+    stream = await openai_ratelimit.call_async(
+        _scheduled(client).responses.with_raw_response.create,
+        tokens=estimate_tokens([request["input"]], settings.OPENAI_COMPLETION_TOKENS_ESTIMATE),
+        stream=True,
+        **request
+    )
+    async for event in stream:
+        if event.type == "response.output_text.delta" and event.delta:
+            yield event.delta
+        elif event.type == "error":
+            logger.error(f"Ошибка в потоке ответа модели {request['model']}: {getattr(event, 'message', event)}")
+            raise RuntimeError(f"Ошибка генерации ответа: {getattr(event, 'message', '')}")
+    logger.info(f"Потоковый ответ модели {request['model']} завершен (метод responses.create).")
+
+async def stream_prompt_response2_async(prompt: str, model: str = "gpt-4o-mini") -> AsyncIterator[str]:
+    """Потоковый вариант get_prompt_response2: отдает фрагменты ответа
+    Chat Completions по мере генерации."""
+    client = get_async_openai_client()
+    logger.info(f"Потоковый запрос к модели {model} с промптом: '{prompt[:100]}...'")
+
+    stream = await openai_ratelimit.call_async(
+        _scheduled(client).chat.completions.with_raw_response.create,
+        model=model,
+        tokens=estimate_tokens([prompt], settings.OPENAI_COMPLETION_TOKENS_ESTIMATE),
+        messages=_build_chat_messages(prompt),
+        stream=True
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+    logger.info(f"Потоковый ответ модели {model} завершен.")
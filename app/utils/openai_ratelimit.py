@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+import openai
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты запросов: интерактивные (запросы пользователей) обслуживаются раньше фоновых (загрузка документов)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Лимиты OpenAI задаются в минуту
+_LIMIT_PERIOD = 60.0
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Длительность из заголовков x-ratelimit-reset-* ("20ms", "1s", "6m0s") в секундах."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def estimate_tokens(texts: Iterable[str], completion_tokens: int = 0) -> int:
+    """Грубая оценка токенов запроса (~4 символа на токен); уточняется по usage ответа."""
+    return sum(len(text) for text in texts) // 4 + 1 + completion_tokens
+
+
+class _Bucket:
+    """Token bucket на минутный лимит. Уровень может уйти в минус (долг),
+    если фактический расход оказался больше оценки."""
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / _LIMIT_PERIOD)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float, now: float) -> float:
+        """Секунды до момента, когда в корзине будет amount плюс резерв (доля емкости).
+        Потребность не больше емкости: иначе крупный запрос не дождался бы ее никогда."""
+        self._refill(now)
+        need = min(min(amount, self.capacity) + reserve * self.capacity, self.capacity)
+        if self.level >= need:
+            return 0.0
+        return (need - self.level) * _LIMIT_PERIOD / self.capacity
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def sync(self, limit: Optional[int], remaining: Optional[int], now: float) -> None:
+        """Сверяет корзину с заголовками x-ratelimit-*: лимит берется из ответа,
+        уровень не превышает остатка, который видит сервер."""
+        self._refill(now)
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+
+
+class _ModelLimits:
+    def __init__(self):
+        self.requests = _Bucket(settings.OPENAI_DEFAULT_RPM)
+        self.tokens = _Bucket(settings.OPENAI_DEFAULT_TPM)
+        # Пауза для всех запросов модели после 429
+        self.blocked_until = 0.0
+        # Ожидающие интерактивные запросы модели: фоновые запросы этой модели их пропускают
+        self.interactive_waiting = 0
+
+
+class RateLimitScheduler:
+    """Планировщик запросов к OpenAI с учетом лимитов запросов и токенов каждой модели.
+
+    Запрос ждет, пока в корзинах запросов и токенов его модели хватит емкости.
+    Фоновые запросы дополнительно оставляют резерв OPENAI_INTERACTIVE_RESERVE
+    для интерактивных, пропускают вперед интерактивные запросы той же модели и ограничены адаптивным числом
+    одновременных запросов (AIMD: +1 за каждые limit успешных запросов, вдвое меньше при 429).
+    Состояние защищено threading.Lock, поэтому общее для синхронных вызовов
+    из потоков и асинхронных из event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._limits: Dict[str, _ModelLimits] = {}
+        self._background_in_flight = 0
+        self._background_limit = float(settings.OPENAI_BACKGROUND_CONCURRENCY)
+
+    def _model_limits(self, model: str) -> _ModelLimits:
+        if model not in self._limits:
+            self._limits[model] = _ModelLimits()
+        return self._limits[model]
+
+    def _try_acquire(self, model: str, tokens: int, priority: int) -> float:
+        """Занимает емкость и возвращает 0 или возвращает время ожидания в секундах."""
+        now = time.monotonic()
+        with self._lock:
+            limits = self._model_limits(model)
+            if limits.blocked_until > now:
+                return limits.blocked_until - now
+            background = priority != PRIORITY_INTERACTIVE
+            if background and (limits.interactive_waiting or self._background_in_flight >= int(self._background_limit)):
+                return 0.05
+            reserve = settings.OPENAI_INTERACTIVE_RESERVE if background else 0.0
+            wait = max(
+                limits.requests.wait_time(1, reserve, now),
+                limits.tokens.wait_time(tokens, reserve, now)
+            )
+            if wait > 0:
+                return wait
+            limits.requests.take(1)
+            limits.tokens.take(tokens)
+            if background:
+                self._background_in_flight += 1
+            return 0.0
+
+    async def acquire(self, model: str, tokens: int, priority: int) -> None:
+        interactive = priority == PRIORITY_INTERACTIVE
+        if interactive:
+            with self._lock:
+                self._model_limits(model).interactive_waiting += 1
+        try:
+            while True:
+                wait = self._try_acquire(model, tokens, priority)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(min(wait, 1.0))
+        finally:
+            if interactive:
+                with self._lock:
+                    self._model_limits(model).interactive_waiting -= 1
+
+    def acquire_sync(self, model: str, tokens: int, priority: int) -> None:
+        while True:
+            wait = self._try_acquire(model, tokens, priority)
+            if wait <= 0:
+                return
+            time.sleep(min(wait, 1.0))
+
+    def release(self, priority: int, *, rate_limited: bool = False) -> None:
+        with self._lock:
+            if priority != PRIORITY_INTERACTIVE:
+                self._background_in_flight -= 1
+                if rate_limited:
+                    self._background_limit = max(1.0, self._background_limit / 2)
+                else:
+                    self._background_limit = min(float(settings.OPENAI_BACKGROUND_CONCURRENCY), self._background_limit + 1 / self._background_limit)
+
+    def update(self, model: str, headers) -> None:
+        """Обновляет лимиты модели по заголовкам x-ratelimit-* ответа."""
+        def _int(name: str) -> Optional[int]:
+            value = headers.get(name)
+            try:
+                return int(value) if value is not None else None
+            except ValueError:
+                return None
+
+        now = time.monotonic()
+        with self._lock:
+            limits = self._model_limits(model)
+            limits.requests.sync(_int("x-ratelimit-limit-requests"), _int("x-ratelimit-remaining-requests"), now)
+            limits.tokens.sync(_int("x-ratelimit-limit-tokens"), _int("x-ratelimit-remaining-tokens"), now)
+
+    def adjust_tokens(self, model: str, delta: int) -> None:
+        """Возвращает (delta > 0) или списывает (delta < 0) разницу между оценкой и фактическим расходом."""
+        with self._lock:
+            bucket = self._model_limits(model).tokens
+            bucket.level = min(bucket.capacity, bucket.level + delta)
+
+    def pause(self, model: str, delay: float) -> None:
+        with self._lock:
+            limits = self._model_limits(model)
+            limits.blocked_until = max(limits.blocked_until, time.monotonic() + delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "background_in_flight": self._background_in_flight,
+                "background_concurrency_limit": int(self._background_limit),
+                "interactive_waiting": sum(limits.interactive_waiting for limits in self._limits.values()),
+                "models": {
+                    model: {
+                        "requests_per_minute": int(limits.requests.capacity),
+                        "requests_available": int(limits.requests.level),
+                        "tokens_per_minute": int(limits.tokens.capacity),
+                        "tokens_available": int(limits.tokens.level),
+                        "interactive_waiting": limits.interactive_waiting,
+                    }
+                    for model, limits in self._limits.items()
+                },
+            }
+
+
+scheduler = RateLimitScheduler()
+
+
+def is_retryable(error: Exception) -> bool:
+    """True для временных ошибок OpenAI (429, 5xx, сеть), которые имеет смысл повторить позже."""
+    if isinstance(error, openai.RateLimitError):
+        # Исчерпанная квота не восстановится повтором
+        return getattr(error, "code", None) != "insufficient_quota"
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Задержка перед повтором: Retry-After сервера или экспоненциальная с полным джиттером."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after_ms = response.headers.get("retry-after-ms")
+        retry_after = response.headers.get("retry-after")
+        try:
+            if retry_after_ms is not None:
+                return float(retry_after_ms) / 1000
+            if retry_after is not None:
+                return float(retry_after)
+        except ValueError:
+            pass
+        reset = _parse_duration(response.headers.get("x-ratelimit-reset-tokens")) or _parse_duration(response.headers.get("x-ratelimit-reset-requests"))
+        if reset:
+            return reset + random.uniform(0, settings.OPENAI_RETRY_BASE_DELAY)
+    cap = min(settings.OPENAI_RETRY_MAX_DELAY, settings.OPENAI_RETRY_BASE_DELAY * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def _used_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def _on_error(error: Exception, *, model: str, priority: int, attempt: int) -> float:
+    """Освобождает слот и возвращает задержку перед повтором (исключение, если повтор не нужен)."""
+    rate_limited = isinstance(error, openai.RateLimitError)
+    scheduler.release(priority, rate_limited=rate_limited)
+    if not is_retryable(error) or attempt >= settings.OPENAI_RETRY_ATTEMPTS:
+        raise error
+    delay = _retry_delay(error, attempt)
+    if rate_limited:
+        # 429 означает, что лимит модели исчерпан для всех запросов процесса
+        scheduler.pause(model, delay)
+    logger.warning(f"Ошибка запроса к OpenAI (модель {model}): {error}. Повтор {attempt + 1}/{settings.OPENAI_RETRY_ATTEMPTS} через {delay:.2f} с.")
+    return delay
+
+
+def _on_success(raw, *, model: str, tokens: int, priority: int) -> Any:
+    scheduler.release(priority)
+    scheduler.update(model, raw.headers)
+    result = raw.parse()
+    used = _used_tokens(result)
+    if used is not None:
+        scheduler.adjust_tokens(model, tokens - used)
+    return result
+
+
+async def call_async(
+    create: Callable[..., Awaitable[Any]], *, model: str, tokens: int,
+    priority: int = PRIORITY_INTERACTIVE, **kwargs
+) -> Any:
+    """Выполняет метод with_raw_response.*.create клиента с ожиданием лимитов
+    и повторами 429/5xx. Возвращает разобранный ответ (как обычный create).
+    При OPENAI_RATE_LIMIT_ENABLED=false запрос выполняется сразу (повторы — средствами SDK)."""
+    if not settings.OPENAI_RATE_LIMIT_ENABLED:
+        return (await create(model=model, **kwargs)).parse()
+    attempt = 0
+    while True:
+        await scheduler.acquire(model, tokens, priority)
+        try:
+            raw = await create(model=model, **kwargs)
+        except Exception as e:
+            await asyncio.sleep(_on_error(e, model=model, priority=priority, attempt=attempt))
+            attempt += 1
+            continue
+        return _on_success(raw, model=model, tokens=tokens, priority=priority)
+
+
+def call_sync(
+    create: Callable[..., Any], *, model: str, tokens: int,
+    priority: int = PRIORITY_INTERACTIVE, **kwargs
+) -> Any:
+    """Синхронный вариант call_async."""
+    if not settings.OPENAI_RATE_LIMIT_ENABLED:
+        return create(model=model, **kwargs).parse()
+    attempt = 0
+    while True:
+        scheduler.acquire_sync(model, tokens, priority)
+        try:
+            raw = create(model=model, **kwargs)
+        except Exception as e:
+            time.sleep(_on_error(e, model=model, priority=priority, attempt=attempt))
+            attempt += 1
+            continue
+        return _on_success(raw, model=model, tokens=tokens, priority=priority)
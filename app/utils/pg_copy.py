@@ -0,0 +1,61 @@
+import struct
+from typing import Any, Iterable, Iterator, List, Sequence
+
+# Бинарный формат COPY: сигнатура, флаги (int32) и длина расширения заголовка (int32)
+_COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+_COPY_TRAILER = struct.pack(">h", -1)
+_NULL_FIELD = struct.pack(">i", -1)
+
+_INT_FORMATS = {"int2": ">h", "int4": ">i", "int8": ">q"}
+
+
+def encode_vector(values: Sequence[float]) -> bytes:
+    """Бинарное представление pgvector vector: размерность (uint16), неиспользуемое
+    поле (uint16) и значения float4 в сетевом порядке байт."""
+    return struct.pack(f">HH{len(values)}f", len(values), 0, *values)
+
+
+def encode_halfvec(values: Sequence[float]) -> bytes:
+    """Бинарное представление pgvector halfvec: как у vector, но значения float2."""
+    return struct.pack(f">HH{len(values)}e", len(values), 0, *values)
+
+
+def _encode_field(value: Any, pg_type: str) -> bytes:
+    if value is None:
+        return _NULL_FIELD
+    if pg_type in _INT_FORMATS:
+        data = struct.pack(_INT_FORMATS[pg_type], value)
+    elif pg_type == "text":
+        data = value.encode("utf-8")
+    elif pg_type == "vector":
+        data = encode_vector(value)
+    elif pg_type == "halfvec":
+        data = encode_halfvec(value)
+    else:
+        raise ValueError(f"Тип {pg_type!r} не поддерживается бинарным COPY")
+    return struct.pack(">i", len(data)) + data
+
+
+def encode_copy_binary(
+    rows: Iterable[Sequence[Any]], pg_types: Sequence[str], rows_per_block: int = 500
+) -> Iterator[bytes]:
+    """Кодирует строки в поток COPY ... FROM STDIN (FORMAT binary) блоками по rows_per_block строк.
+
+    pg_types — типы колонок в порядке значений строки: int2, int4, int8, text, vector, halfvec.
+    """
+    field_count = struct.pack(">h", len(pg_types))
+    block: List[bytes] = [_COPY_HEADER]
+    for i, row in enumerate(rows, start=1):
+        block.append(field_count)
+        block.extend(_encode_field(value, pg_type) for value, pg_type in zip(row, pg_types))
+        if i % rows_per_block == 0:
+            yield b"".join(block)
+            block = []
+    block.append(_COPY_TRAILER)
+    yield b"".join(block)
+
+
+async def iterate_async(blocks: Iterator[bytes]):
+    """Асинхронный источник для asyncpg copy_to_table: блоки кодируются по мере отправки."""
+    for block in blocks:
+        yield block
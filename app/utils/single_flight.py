@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных вызовов (single-flight).
+
+    Пока вызов с ключом key выполняется, остальные вызовы с тем же ключом
+    не запускают свой, а ждут результата (или исключения) первого. После
+    завершения ключ освобождается: результаты не кэшируются.
+    Работает в пределах процесса; между процессами нужна блокировка в БД.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.started = 0
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        if not settings.SINGLE_FLIGHT_ENABLED:
+            return await fn()
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(fn())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._finish(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+        # Отмена одного ожидающего (например, клиент закрыл соединение) не отменяет общий вызов
+        return await asyncio.shield(call)
+
+    def _finish(self, key: Hashable, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        # Исключение считается полученным, даже если все ожидающие были отменены
+        if not call.cancelled():
+            call.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.SINGLE_FLIGHT_ENABLED,
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "shared": self.shared,
+        }
+
+
+group = SingleFlight()
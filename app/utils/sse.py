@@ -0,0 +1,15 @@
+import json
+from typing import Any, Optional
+
+# Заголовки ответа text/event-stream: без кэширования и без буферизации в прокси (nginx)
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """Форматирует одно событие Server-Sent Events с JSON в поле data."""
+    message = f"event: {event}\n" if event else ""
+    message += f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return message
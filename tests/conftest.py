@@ -0,0 +1,70 @@
+"""Общие фикстуры тестов.
+
+API OpenAI заменяет локальный стенд (tests/openai_standin.py). Тесты с БД
+выполняются только при заданной TEST_DB_NAME — имени отдельной базы PostgreSQL
+с расширением vector: оно подставляется в DB_NAME до импорта приложения.
+"""
+import asyncio
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+if os.getenv("TEST_DB_NAME"):
+    os.environ["DB_NAME"] = os.environ["TEST_DB_NAME"]
+os.environ.setdefault("OPENAI_API_KEY", "sk-standin")
+
+from sqlalchemy import text
+
+from app.core import db_init
+from app.core.config import settings
+from app.core.database import Base, async_engine
+from openai_standin import StandinState, make_handler
+
+
+@pytest.fixture
+def standin(monkeypatch):
+    """Стенд API OpenAI на свободном порту; клиенты OpenAI приложения обращаются к нему."""
+    state = StandinState(batch_delay=0.0)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(state))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_port}/v1")
+    # Лимиты и повторы планировщика в тестах не нужны
+    monkeypatch.setattr(settings, "OPENAI_RATE_LIMIT_ENABLED", False)
+    try:
+        yield state
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+async def _create_schema() -> None:
+    async with async_engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        await conn.run_sync(Base.metadata.create_all)
+    await db_init.init_db()
+    # Фоновые шаги init_db завершаются до закрытия пула соединений
+    if db_init._split_task is not None:
+        await db_init._split_task
+
+
+async def _prepare_db() -> None:
+    try:
+        await _create_schema()
+    finally:
+        # Пул соединений привязан к циклу событий asyncio.run
+        await async_engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def test_db():
+    """Схема приложения в базе TEST_DB_NAME (тесты без нее пропускаются)."""
+    if not os.getenv("TEST_DB_NAME"):
+        pytest.skip("TEST_DB_NAME не задана: тесты с PostgreSQL пропущены")
+    with pytest.MonkeyPatch.context() as patch:
+        # ANN индекс для проверки не нужен: поиск тестами не выполняется
+        patch.setattr(settings, "VECTOR_INDEX_AUTO_CREATE", False)
+        asyncio.run(_prepare_db())
@@ -0,0 +1,240 @@
+"""Локальная замена API OpenAI для проверки Batch API без сети.
+
+Реализует эндпоинты, которые использует переиндексирование эмбеддингов
+(app/services/embedding_backfill.py): загрузку и чтение файлов, создание
+и получение пакетов, а также синхронный /v1/embeddings. Эмбеддинги
+детерминированы (зависят только от текста), файлы и пакеты хранятся в памяти.
+Используется тестами (фикстура standin) и для ручной проверки:
+
+    python tests/openai_standin.py --port 8001 --batch-delay 5
+    OPENAI_BASE_URL=http://localhost:8001/v1 python -m app.services.embedding_backfill
+"""
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_DIMENSIONS = 1536
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Нормализованный псевдослучайный вектор, зависящий только от текста."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0.0, 1.0) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _embeddings_body(body: Dict[str, Any]) -> Dict[str, Any]:
+    inputs = body.get("input")
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dimensions = body.get("dimensions") or _DEFAULT_DIMENSIONS
+    tokens = sum(len(text) // 4 + 1 for text in inputs)
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, dimensions)}
+            for i, text in enumerate(inputs)
+        ],
+        "model": body.get("model"),
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+
+class StandinState:
+    def __init__(self, batch_delay: float):
+        self.batch_delay = batch_delay
+        self.lock = threading.Lock()
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.contents: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+
+    def add_file(self, content: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex}"
+        meta = {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+        with self.lock:
+            self.files[file_id] = meta
+            self.contents[file_id] = content
+        return meta
+
+    def create_batch(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        now = int(time.time())
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": body["endpoint"],
+            "errors": None,
+            "input_file_id": body["input_file_id"],
+            "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": now,
+            "in_progress_at": now,
+            "expires_at": now + 86400,
+            "completed_at": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            "metadata": body.get("metadata"),
+        }
+        with self.lock:
+            self.batches[batch["id"]] = batch
+        return batch
+
+    def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            ready = batch is not None and batch["status"] == "in_progress" and time.time() - batch["created_at"] >= self.batch_delay
+            if ready:
+                batch["status"] = "finalizing"
+        if ready:
+            self._complete(batch)
+        return batch
+
+    def _complete(self, batch: Dict[str, Any]) -> None:
+        """Выполняет все запросы входного файла и записывает файлы результатов и ошибок."""
+        output_lines, error_lines = [], []
+        for line in self.contents.get(batch["input_file_id"], b"").decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            request_id = f"req_{uuid.uuid4().hex}"
+            if request.get("url") != "/v1/embeddings":
+                error_lines.append({
+                    "id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request.get("custom_id"), "response": None,
+                    "error": {"code": "unsupported_url", "message": f"Стенд не поддерживает {request.get('url')}"},
+                })
+                continue
+            output_lines.append({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": request_id, "body": _embeddings_body(request["body"])},
+                "error": None,
+            })
+
+        def _jsonl(lines: List[Dict[str, Any]]) -> bytes:
+            return "".join(json.dumps(line) + "\n" for line in lines).encode("utf-8")
+
+        output = self.add_file(_jsonl(output_lines), f"{batch['id']}_output.jsonl", "batch_output")
+        errors = self.add_file(_jsonl(error_lines), f"{batch['id']}_error.jsonl", "batch_output") if error_lines else None
+        with self.lock:
+            batch.update({
+                "status": "completed",
+                "output_file_id": output["id"],
+                "error_file_id": errors["id"] if errors else None,
+                "completed_at": int(time.time()),
+                "request_counts": {
+                    "total": len(output_lines) + len(error_lines),
+                    "completed": len(output_lines),
+                    "failed": len(error_lines),
+                },
+            })
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Tuple[Dict[str, str], Dict[str, Tuple[str, bytes]]]:
+    """Поля и файлы multipart/form-data (стандартная библиотека, без python-multipart)."""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode("latin-1") + body
+    )
+    fields: Dict[str, str] = {}
+    files: Dict[str, Tuple[str, bytes]] = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b""
+        if filename:
+            files[name] = (filename, payload)
+        else:
+            fields[name] = payload.decode("utf-8")
+    return fields, files
+
+
+def make_handler(state: StandinState):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status: int, data: Any) -> None:
+            payload = json.dumps(data).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _not_found(self) -> None:
+            self._send_json(404, {"error": {"message": f"Не найдено: {self.path}", "type": "invalid_request_error"}})
+
+        def _body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def do_POST(self):
+            if self.path == "/v1/files":
+                fields, files = _parse_multipart(self.headers["Content-Type"], self._body())
+                filename, content = files["file"]
+                self._send_json(200, state.add_file(content, filename, fields.get("purpose", "batch")))
+            elif self.path == "/v1/batches":
+                self._send_json(200, state.create_batch(json.loads(self._body())))
+            elif self.path == "/v1/embeddings":
+                self._send_json(200, _embeddings_body(json.loads(self._body())))
+            else:
+                self._not_found()
+
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in state.contents:
+                content = state.contents[parts[2]]
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            elif parts[:2] == ["v1", "files"] and len(parts) == 3 and parts[2] in state.files:
+                self._send_json(200, state.files[parts[2]])
+            elif parts[:2] == ["v1", "batches"] and len(parts) == 3 and state.get_batch(parts[2]):
+                self._send_json(200, state.get_batch(parts[2]))
+            else:
+                self._not_found()
+
+        def do_DELETE(self):
+            parts = self.path.strip("/").split("/")
+            if parts[:2] == ["v1", "files"] and len(parts) == 3 and parts[2] in state.files:
+                with state.lock:
+                    state.files.pop(parts[2], None)
+                    state.contents.pop(parts[2], None)
+                self._send_json(200, {"id": parts[2], "object": "file", "deleted": True})
+            else:
+                self._not_found()
+
+        def log_message(self, format, *args):
+            logger.info(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Локальная замена API OpenAI (files, batches, embeddings)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--batch-delay", type=float, default=0.0, help="Секунды до выполнения пакета")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(StandinState(args.batch_delay)))
+    logger.info(f"Стенд API OpenAI: http://{args.host}:{args.port}/v1")
+    server.serve_forever()
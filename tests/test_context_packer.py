@@ -0,0 +1,73 @@
+import pytest
+
+from app.models.chunk import Chunk
+from app.services import context_packer
+
+
+class _CharEncoding:
+    """Токен — один символ: бюджеты в тестах считаются в символах без загрузки кодировок tiktoken."""
+    name = "chars"
+
+    def encode(self, text):
+        return [ord(char) for char in text]
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+@pytest.fixture(autouse=True)
+def char_tokens(monkeypatch):
+    monkeypatch.setattr(context_packer, "_encoding", lambda model: _CharEncoding())
+
+
+def _chunk(chunk_id, file_id, index, text):
+    return Chunk(id=chunk_id, file_id=file_id, index=index, text=text, platform_company_id=1)
+
+
+def test_strip_overlap():
+    assert context_packer._strip_overlap("раз два три", "два три четыре", 10) == " четыре"
+    # Перекрытие длиннее overlap не удаляется
+    assert context_packer._strip_overlap("раз два три", "два три четыре", 3) == "два три четыре"
+    assert context_packer._strip_overlap("abc", "xyz", 10) == "xyz"
+
+
+def test_merge_adjacent_chunks_of_same_file():
+    chunks = [
+        _chunk(12, file_id=1, index=2, text="cdEF"),
+        _chunk(20, file_id=2, index=3, text="zz"),
+        _chunk(11, file_id=1, index=1, text="abcd"),
+        # Соседний index, но другой файл: не склеивается
+        _chunk(21, file_id=2, index=1, text="yy"),
+        _chunk(14, file_id=1, index=4, text="GH"),
+    ]
+    segments = context_packer._merge_adjacent(chunks, overlap=2)
+    assert [(segment.text, segment.chunk_ids, segment.rank) for segment in segments] == [
+        ("abcdEF", [11, 12], 0),
+        ("zz", [20], 1),
+        ("yy", [21], 3),
+        ("GH", [14], 4),
+    ]
+
+
+def test_pack_context_orders_by_rank():
+    chunks = [_chunk(2, 2, 0, "second"), _chunk(1, 1, 0, "first")]
+    packed = context_packer.pack_context(chunks, token_budget=1000, model="test", overlap=0)
+    assert packed.text == "second\n\nfirst"
+    assert packed.chunk_ids == [2, 1]
+    assert packed.tokens == len(packed.text)
+
+
+def test_pack_context_skips_segments_over_budget():
+    chunks = [_chunk(1, 1, 0, "a" * 10), _chunk(2, 2, 0, "b" * 10), _chunk(3, 3, 0, "c" * 3)]
+    # 10 + (2 + 10) не помещается в 20, а 10 + (2 + 3) помещается
+    packed = context_packer.pack_context(chunks, token_budget=20, model="test", overlap=0)
+    assert packed.text == "a" * 10 + "\n\n" + "c" * 3
+    assert packed.chunk_ids == [1, 3]
+    assert packed.tokens <= 20
+
+
+def test_pack_context_truncates_first_segment():
+    packed = context_packer.pack_context([_chunk(1, 1, 0, "x" * 50)], token_budget=8, model="test", overlap=0)
+    assert packed.text == "x" * 8
+    assert packed.tokens == 8
+    assert packed.chunk_ids == [1]
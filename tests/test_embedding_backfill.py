@@ -0,0 +1,111 @@
+import asyncio
+import json
+import random
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine
+from app.services import embedding_backfill
+from app.utils import hashing, openai_client
+from openai_standin import fake_embedding
+
+_TEXTS = ["Первый чанк документа.", "Второй  чанк\nдокумента.", "Первый чанк документа.", "Третий чанк."]
+
+
+def _assert_close(actual, expected, tolerance=1e-2):
+    # Допуск покрывает хранение в halfvec (EMBEDDING_STORAGE)
+    assert len(actual) == len(expected)
+    assert max(abs(a - b) for a, b in zip(actual, expected)) < tolerance
+
+
+def test_standin_batch_roundtrip(standin, tmp_path):
+    """Вызовы Batch API, которые использует переиндексирование, выполняются стендом."""
+    texts = {hashing.content_hash(chunk_text): hashing.normalize_text(chunk_text) for chunk_text in _TEXTS}
+    path = tmp_path / "requests.jsonl"
+    path.write_text(
+        "".join(
+            json.dumps(openai_client.embedding_batch_request(content_hash, chunk_text, settings.EMBEDDING_MODEL)) + "\n"
+            for content_hash, chunk_text in texts.items()
+        ),
+        encoding="utf-8"
+    )
+
+    async def scenario():
+        try:
+            input_file_id = await openai_client.upload_file_async(str(path), purpose="batch")
+            batch = await openai_client.create_batch_async(input_file_id)
+            batch = await openai_client.retrieve_batch_async(batch.id)
+            assert batch.status == "completed"
+            return [json.loads(line) async for line in openai_client.iter_file_lines_async(batch.output_file_id)]
+        finally:
+            await openai_client.close_openai_clients()
+
+    results = asyncio.run(scenario())
+    assert {result["custom_id"] for result in results} == set(texts)
+    for result in results:
+        assert result["response"]["status_code"] == 200
+        embedding = result["response"]["body"]["data"][0]["embedding"]
+        _assert_close(embedding, fake_embedding(texts[result["custom_id"]], settings.EMBEDDING_DIMENSIONS))
+
+
+def test_run_backfill_fills_missing_embeddings(test_db, standin):
+    platform_company_id = random.randint(10 ** 6, 10 ** 9)
+    # Тексты уникальны для запуска: хранилище embeddings общее для всех компаний
+    chunk_texts = [f"{chunk_text} ({platform_company_id})" for chunk_text in _TEXTS]
+    hashes = list({hashing.content_hash(chunk_text) for chunk_text in chunk_texts})
+
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as db:
+                file_id = (await db.execute(
+                    text("INSERT INTO files2 (text, platform_company_id) VALUES (:text, :company_id) RETURNING id"),
+                    {"text": " ".join(chunk_texts), "company_id": platform_company_id}
+                )).scalar()
+                for index, chunk_text in enumerate(chunk_texts):
+                    await db.execute(
+                        text("INSERT INTO chunks (text, index, file_id, platform_company_id) VALUES (:text, :index, :file_id, :company_id)"),
+                        {"text": chunk_text, "index": index, "file_id": file_id, "company_id": platform_company_id}
+                    )
+                await db.commit()
+
+            try:
+                await embedding_backfill.run_backfill(platform_company_id=platform_company_id, wait=True, poll_interval=0.01)
+                async with AsyncSessionLocal() as db:
+                    rows = (await db.execute(
+                        text("""
+                            SELECT text, embedding::vector::real[] AS embedding, embedding_id
+                            FROM chunks WHERE platform_company_id = :company_id ORDER BY index
+                        """),
+                        {"company_id": platform_company_id}
+                    )).all()
+                    statuses = (await db.execute(
+                        text("SELECT status FROM embedding_batches WHERE platform_company_id = :company_id"),
+                        {"company_id": platform_company_id}
+                    )).scalars().all()
+                return rows, statuses
+            finally:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(text("DELETE FROM chunks WHERE platform_company_id = :company_id"), {"company_id": platform_company_id})
+                    await db.execute(text("DELETE FROM files2 WHERE id = :file_id"), {"file_id": file_id})
+                    await db.execute(
+                        text("DELETE FROM embedding_batches WHERE platform_company_id = :company_id"), {"company_id": platform_company_id}
+                    )
+                    await db.execute(
+                        text("DELETE FROM embeddings WHERE content_hash = ANY(:hashes)"), {"hashes": hashes}
+                    )
+                    await db.commit()
+        finally:
+            await openai_client.close_openai_clients()
+            await async_engine.dispose()
+
+    rows, statuses = asyncio.run(scenario())
+
+    assert statuses == ["applied"]
+    assert [row.text for row in rows] == chunk_texts
+    for row in rows:
+        assert row.embedding_id is not None
+        _assert_close(row.embedding, fake_embedding(hashing.normalize_text(row.text), settings.EMBEDDING_DIMENSIONS))
+    # Одинаковые чанки отправлены в Batch API одним запросом
+    [batch] = standin.batches.values()
+    assert batch["request_counts"]["total"] == len(hashes)
@@ -0,0 +1,86 @@
+import asyncio
+import random
+
+from sqlalchemy import delete
+
+from app import crud, schemas
+from app.core.database import AsyncSessionLocal, async_engine
+from app.models.ingest_job import IngestJob
+
+
+def test_requeued_job_is_not_finished_by_previous_worker(test_db):
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as db:
+                job = await crud.ingest_job.create_async(
+                    db, obj_in=schemas.ingest_job.IngestJobCreate(kind="pg_process", payload={"text": "x"})
+                )
+            try:
+                # У каждого воркера своя сессия: объекты задачи не смешиваются
+                async with AsyncSessionLocal() as db:
+                    first = await crud.ingest_job.claim_next_async(db, worker_id="worker-a")
+                    assert first.id == job.id
+                    assert await crud.ingest_job.heartbeat_async(db, job_id=job.id, worker_id="worker-a")
+                    # Воркер A считается зависшим, задача переходит к воркеру B
+                    assert await crud.ingest_job.requeue_stale_async(db, stale_after=-1) >= 1
+                async with AsyncSessionLocal() as db:
+                    second = await crud.ingest_job.claim_next_async(db, worker_id="worker-b")
+                    assert second.id == job.id
+
+                async with AsyncSessionLocal() as db:
+                    assert not await crud.ingest_job.heartbeat_async(db, job_id=job.id, worker_id="worker-a")
+                    assert not await crud.ingest_job.mark_succeeded_async(db, job=first, result={"worker": "a"})
+                    assert not await crud.ingest_job.mark_failed_async(db, job=first, error="a", retry_delay=None)
+                    assert await crud.ingest_job.mark_succeeded_async(db, job=second, result={"worker": "b"})
+                    # Завершенную задачу не меняет и ее владелец
+                    assert not await crud.ingest_job.mark_failed_async(db, job=second, error="b", retry_delay=0)
+                async with AsyncSessionLocal() as db:
+                    return await crud.ingest_job.get_async(db, id=job.id)
+            finally:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(delete(IngestJob).where(IngestJob.id == job.id))
+                    await db.commit()
+        finally:
+            await async_engine.dispose()
+
+    finished = asyncio.run(scenario())
+    assert finished.status == "succeeded"
+    assert finished.result == {"worker": "b"}
+    assert finished.attempts == 2
+
+
+def test_pending_upload_of_file_is_found(test_db):
+    platform_company_id = random.randint(10 ** 6, 10 ** 9)
+
+    async def scenario():
+        try:
+            async with AsyncSessionLocal() as db:
+                single = await crud.ingest_job.create_async(db, obj_in=schemas.ingest_job.IngestJobCreate(
+                    kind="openai_file", platform_company_id=platform_company_id,
+                    payload={"platform_file_id": 5, "file_text": "v2"}
+                ))
+                bulk = await crud.ingest_job.create_async(db, obj_in=schemas.ingest_job.IngestJobCreate(
+                    kind="openai_file_bulk", platform_company_id=platform_company_id,
+                    payload={"files": [{"platform_file_id": 6, "file_text": "v2"}]}
+                ))
+            try:
+                async with AsyncSessionLocal() as db:
+                    found = [
+                        await crud.ingest_job.has_pending_for_file_async(
+                            db, platform_company_id=platform_company_id, platform_file_id=platform_file_id
+                        )
+                        for platform_file_id in (5, 6, 7)
+                    ]
+                    await crud.ingest_job.update_progress_async(db, job_id=single.id, status="succeeded")
+                    found.append(await crud.ingest_job.has_pending_for_file_async(
+                        db, platform_company_id=platform_company_id, platform_file_id=5
+                    ))
+                return found
+            finally:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(delete(IngestJob).where(IngestJob.id.in_([single.id, bulk.id])))
+                    await db.commit()
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(scenario()) == [True, True, False, False]
@@ -0,0 +1,86 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.core import memory_index
+from app.core.config import settings
+
+_COMPANY_ID = 42
+_DIM = 8
+
+
+class _FakeChunks:
+    """Закоммиченные строки chunks одной компании: {id: вектор}."""
+
+    def __init__(self):
+        self.rows = {}
+
+    def commit(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            self.rows[chunk_id] = np.eye(_DIM, dtype=np.float32)[chunk_id % _DIM] + chunk_id * 1e-3
+
+    async def fetch_chunk_ids(self, platform_company_id, after_id):
+        return np.asarray(sorted(chunk_id for chunk_id in self.rows if chunk_id > after_id), dtype=np.int64)
+
+    async def fetch_rows(self, platform_company_id, chunk_ids):
+        ids = np.asarray([chunk_id for chunk_id in chunk_ids if chunk_id in self.rows], dtype=np.int64)
+        if not len(ids):
+            return None, None
+        vectors = np.stack([self.rows[chunk_id] for chunk_id in ids])
+        return ids, vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def chunks(monkeypatch, tmp_path):
+    fake = _FakeChunks()
+    monkeypatch.setattr(settings, "MEMORY_INDEX_COMPANIES", str(_COMPANY_ID))
+    monkeypatch.setattr(settings, "MEMORY_INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "EMBEDDING_DIMENSIONS", _DIM)
+    monkeypatch.setattr(memory_index, "_indexes", {})
+    monkeypatch.setattr(memory_index, "_fetch_chunk_ids", fake.fetch_chunk_ids)
+    monkeypatch.setattr(memory_index, "_fetch_rows", fake.fetch_rows)
+    return fake
+
+
+def _indexed_ids():
+    index = memory_index.get_index(_COMPANY_ID)
+    return sorted(index.indexed_ids(index.read_meta()).tolist())
+
+
+def test_refresh_picks_up_batch_committed_out_of_id_order(chunks):
+    # ID обоих пакетов выделены заранее, но пакет с большими ID закоммичен первым
+    chunks.commit([11, 12, 13])
+    assert asyncio.run(memory_index.refresh_company(_COMPANY_ID)) == 3
+
+    chunks.commit([4, 5, 6])
+    assert asyncio.run(memory_index.refresh_company(_COMPANY_ID)) == 3
+    assert _indexed_ids() == [4, 5, 6, 11, 12, 13]
+
+    query = chunks.rows[5].tolist()
+    assert asyncio.run(memory_index.search(_COMPANY_ID, query, 1)) == [5]
+    # Повторное обновление не дублирует строки
+    assert asyncio.run(memory_index.refresh_company(_COMPANY_ID)) == 0
+
+
+def test_reconcile_picks_up_rows_outside_rescan_window(chunks, monkeypatch):
+    monkeypatch.setattr(settings, "MEMORY_INDEX_RESCAN_IDS", 2)
+    chunks.commit([100, 101])
+    asyncio.run(memory_index.refresh_company(_COMPANY_ID))
+
+    chunks.commit([3])
+    assert asyncio.run(memory_index.refresh_company(_COMPANY_ID)) == 0
+
+    monkeypatch.setattr(settings, "MEMORY_INDEX_RECONCILE_INTERVAL", 0)
+    assert asyncio.run(memory_index.refresh_company(_COMPANY_ID)) == 1
+    assert _indexed_ids() == [3, 100, 101]
+
+
+def test_removed_late_chunk_is_excluded_from_search(chunks):
+    chunks.commit([20, 21])
+    chunks.commit([7])
+    asyncio.run(memory_index.refresh_company(_COMPANY_ID))
+
+    del chunks.rows[7]
+    asyncio.run(memory_index.remove_chunks(_COMPANY_ID, [7]))
+    assert 7 not in asyncio.run(memory_index.search(_COMPANY_ID, np.eye(_DIM)[7].tolist(), 3))
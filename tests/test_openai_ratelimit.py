@@ -0,0 +1,104 @@
+import httpx
+import openai
+import pytest
+
+from app.core.config import settings
+from app.utils import openai_ratelimit
+from app.utils.openai_ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, RateLimitScheduler
+
+_MODEL = "text-embedding-3-small"
+
+
+class _FakeClock:
+    """Подменяет модуль time в openai_ratelimit: время идет только по advance()."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = _FakeClock()
+    monkeypatch.setattr(openai_ratelimit, "time", fake)
+    monkeypatch.setattr(settings, "OPENAI_DEFAULT_RPM", 60)
+    monkeypatch.setattr(settings, "OPENAI_DEFAULT_TPM", 6000)
+    monkeypatch.setattr(settings, "OPENAI_INTERACTIVE_RESERVE", 0.2)
+    monkeypatch.setattr(settings, "OPENAI_BACKGROUND_CONCURRENCY", 16)
+    return fake
+
+
+@pytest.fixture
+def scheduler(clock, monkeypatch):
+    fresh = RateLimitScheduler()
+    monkeypatch.setattr(openai_ratelimit, "scheduler", fresh)
+    return fresh
+
+
+def test_bucket_refills_at_limit_rate(clock):
+    bucket = openai_ratelimit._Bucket(6000)
+    bucket.take(6000)
+    # 6000 токенов в минуту — 100 в секунду
+    assert bucket.wait_time(1000, 0.0, clock.now) == pytest.approx(10.0)
+    clock.advance(4.0)
+    assert bucket.wait_time(1000, 0.0, clock.now) == pytest.approx(6.0)
+    clock.advance(600.0)
+    assert bucket.wait_time(1000, 0.0, clock.now) == 0.0
+    assert bucket.level == 6000
+
+
+def test_background_leaves_reserve_for_interactive(scheduler):
+    # 4000 из 6000 токенов заняты: 2000 свободны, но 1200 (20%) — резерв интерактивных
+    assert scheduler._try_acquire(_MODEL, 4000, PRIORITY_INTERACTIVE) == 0.0
+    assert scheduler._try_acquire(_MODEL, 1000, PRIORITY_BACKGROUND) > 0
+    assert scheduler._try_acquire(_MODEL, 1000, PRIORITY_INTERACTIVE) == 0.0
+
+
+def test_background_call_larger_than_capacity_is_admitted(scheduler, clock):
+    assert scheduler._try_acquire(_MODEL, 3000, PRIORITY_INTERACTIVE) == 0.0
+    # Потребность с резервом не превышает емкость: запрос дожидается полной корзины, а не вечно
+    assert scheduler._try_acquire(_MODEL, 10 ** 6, PRIORITY_BACKGROUND) == pytest.approx(30.0)
+    clock.advance(30.0)
+    assert scheduler._try_acquire(_MODEL, 10 ** 6, PRIORITY_BACKGROUND) == 0.0
+
+
+def test_waiting_interactive_call_holds_back_only_its_model(scheduler):
+    scheduler._model_limits(_MODEL).interactive_waiting += 1
+    assert scheduler._try_acquire(_MODEL, 10, PRIORITY_BACKGROUND) > 0
+    assert scheduler._try_acquire("gpt-4o-mini", 10, PRIORITY_BACKGROUND) == 0.0
+
+
+def test_headers_sync_limits(scheduler):
+    scheduler.update(_MODEL, {
+        "x-ratelimit-limit-requests": "3000", "x-ratelimit-remaining-requests": "2999",
+        "x-ratelimit-limit-tokens": "1000000", "x-ratelimit-remaining-tokens": "10",
+    })
+    limits = scheduler.stats()["models"][_MODEL]
+    assert limits["requests_per_minute"] == 3000
+    assert limits["tokens_per_minute"] == 1000000
+    # Уровень не превышает остатка, который видит сервер
+    assert limits["tokens_available"] == 10
+    assert scheduler._try_acquire(_MODEL, 1000, PRIORITY_INTERACTIVE) == pytest.approx(990 * 60 / 1000000)
+
+
+def test_rate_limit_error_pauses_model(scheduler, clock, monkeypatch):
+    monkeypatch.setattr(settings, "OPENAI_RETRY_ATTEMPTS", 3)
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(429, headers={"retry-after-ms": "1500"}, request=request)
+    error = openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+    assert scheduler._try_acquire(_MODEL, 10, PRIORITY_BACKGROUND) == 0.0
+    assert openai_ratelimit._on_error(error, model=_MODEL, priority=PRIORITY_BACKGROUND, attempt=0) == 1.5
+    # Пауза действует на все запросы модели, фоновый параллелизм уменьшен вдвое
+    assert scheduler._try_acquire(_MODEL, 10, PRIORITY_INTERACTIVE) == pytest.approx(1.5)
+    assert scheduler.stats()["background_concurrency_limit"] == 8
+    clock.advance(1.5)
+    assert scheduler._try_acquire(_MODEL, 10, PRIORITY_INTERACTIVE) == 0.0
+
+    with pytest.raises(openai.RateLimitError):
+        openai_ratelimit._on_error(error, model=_MODEL, priority=PRIORITY_INTERACTIVE, attempt=3)
@@ -0,0 +1,111 @@
+import asyncio
+import random
+import struct
+
+from sqlalchemy import text
+
+from app import crud, schemas
+from app.core import partitions
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, async_engine
+from app.utils import pg_copy
+
+# Значения, точно представимые и в float4, и в float2 (halfvec)
+_VALUES = [0.5, -0.25, 1.0]
+
+
+def _embedding(seed: int):
+    return [((i + seed) % 8 - 4) / 8 for i in range(settings.EMBEDDING_DIMENSIONS)]
+
+
+def test_vector_framing():
+    assert pg_copy.encode_vector(_VALUES) == struct.pack(">HH3f", 3, 0, *_VALUES)
+    assert pg_copy.encode_halfvec(_VALUES) == struct.pack(">HH3e", 3, 0, *_VALUES)
+    assert len(pg_copy.encode_halfvec(_VALUES)) == 4 + 2 * len(_VALUES)
+
+
+def test_copy_stream_layout():
+    stream = b"".join(pg_copy.encode_copy_binary([(7, None, "ё")], ["int8", "vector", "text"], rows_per_block=1))
+    assert stream.startswith(b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0))
+    body = stream[19:]
+    assert body == (
+        struct.pack(">h", 3)
+        + struct.pack(">iq", 8, 7)
+        + struct.pack(">i", -1)
+        + struct.pack(">i", 2) + "ё".encode("utf-8")
+        + struct.pack(">h", -1)
+    )
+
+
+def test_copy_roundtrip_through_pgvector(test_db):
+    """COPY (FORMAT binary) пишет vector, halfvec и NULL так, как их читает pgvector."""
+    rows = [(1, _VALUES, _VALUES, "первый"), (2, None, None, None)]
+
+    async def scenario():
+        try:
+            async with async_engine.connect() as conn:
+                await conn.execute(text(
+                    "CREATE TEMP TABLE copy_roundtrip (id int8, v vector(3), h halfvec(3), t text)"
+                ))
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.copy_to_table(
+                    "copy_roundtrip",
+                    source=pg_copy.iterate_async(pg_copy.encode_copy_binary(rows, ["int8", "vector", "halfvec", "text"])),
+                    columns=["id", "v", "h", "t"],
+                    format="binary"
+                )
+                return (await conn.execute(text(
+                    "SELECT id, v::real[] AS v, h::vector::real[] AS h, t FROM copy_roundtrip ORDER BY id"
+                ))).all()
+        finally:
+            await async_engine.dispose()
+
+    result = asyncio.run(scenario())
+    assert [tuple(row) for row in result] == [(1, _VALUES, _VALUES, "первый"), (2, None, None, None)]
+
+
+def test_copy_multi_preallocates_ids(test_db):
+    platform_company_id = random.randint(10 ** 6, 10 ** 9)
+
+    async def scenario():
+        try:
+            await partitions.ensure_company_partition(platform_company_id)
+            async with AsyncSessionLocal() as db:
+                file_id = (await db.execute(
+                    text("INSERT INTO files2 (text, platform_company_id) VALUES ('doc', :company_id) RETURNING id"),
+                    {"company_id": platform_company_id}
+                )).scalar()
+                await db.commit()
+            try:
+                objs_in = [
+                    schemas.chunk.ChunkCreate(
+                        text=f"чанк {index}", index=index, file_id=file_id, platform_company_id=platform_company_id,
+                        embedding=_embedding(index) if index != 1 else None
+                    )
+                    for index in range(3)
+                ]
+                async with AsyncSessionLocal() as db:
+                    ids = await crud.chunk.copy_multi_async(db, objs_in=objs_in)
+                async with AsyncSessionLocal() as db:
+                    rows = (await db.execute(
+                        text("""
+                            SELECT id, text, index, embedding::vector::real[] AS embedding, embedding_id
+                            FROM chunks WHERE platform_company_id = :company_id ORDER BY index
+                        """),
+                        {"company_id": platform_company_id}
+                    )).all()
+                return ids, rows
+            finally:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(text("DELETE FROM chunks WHERE platform_company_id = :company_id"), {"company_id": platform_company_id})
+                    await db.execute(text("DELETE FROM files2 WHERE id = :file_id"), {"file_id": file_id})
+                    await db.commit()
+        finally:
+            await async_engine.dispose()
+
+    ids, rows = asyncio.run(scenario())
+    assert len(set(ids)) == 3
+    assert [row.id for row in rows] == ids
+    assert [row.text for row in rows] == ["чанк 0", "чанк 1", "чанк 2"]
+    assert [row.embedding for row in rows] == [_embedding(0), None, _embedding(2)]
+    assert all(row.embedding_id is None for row in rows)
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import crud, schemas
+from app.core import vector_index
+from app.core.config import settings
+from app.routes.endpoints import search
+
+
+def _request(**fields) -> schemas.request.SearchRequest:
+    return schemas.request.SearchRequest(**{"platform_company_id": 7, "query_text": "договор аренды", **fields})
+
+
+class _RecordingSession:
+    """AsyncSession, которая запоминает выполненные запросы и возвращает пустой результат."""
+
+    def __init__(self):
+        self.statements = []
+
+    async def execute(self, statement, params=None):
+        self.statements.append((str(statement), params or {}))
+        return self
+
+    def mappings(self):
+        return self
+
+    def all(self):
+        return []
+
+
+def test_cursor_roundtrip():
+    query_hash = search._query_hash(_request())
+    cursor = search._encode_cursor(0.125, 42, query_hash)
+    assert search._decode_cursor(cursor, query_hash) == (0.125, 42)
+    assert search._decode_cursor(None, query_hash) is None
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", "W10=", "WyJ4IiwgMSwgImFiYyJd"])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        search._decode_cursor(cursor, "abc")
+    assert error.value.status_code == 422
+
+
+def test_cursor_of_another_query_is_rejected():
+    cursor = search._encode_cursor(0.125, 42, search._query_hash(_request()))
+    for other in (_request(query_text="другой запрос"), _request(file_ids=[1]), _request(max_distance=0.5)):
+        with pytest.raises(HTTPException) as error:
+            search._decode_cursor(cursor, search._query_hash(other))
+        assert error.value.status_code == 422
+    # Размер страницы порядок результатов не меняет
+    assert search._decode_cursor(cursor, search._query_hash(_request(top_k=50))) == (0.125, 42)
+
+
+def test_paging_query_starts_strictly_after_cursor():
+    query, params = crud.chunk._similar_chunks_query(
+        query_embedding=[0.1, 0.2], platform_company_id=7, file_ids=None, limit=11,
+        with_embedding=False, after=(0.125, 42)
+    )
+    sql = " ".join(str(query).split())
+    assert ", id) > (:after_distance, :after_id)" in sql
+    assert sql.endswith("ORDER BY distance, id")
+    assert (params["after_distance"], params["after_id"]) == (0.125, 42)
+
+
+def _config(params):
+    """Параметры set_config(:name_i, :value_i) как словарь."""
+    return {params[f"name_{i}"]: params[f"value_{i}"] for i in range(len(params) // 2)}
+
+
+def _search_page(after):
+    db = _RecordingSession()
+    asyncio.run(crud.chunk.search_chunks_async(db, query_embedding=[0.1, 0.2], platform_company_id=7, limit=11, after=after))
+    return db.statements
+
+
+def test_cursor_pages_use_strict_order(monkeypatch):
+    monkeypatch.setattr(vector_index, "_pgvector_version", (0, 8, 0))
+    monkeypatch.setattr(settings, "VECTOR_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(settings, "VECTOR_SEARCH_STRATEGY", "ann")
+    monkeypatch.setattr(settings, "VECTOR_ITERATIVE_SCAN", "relaxed_order")
+    (_, config_params), _ = _search_page(after=(0.125, 42))
+    assert _config(config_params)["hnsw.iterative_scan"] == "strict_order"
+
+
+def test_cursor_pages_fall_back_to_exact_without_iterative_scan(monkeypatch):
+    monkeypatch.setattr(vector_index, "_pgvector_version", (0, 7, 4))
+    monkeypatch.setattr(settings, "VECTOR_INDEX_TYPE", "hnsw")
+    monkeypatch.setattr(settings, "VECTOR_SEARCH_STRATEGY", "ann")
+    (_, config_params), (sql, _) = _search_page(after=(0.125, 42))
+    assert _config(config_params) == {"enable_indexscan": "off"}
+    assert "ORDER BY embedding <=>" in sql
+
+    # Первая страница по-прежнему использует ANN индекс
+    (_, config_params), _ = _search_page(after=None)
+    assert "enable_indexscan" not in _config(config_params)
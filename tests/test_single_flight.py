@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.utils.single_flight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", True)
+
+
+def test_concurrent_identical_calls_share_one_call():
+    group = SingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return f"value {key}"
+
+    async def scenario():
+        return await asyncio.gather(
+            group.do("a", lambda: fetch("a")),
+            group.do("a", lambda: fetch("a")),
+            group.do("b", lambda: fetch("b")),
+        )
+
+    assert asyncio.run(scenario()) == ["value a", "value a", "value b"]
+    assert sorted(calls) == ["a", "b"]
+    assert group.stats() == {"enabled": True, "in_flight": 0, "started": 2, "shared": 1}
+
+
+def test_shared_call_exception_reaches_every_waiter():
+    group = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def scenario():
+        return await asyncio.gather(group.do("a", fail), group.do("a", fail), return_exceptions=True)
+
+    first, second = asyncio.run(scenario())
+    assert isinstance(first, RuntimeError) and first is second
+    assert group.stats()["in_flight"] == 0
+
+
+def test_cancelling_one_waiter_keeps_shared_call_running():
+    group = SingleFlight()
+    release = None
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "value"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.create_task(group.do("a", fetch))
+        second = asyncio.create_task(group.do("a", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(scenario()) == "value"
+    assert calls == 1
+    assert group.stats()["in_flight"] == 0
+
+
+def test_disabled_calls_run_independently(monkeypatch):
+    monkeypatch.setattr(settings, "SINGLE_FLIGHT_ENABLED", False)
+    group = SingleFlight()
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return calls
+
+    async def scenario():
+        return await asyncio.gather(group.do("a", fetch), group.do("a", fetch))
+
+    asyncio.run(scenario())
+    assert calls == 2